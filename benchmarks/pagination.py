@@ -0,0 +1,92 @@
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+# Measures how long it takes to go through a big listing of findings with each kind of pagination, against a local
+# fake DefectDojo that answers each page after a fixed latency. Fails (exit code 1) if walking the keyset shards in
+# parallel isn't faster than plain keyset pagination. Usage: python benchmarks/pagination.py [--findings N]
+# [--latency_ms MS] [--workers N]
+
+# Fake findings endpoint, supporting the parameters used by the pagers (limit, offset, ordering, id__gt, id__lte)
+class FakeDefectDojo(BaseHTTPRequestHandler):
+    findings = list()
+    latency = 0.05
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        findings = self.findings
+        if 'id__gt' in params:
+            findings = [finding for finding in findings if finding['id'] > int(params['id__gt'])]
+        if 'id__lte' in params:
+            findings = [finding for finding in findings if finding['id'] <= int(params['id__lte'])]
+        if params.get('ordering') == '-id':
+            findings = findings[::-1]
+        limit = int(params.get('limit', 100))
+        offset = int(params.get('offset', 0))
+        next_url = None
+        if offset + limit < len(findings):
+            next_url = 'http://'+self.headers['Host']+url.path+'?'+urlencode(dict(params, offset=offset + limit))
+        time.sleep(self.latency)
+        body = json.dumps({'count': len(findings), 'next': next_url, 'previous': None,
+                           'results': findings[offset:offset + limit]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def time_pages(pages):
+    start = time.perf_counter()
+    ids = list()
+    for response, json_out in pages:
+        ids.extend(finding['id'] for finding in json_out['results'])
+    return (time.perf_counter() - start) * 1000, ids
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pagination of findings listings')
+    parser.add_argument('--findings', help='Findings listed', type=int, default=5000)
+    parser.add_argument('--latency_ms', help='Time the fake server takes to answer a page', type=float, default=50)
+    parser.add_argument('--workers', help='Parallel requests', type=int, default=4)
+    args = parser.parse_args()
+
+    from defectdojo_cli.util import Util
+    FakeDefectDojo.findings = [{'id': i, 'title': 'Finding '+str(i), 'severity': 'High'}
+                               for i in range(1, args.findings + 1)]
+    FakeDefectDojo.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeDefectDojo)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:'+str(server.server_address[1])+'/api/v2/findings/'
+
+    listings = [
+        ('offset', lambda: Util().request_apiv2_pages(url, 'key')),
+        ('offset --parallel', lambda: Util().request_apiv2_pages_parallel(url, 'key', workers=args.workers)),
+        ('keyset', lambda: Util().request_apiv2_pages_keyset(url, 'key')),
+        ('keyset --parallel', lambda: Util().request_apiv2_pages_keyset_parallel(url, 'key', workers=args.workers)),
+    ]
+    durations = dict()
+    failed = False
+    for name, pages in listings:
+        durations[name], ids = time_pages(pages())
+        status = 'OK'
+        if ids != list(range(1, args.findings + 1)):
+            status = 'WRONG RESULTS'
+            failed = True
+        print('%-20s %8.0f ms  %s' % (name, durations[name], status))
+    # The shards should be walked at the same time, not one after the other
+    if durations['keyset --parallel'] > durations['keyset'] * 0.75:
+        print('keyset --parallel isn\'t faster than keyset', file=sys.stderr)
+        failed = True
+    server.shutdown()
+    exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
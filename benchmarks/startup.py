@@ -0,0 +1,91 @@
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import time
+
+# Measures the startup time of the CLI and fails (exit code 1) if it's slower than a threshold, or if modules that
+# are slow to import are imported when they aren't needed. Usage: python benchmarks/startup.py [--runs N] [--max_ms MS]
+
+# Commands that shouldn't need more than the standard library to run
+COMMANDS = [
+    ['--version'],
+    ['--help'],
+    ['findings', '--help'],
+    ['findings', 'close', '--help'],
+]
+# Modules that shouldn't be imported by the commands above
+SLOW_MODULES = ['pkg_resources', 'unittest.mock', 'requests', 'urllib3', 'tabulate', 'asyncio']
+
+# Runs the CLI in the same process and prints the modules it imported (argparse exits with SystemExit)
+LOADED_MODULES_SCRIPT = '''
+import sys, json, runpy
+sys.argv = ['defectdojo'] + json.loads(sys.argv[1])
+try:
+    runpy.run_module('defectdojo_cli', run_name='__main__')
+except SystemExit:
+    pass
+sys.stdout = sys.__stdout__
+print(json.dumps(sorted(sys.modules)))
+'''
+
+def time_command(command, runs):
+    durations = list()
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'defectdojo_cli'] + command,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+# Modules imported by a command, or None if it crashed
+def loaded_modules(command):
+    process = subprocess.run([sys.executable, '-c', LOADED_MODULES_SCRIPT, json.dumps(command)],
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False)
+    # The help is printed before the modules, so only the last line is used
+    lines = process.stdout.decode().strip().splitlines()
+    if process.returncode != 0 or not lines:
+        return None
+    try:
+        return json.loads(lines[-1])
+    except ValueError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup time of the CLI')
+    parser.add_argument('--runs', help='Times each command is run (the median is used)', type=int, default=10)
+    parser.add_argument('--max_ms', help='Fail if the median startup time of a command is higher than this',
+                        type=float, default=150)
+    args = parser.parse_args()
+
+    # Startup time of the interpreter alone, to tell apart the time spent by the CLI
+    baseline = statistics.median(
+        [time_command_baseline() for _ in range(args.runs)]
+    )
+    print('python startup: %.0f ms' % baseline)
+    failed = False
+    for command in COMMANDS:
+        duration = time_command(command, args.runs)
+        modules = loaded_modules(command)
+        slow_modules = [module for module in SLOW_MODULES if module in (modules or [])]
+        status = 'OK'
+        if duration > args.max_ms:
+            status = 'SLOW (max %.0f ms)' % args.max_ms
+            failed = True
+        if slow_modules:
+            status = 'IMPORTS '+', '.join(slow_modules)
+            failed = True
+        if modules is None:
+            status = 'CRASHED'
+            failed = True
+        print('%-30s %6.0f ms (+%.0f ms)  %s' % (' '.join(command), duration, duration - baseline, status))
+    exit(1 if failed else 0)
+
+def time_command_baseline():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=False)
+    return (time.perf_counter() - start) * 1000
+
+if __name__ == '__main__':
+    main()
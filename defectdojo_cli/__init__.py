@@ -1,7 +1,46 @@
-from .util import Util
-from .findings import Findings
-from .engagements import Engagements
-from .tests import Tests
-import pkg_resources  # part of setuptools
+import importlib
 
-__version__ = pkg_resources.get_distribution("defectdojo_cli").version
+# The classes are imported only when they're first used (PEP 562), so importing the package (e.g. to print the
+# version or the help of a command) doesn't import requests and the other modules of every command
+_lazy_imports = {
+    'Util': 'util',
+    'PagedResponse': 'util',
+    'AsyncClient': 'util',
+    'Findings': 'findings',
+    'Engagements': 'engagements',
+    'Tests': 'tests',
+    'Cache': 'cache',
+    'Mirror': 'mirror',
+}
+
+__all__ = list(_lazy_imports) + ['__version__']
+
+# Version of the installed package, or 'unknown' when it isn't installed (e.g. when it's run from a source checkout)
+def get_version():
+    # importlib.metadata is much faster to import than pkg_resources (only available on python 3.8+)
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        import pkg_resources  # part of setuptools
+        try:
+            return pkg_resources.get_distribution('defectdojo_cli').version
+        except pkg_resources.DistributionNotFound:
+            return 'unknown'
+    try:
+        return version('defectdojo_cli')
+    except PackageNotFoundError:
+        return 'unknown'
+
+def __getattr__(name):
+    if name == '__version__':
+        return get_version()
+    if name in _lazy_imports:
+        module = importlib.import_module('.'+_lazy_imports[name], __name__)
+        value = getattr(module, name)
+        # Cache it, so __getattr__ isn't called again for this name
+        globals()[name] = value
+        return value
+    raise AttributeError('module '+repr(__name__)+' has no attribute '+repr(name))
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
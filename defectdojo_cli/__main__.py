@@ -1,9 +1,15 @@
 import sys
 import argparse
-from defectdojo_cli import Findings
-from defectdojo_cli import Engagements
-from defectdojo_cli import Tests
-from defectdojo_cli import __version__
+
+# Prints the version and exits. It's only looked up when the option is used, as reading it takes some time
+class VersionAction(argparse.Action):
+    def __init__(self, option_strings, dest=argparse.SUPPRESS, default=argparse.SUPPRESS, help=None):
+        super().__init__(option_strings=option_strings, dest=dest, default=default, nargs=0,
+                         help='show program\'s version number and exit')
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        from defectdojo_cli import get_version
+        parser.exit(message=parser.prog+'_cli v'+get_version()+'\n')
 
 # Multilevel argparse based on https://chase-seibert.github.io/blog/2014/03/21/python-multilevel-argparse.html
 class DefectDojoCLI(object):
@@ -16,9 +22,13 @@ class DefectDojoCLI(object):
             findings        Operations related to findings (findings --help for more details)
             engagements     Operations related to engagements (engagements --help for more details)
             tests           Operations related to tests (tests --help for more details)
+            cache           Operations related to the local cache (cache --help for more details)
+
+    Any command accepts --trace FILE to record the requests it makes (as Chrome trace events)
+    and print a summary of them on stderr
         ''')
         parser.add_argument('command', help='Command to run')
-        parser.add_argument('-v', '--version', action='version', version='%(prog)s_cli v' + __version__)
+        parser.add_argument('-v', '--version', action=VersionAction)
         # Parse_args defaults to [1:] for args, but you need to
         # exclude the rest of the args too, or validation will fail
         args = parser.parse_args(sys.argv[1:2])
@@ -29,16 +39,33 @@ class DefectDojoCLI(object):
         # Use dispatch pattern to invoke method with same name (that starts with _)
         getattr(self, '_'+args.command)()
 
+    # The module of each command is only imported when it's invoked, to keep the startup fast
     def _findings(self):
+        from defectdojo_cli.findings import Findings
         Findings().parse_cli_args()
 
     def _engagements(self):
+        from defectdojo_cli.engagements import Engagements
         Engagements().parse_cli_args()
 
     def _tests(self):
+        from defectdojo_cli.tests import Tests
         Tests().parse_cli_args()
 
+    def _cache(self):
+        from defectdojo_cli.cache import Cache
+        Cache().parse_cli_args()
+
 def main():
+    # --trace FILE can be passed anywhere in the command line. It's taken out of it here, so the parsers of the
+    # commands don't have to know about it
+    trace_parser = argparse.ArgumentParser(prog='defectdojo', add_help=False, allow_abbrev=False)
+    trace_parser.add_argument('--trace', metavar='FILE')
+    args, other_args = trace_parser.parse_known_args(sys.argv[1:])
+    sys.argv[1:] = other_args
+    if args.trace is not None:
+        from defectdojo_cli.trace import Tracer
+        Tracer.start(args.trace, subcommand=' '.join(sys.argv[1:3]))
     DefectDojoCLI().parse_cli_args()
 
 if __name__ == '__main__':
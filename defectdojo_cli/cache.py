@@ -0,0 +1,184 @@
+import json
+import os
+import sys
+import time
+import hashlib
+import argparse
+import threading
+from defectdojo_cli.util import Util, UsageError
+
+# On-disk cache of DefectDojo tables that rarely change (e.g. test types), so resolving
+# their names to IDs doesn't need a request every time. There's one file per DefectDojo URL
+class Cache(object):
+    # Tables that can be cached and their API endpoints
+    TABLES = {
+        'test_types': '/test_types/',
+        'development_environments': '/development_environments/',
+    }
+    # Settings (can be changed with the DEFECTDOJO_CACHE, DEFECTDOJO_CACHE_TTL and DEFECTDOJO_CACHE_DIR environment variables)
+    enabled = os.environ.get('DEFECTDOJO_CACHE', 'true').lower() == 'true'
+    ttl = int(os.environ.get('DEFECTDOJO_CACHE_TTL', 24 * 60 * 60)) # In seconds
+    directory = os.environ.get(
+        'DEFECTDOJO_CACHE_DIR',
+        os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'defectdojo_cli')
+    )
+    # Tables already loaded by this process, indexed by (url, table)
+    _memory = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, url=None, api_key=None):
+        self.url = url
+        self.api_key = api_key
+
+    def parse_cli_args(self):
+        parser = argparse.ArgumentParser(
+            description='Perform <sub_command> related to the local cache of DefectDojo data',
+            usage='''defectdojo cache <sub_command> [<args>]
+
+    You can use the following sub_commands:
+        clear           Clear the cached data
+''')
+        parser.add_argument('sub_command', help='Sub_command to run')
+        # Get sub_command
+        args = parser.parse_args(sys.argv[2:3])
+        if not hasattr(self, '_'+args.sub_command):
+            print('Unrecognized sub_command')
+            parser.print_help()
+            exit(1)
+        # Use dispatch pattern to invoke method with same name (that starts with _)
+        getattr(self, '_'+args.sub_command)()
+
+    def cache_file(self):
+        url_hash = hashlib.sha256(self.url.rstrip('/').encode()).hexdigest()[:16]
+        return os.path.join(self.directory, url_hash+'.json')
+
+    def read_file(self):
+        try:
+            with open(self.cache_file()) as file:
+                return json.load(file)
+        except (OSError, ValueError): # Missing or corrupted file
+            return {'url': self.url, 'tables': dict()}
+
+    def write_file(self, cache_out):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write to a temporary file first so other processes never read a partial file
+            tmp_file = self.cache_file()+'.'+str(os.getpid())+'.tmp'
+            with open(tmp_file, 'w') as file:
+                json.dump(cache_out, file)
+            os.replace(tmp_file, self.cache_file())
+        except OSError: # The cache is only an optimization, so don't fail if it can't be written
+            pass
+
+    def fetch_table(self, table):
+        # Get the whole table from the API, indexing its IDs by name
+        index = dict()
+        pages = Util().request_apiv2_pages(self.url+'/api/v2'+self.TABLES[table], self.api_key)
+        for response, json_out in pages:
+            if json_out is None:
+                raise Exception('Failed to get '+table+' ('+str(response.status_code)+'): '+response.text)
+            for result in json_out['results']:
+                index[result['name']] = result['id']
+        return index
+
+    # Get a table as a {name: id} dict, from memory, from disk (if it's not older than the TTL) or from the API
+    def get_table(self, table, refresh=False):
+        key = (self.url, table)
+        with self._lock:
+            if not refresh and key in self._memory:
+                return self._memory[key]['index']
+            cache_out = self.read_file() if self.enabled else {'url': self.url, 'tables': dict()}
+            cached_table = cache_out['tables'].get(table)
+            if not refresh and cached_table and time.time() - cached_table['fetched_at'] < self.ttl:
+                self._memory[key] = {'index': cached_table['index'], 'fetched': False}
+                return cached_table['index']
+            index = self.fetch_table(table)
+            self._memory[key] = {'index': index, 'fetched': True}
+            if self.enabled:
+                cache_out['tables'][table] = {'fetched_at': time.time(), 'index': index}
+                self.write_file(cache_out)
+            return index
+
+    # Get the ID of a name from a table. If the name isn't in the cached table, the table is fetched again
+    # (in case it was created after the table was cached). Raises KeyError if the name doesn't exist
+    def get_id(self, table, name):
+        index = self.get_table(table)
+        if name not in index and not self._memory[(self.url, table)]['fetched']:
+            index = self.get_table(table, refresh=True)
+        return index[name]
+
+    # Same as get_id, but for several names at once (the table is fetched again at most once). Raises an
+    # exception with all the names that don't exist
+    def get_ids(self, table, names):
+        index = self.get_table(table)
+        missing = [name for name in names if name not in index]
+        if missing and not self._memory[(self.url, table)]['fetched']:
+            index = self.get_table(table, refresh=True)
+            missing = [name for name in names if name not in index]
+        if missing:
+            raise UsageError('Unknown '+table.replace('_', ' ')+': '+', '.join(sorted(set(missing))))
+        return [index[name] for name in names]
+
+    # Get something learned about the server (e.g. that it doesn't accept compressed uploads), or None if it
+    # wasn't learned or it's older than the TTL
+    def get_setting(self, name):
+        if not self.enabled:
+            return None
+        with self._lock:
+            setting = self.read_file().get('settings', dict()).get(name)
+        if setting is None or time.time() - setting['learned_at'] >= self.ttl:
+            return None
+        return setting['value']
+
+    def set_setting(self, name, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            cache_out = self.read_file()
+            cache_out.setdefault('settings', dict())[name] = {'learned_at': time.time(), 'value': value}
+            self.write_file(cache_out)
+
+    # Remove cached tables (all of them if no table is passed)
+    def invalidate(self, table=None):
+        with self._lock:
+            for key in list(self._memory):
+                if key[0] == self.url and (table is None or key[1] == table):
+                    del self._memory[key]
+            cache_out = self.read_file()
+            if table is None:
+                cache_out['tables'] = dict()
+                cache_out.pop('settings', None)
+            else:
+                cache_out['tables'].pop(table, None)
+            self.write_file(cache_out)
+
+    def _clear(self):
+        # Read user-supplied arguments
+        parser = argparse.ArgumentParser(description='Clear the local cache of DefectDojo data',
+                                         usage='defectdojo cache clear [<args>]')
+        optional = parser._action_groups.pop()
+        optional.add_argument('--url', help='Clear only the data cached for this DefectDojo URL')
+        optional.add_argument('--table', help='Clear only this table', choices=sorted(self.TABLES))
+        parser._action_groups.append(optional)
+        # Parse out arguments ignoring the first three (because we're inside a sub_command)
+        args = vars(parser.parse_args(sys.argv[3:]))
+
+        if args['url'] is not None:
+            self.url = args['url']
+            self.invalidate(args['table'])
+        else:
+            # Clear the cache of all URLs
+            if os.path.isdir(self.directory):
+                for file_name in os.listdir(self.directory):
+                    if file_name.endswith('.json'):
+                        self.url = self.read_url(os.path.join(self.directory, file_name))
+                        if self.url is not None:
+                            self.invalidate(args['table'])
+        exit(0)
+
+    def read_url(self, file_path):
+        try:
+            with open(file_path) as file:
+                return json.load(file)['url']
+        except (OSError, ValueError, KeyError):
+            return None
@@ -2,9 +2,7 @@ from datetime import datetime
 import json
 import sys
 import argparse
-import requests
-from unittest.mock import PropertyMock
-from defectdojo_cli.util import Util
+from defectdojo_cli.util import Util, PagedResponse, AsyncClient, UsageError
 from defectdojo_cli.tests import Tests
 
 class Engagements(object):
@@ -26,7 +24,18 @@ class Engagements(object):
             parser.print_help()
             exit(1)
         # Use dispatch pattern to invoke method with same name (that starts with _)
-        getattr(self, '_'+args.sub_command)()
+        try:
+            getattr(self, '_'+args.sub_command)()
+        except UsageError as e:
+            print(str(e), file=sys.stderr)
+            exit(1)
+        except Exception as e:
+            # Requests that still failed after being retried (e.g. connection refused) are printed without a traceback
+            message = Util.request_failure(e)
+            if message is None:
+                raise
+            print(message, file=sys.stderr)
+            exit(1)
 
     def create(self, url, api_key, name, desc, product_id, lead_id,
                start_date=None, end_date=None, engagement_type=None,
@@ -178,7 +187,8 @@ class Engagements(object):
 
         # DefectDojo doesnt has an output when a engagement is successfully closed so we need to create one
         if response.status_code == 200:
-            type(response).text = PropertyMock(return_value='{"return": "sucess"}')
+            print(json.dumps({'return': 'sucess'}, indent=4))
+            exit(0)
         # Pretty print JSON response
         Util().default_output(response, sucess_status_code=200)
 
@@ -251,19 +261,31 @@ class Engagements(object):
         # Pretty print JSON response
         Util().default_output(response, sucess_status_code=200)
 
-    def list(self, url, api_key, name=None, product_id=None, **kwargs):
+    def list(self, url, api_key, name=None, product_id=None, limit=None, page_size=None, offline=False, db=None,
+             engagement_id=None, **kwargs):
         # Create parameters to be requested
         request_params = dict()
         API_URL = url+'/api/v2'
         ENGAGEMENTS_URL = API_URL+'/engagements/'
+        if engagement_id is not None:
+            request_params['id'] = engagement_id
         if name is not None:
             request_params['name'] = name
         if product_id is not None:
             request_params['product'] = product_id
+        if limit is not None:
+            request_params['limit'] = limit
 
-        # Make the request
-        response = Util().request_apiv2('GET', ENGAGEMENTS_URL, api_key, params=request_params)
-        return response
+        if offline:
+            # Answer from the local mirror instead of DefectDojo
+            from defectdojo_cli.mirror import Mirror
+            return PagedResponse(Mirror(url, path=db).query_pages('engagements', ENGAGEMENTS_URL, request_params,
+                                                                  page_size=page_size))
+
+        # Make the request (going through all the pages unless a limit was passed)
+        pages = Util().request_apiv2_pages(ENGAGEMENTS_URL, api_key, params=request_params,
+                                           page_size=page_size, follow=(limit is None))
+        return PagedResponse(pages)
 
     def _list(self):
         # Read user-supplied arguments
@@ -289,6 +311,14 @@ class Engagements(object):
             '--product_id',
             help='Product ID'
         )
+        optional.add_argument(
+            '--limit',
+            help='Number of results to return (by default it gets all the engagements)'
+        )
+        optional.add_argument('--offline', help='Answer from the local mirror (see "defectdojo findings sync") '
+                                                'instead of DefectDojo', action='store_true')
+        optional.add_argument('--db', help='Path of the SQLite database of the local mirror (default = the one '
+                                           'of the DefectDojo URL in the cache directory)')
         parser._action_groups.append(optional)
         # Parse out arguments ignoring the first three (because we're inside a sub_command)
         args = vars(parser.parse_args(sys.argv[3:]))
@@ -325,7 +355,8 @@ class Engagements(object):
 
         # DefectDojo doesnt has an output when a engagement is successfully reopened so we need to create one
         if response.status_code == 200:
-            type(response).text = PropertyMock(return_value='{"return": "sucess"}')
+            print(json.dumps({'return': 'sucess'}, indent=4))
+            exit(0)
         # Pretty print JSON response
         Util().default_output(response, sucess_status_code=200)
 
@@ -338,31 +369,26 @@ class Engagements(object):
             # Make a request to API to list all tests with the tags we're looking for
             request_params['tag'] = tags
             response = Tests().list(**request_params)
-            # Parse output
-            json_out = json.loads(response.text)
-            results = json_out['results']
             # Create set of all engagements from the response
             engagement_set = set()
-            for test in results:
+            for test in response:
                 engagement_set.add(str(test['engagement']))
             # Transform set to list
             engagement_list = list(engagement_set)
 
         elif tags_operator == 'intersect':
-            engagement_list_of_sets = list()
-            for tag in tags:
-                # Make a request to API to list all tests with the tags we're looking for
-                request_params['tag'] = tag
-                response = Tests().list(**request_params)
-                # Parse output
-                json_out = json.loads(response.text)
-                results = json_out['results']
+            def get_engagements(tag):
+                # Make a request to API to list all tests with the tag we're looking for
+                tag_params = request_params.copy()
+                tag_params['tag'] = tag
+                response = Tests().list(**tag_params)
                 # Create set of all engagements from the response
                 engagement_set = set()
-                for test in results:
+                for test in response:
                     engagement_set.add(str(test['engagement']))
-                # Add set of engagement to list
-                engagement_list_of_sets.append(engagement_set)
+                return engagement_set
+            # Get the set of engagements of each tag at the same time
+            engagement_list_of_sets = AsyncClient().map(get_engagements, tags)
 
             # Get intersection between all sets
             engagement_intersection = engagement_list_of_sets[0]
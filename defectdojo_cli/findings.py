@@ -1,14 +1,44 @@
 from datetime import datetime
 import json
 import sys
+import os
+import glob
+import time
+import threading
+import shutil
+import tempfile
 import argparse
-import requests
 import re
-from unittest.mock import PropertyMock
-from tabulate import tabulate
-from defectdojo_cli.util import Util
-from defectdojo_cli.engagements import Engagements
+import itertools
+from defectdojo_cli.util import Util, PagedResponse, AsyncClient, EmptyResponse, UsageError, SEVERITIES
+from defectdojo_cli.cache import Cache
+from defectdojo_cli.upload import MultipartEncoder, UploadProgress
+from defectdojo_cli.ledger import UploadLedger, SkippedUploadResponse
+from defectdojo_cli.reports import ScanReport
+from defectdojo_cli.table import TableRenderer, Pager
 from defectdojo_cli.tests import Tests
+from defectdojo_cli.engagements import Engagements
+
+# Largest ID of a DefectDojo object (they're stored as 32 bits integers)
+MAX_ID = 2**31 - 1
+
+# Compact record of a finding, with only the fields used when listing findings as a table or summarizing
+# their components
+class Finding(object):
+    FIELDS = ['id', 'title', 'severity', 'component_name', 'component_version', 'test']
+    __slots__ = FIELDS
+
+    def __init__(self, id, title, severity, component_name=None, component_version=None, test=None):
+        self.id = id
+        self.title = title
+        self.severity = severity
+        self.component_name = component_name
+        self.component_version = component_version
+        self.test = test
+
+    @classmethod
+    def from_json(cls, json_out):
+        return cls(*[json_out.get(field) for field in cls.FIELDS])
 
 class Findings(object):
     def parse_cli_args(self):
@@ -20,19 +50,36 @@ class Findings(object):
         import          Import findings (scan results)
         upload          Same as import (deprecated, EOL december/2021)
         reimport        Re-import findings of a test
+        import-batch    Import several scan results concurrently
         list            List findings
         update          Update a finding
         close           Close a finding
+        sync            Update a local SQLite mirror of findings, tests and engagements
+        components      Summarize the vulnerable components of the findings
+        gate            Check the severity of the findings of a scan report locally
 ''')
         parser.add_argument('sub_command', help='Sub_command to run')
         # Get sub_command
         args = parser.parse_args(sys.argv[2:3])
-        if not hasattr(self, '_'+args.sub_command):
+        # Sub_commands with dashes (e.g. import-batch) are methods with underscores
+        sub_command = args.sub_command.replace('-', '_')
+        if not hasattr(self, '_'+sub_command):
             print('Unrecognized sub_command')
             parser.print_help()
             exit(1)
         # Use dispatch pattern to invoke method with same name (that starts with _)
-        getattr(self, '_'+args.sub_command)()
+        try:
+            getattr(self, '_'+sub_command)()
+        except UsageError as e:
+            print(str(e), file=sys.stderr)
+            exit(1)
+        except Exception as e:
+            # Requests that still failed after being retried (e.g. connection refused) are printed without a traceback
+            message = Util.request_failure(e)
+            if message is None:
+                raise
+            print(message, file=sys.stderr)
+            exit(1)
 
     # Backwards compability
     def _upload(self):
@@ -42,7 +89,8 @@ class Findings(object):
                active=None, verified=None, scan_date=None, min_severity=None,
                tag_test=None, test_type=None, env=None, auto_close=None,
                skip_duplicates=None, version=None, build_id=None, branch_tag=None,
-                commit_hash=None, **kwargs):
+                commit_hash=None, progress=None, force=False, prefilter=False, include_rule=None,
+                exclude_rule=None, **kwargs):
         # Prepare JSON data to be send
         request_json = dict()
         API_URL = url+'/api/v2'
@@ -80,15 +128,89 @@ class Findings(object):
         if commit_hash is not None:
             request_json['commit_hash'] = commit_hash
 
+        # Upload the file (unless it was already imported to this engagement)
+        return self.upload_scan(url, api_key, IMPORT_SCAN_URL, 'engagement:'+str(engagement_id), request_json,
+                                result_file, progress=progress, force=force, prefilter=prefilter,
+                                include_rule=include_rule, exclude_rule=exclude_rule)
+
+    # Fields of an upload that don't change its result (they only describe the build), so they're left out of
+    # the key of the upload ledger
+    LEDGER_IGNORED_FIELDS = ['scan_date', 'version', 'build_id', 'branch_tag', 'commit_hash']
+
+    # POST a scan report to 'scan_url' streaming the file. If the same report was already uploaded successfully
+    # to 'target' with the same settings, it isn't uploaded again (unless 'force' is True) and a response
+    # with the ID of the test it was uploaded to is returned. With 'prefilter' (or rules to include/exclude
+    # findings) the findings below the minimum severity are dropped from the report before uploading it
+    def upload_scan(self, url, api_key, scan_url, target, request_json, result_file, progress=None, force=False,
+                    prefilter=False, include_rule=None, exclude_rule=None):
+        prefilter = prefilter or bool(include_rule) or bool(exclude_rule)
+        ledger = UploadLedger(url) if UploadLedger.enabled else None
+        if ledger is not None:
+            settings = dict((field, value) for field, value in request_json.items()
+                            if field not in self.LEDGER_IGNORED_FIELDS)
+            # Several reports can be uploaded to the same target (e.g. one per module), so the file name is part
+            # of the key too
+            settings['file_name'] = os.path.basename(result_file)
+            if prefilter:
+                settings['prefilter'] = {'include_rule': include_rule, 'exclude_rule': exclude_rule}
+            key = UploadLedger.upload_key(target, settings)
+            file_hash = UploadLedger.file_hash(result_file)
+            upload = ledger.get(key, file_hash)
+            if upload is not None and not force:
+                return SkippedUploadResponse(upload)
+
         # Prepare file data to be send
         files = dict()
-        files['file'] = open(result_file)
+        if prefilter:
+            files['file'] = self.prefilter_scan(request_json['scan_type'], result_file,
+                                                request_json.get('minimum_severity'), include_rule, exclude_rule)
+        else:
+            files['file'] = result_file
 
-        # Make request
-        response = Util().request_apiv2('POST', IMPORT_SCAN_URL, api_key,
-                                        files=files, data=request_json)
+        # Make request streaming the file (the encoder closes it once it's done)
+        try:
+            with MultipartEncoder(fields=request_json, files=files, callback=progress) as body:
+                response = Util().request_apiv2('POST', scan_url, api_key, data=body,
+                                                headers={'Content-Type': body.content_type})
+        finally:
+            if prefilter:
+                shutil.rmtree(os.path.dirname(files['file']), ignore_errors=True)
+
+        # Remember the upload if it worked
+        if ledger is not None and response.status_code == 201:
+            try:
+                json_out = json.loads(response.text)
+                ledger.record(key, file_hash, json_out.get('test', json_out.get('test_id')))
+            except ValueError:
+                pass
         return response
 
+    # Whether the arguments of an import/reimport ask to pre-filter the report
+    @staticmethod
+    def prefilters(args):
+        return bool(args.get('prefilter') or args.get('include_rule') or args.get('exclude_rule'))
+
+    # Fail (like argparse) if the report has to be pre-filtered but its scanner can't be read locally
+    def check_prefilter_args(self, parser, args):
+        if self.prefilters(args) and args['scanner'] not in ScanReport.SCANNERS:
+            parser.error('--prefilter, --include_rule and --exclude_rule can\'t be used with '+args['scanner']
+                         +' (supported scanners: '+', '.join(sorted(ScanReport.SCANNERS))+')')
+
+    # 'min_severity' or above that match the rules (see ScanReport), and return the path of the copy
+    def prefilter_scan(self, scanner, result_file, min_severity=None, include_rule=None, exclude_rule=None):
+        report = ScanReport(scanner, min_severity, include_rules=include_rule, exclude_rules=exclude_rule)
+        filtered_file = os.path.join(tempfile.mkdtemp(prefix='defectdojo_cli_'), os.path.basename(result_file))
+        try:
+            with open(result_file, 'rb') as source, open(filtered_file, 'wb') as output:
+                report.filter(source, output)
+        except Exception as e:
+            shutil.rmtree(os.path.dirname(filtered_file), ignore_errors=True)
+            raise UsageError('Failed to pre-filter '+result_file+': '+str(e))
+        print('Pre-filter of %s: kept %d of %d findings (%.1f MB instead of %.1f MB)' % (
+            result_file, sum(report.kept), sum(report.found), os.path.getsize(filtered_file) / 1e6,
+            os.path.getsize(result_file) / 1e6), file=sys.stderr)
+        return filtered_file
+
     def _import(self):
         # Read user-supplied arguments
         parser = argparse.ArgumentParser(description='Import findings (scan results) to DefectDojo',
@@ -122,14 +244,12 @@ class Findings(object):
                               action='store_false', dest='verified')
         optional.set_defaults(active=True, verified=False)
         optional.add_argument('--min_severity', help='Ignore findings below this severity (default = "Info")',
-                              choices=['Info', 'Low', 'Medium', 'High', 'Critical'], default='Info')
+                              choices=SEVERITIES, default='Info')
         optional.add_argument('--tag_test', help='Test tag (can be used multiple times)', action='append')
         optional.add_argument('--note',
-                              help='Add the string passed to this flag as a'
-                                   'note to each finding imported'
-                                   '(can have a big impact on performance'
-                                   'depending on the amount of findings'
-                                   'imported)')
+                              help='Add the string passed to this flag as a note to each finding imported '
+                                   '(DEFECTDOJO_CONCURRENCY notes are added at a time, the command fails if '
+                                   'any of them could not be added)')
         optional.add_argument('--auto_close',
                               help='Close all open findings from the same '
                                   +'--test_type that are not listed on '
@@ -162,9 +282,58 @@ class Findings(object):
             '--commit_hash',
             help='Commit HASH'
         )
+
+        optional.add_argument(
+            '--progress',
+            help='Print the upload progress and throughput to stderr',
+            action='store_true'
+        )
+
+        optional.add_argument(
+            '--compress',
+            help='Upload the file gzip-compressed (if the server or a reverse proxy in front of it doesn\'t '
+                 'accept "Content-Encoding: gzip" request bodies, it\'s sent again uncompressed, and so are the '
+                 'next uploads to it) and print the amount of bytes saved',
+            action='store_true'
+        )
+
+        optional.add_argument(
+            '--force',
+            help='Upload the file even if the same one was already uploaded with the same settings (by default '
+                 'the upload is skipped and the ID of the test it was uploaded to is printed)',
+            action='store_true'
+        )
+
+        optional.add_argument(
+            '--prefilter',
+            help='Drop the findings below --min_severity from the file before uploading it, instead of only on '
+                 'DefectDojo (supported scanners: '+', '.join(sorted(ScanReport.SCANNERS))+')',
+            action='store_true'
+        )
+
+        optional.add_argument(
+            '--include_rule',
+            help='Upload only the findings whose rule/vulnerability ID matches this pattern (e.g. "CVE-*"), '
+                 'implies --prefilter (can be used multiple times)',
+            action='append'
+        )
+
+        optional.add_argument(
+            '--exclude_rule',
+            help='Drop the findings whose rule/vulnerability ID matches this pattern before uploading the file, '
+                 'implies --prefilter (can be used multiple times)',
+            action='append'
+        )
         parser._action_groups.append(optional)
         # Parse out arguments ignoring the first three (because we're inside a sub-command)
         args = vars(parser.parse_args(sys.argv[3:]))
+        self.check_prefilter_args(parser, args)
+        if args['compress']:
+            Util.compress = True
+        if args['progress']:
+            args['progress'] = UploadProgress()
+        else:
+            args['progress'] = None
 
         # Import results
         response = self.import_(**args)
@@ -175,30 +344,39 @@ class Findings(object):
         except:
             out_error = True
 
-        # If --note flag was passed
-        if args['note'] is not None:
-            # Get the findings that were imported 
-            tmp_args = dict()
-            tmp_args['url'] = args['url']
-            tmp_args['api_key'] = args['api_key']
-            tmp_args['test_id'] = import_out['test'] # Get the test ID from the import output
-            tmp_response = self.list(**tmp_args)
-            imported_findings_out = json.loads(tmp_response.text)
-            # Create a list with all the imported findings IDs
-            imported_findings_ids = set()
-            for imported_finding in imported_findings_out['results']:
-                imported_findings_ids.add(imported_finding['id'])
-            # Add note to each imported finding
-            tmp_args = dict()
-            tmp_args['url'] = args['url']
-            tmp_args['api_key'] = args['api_key']
-            tmp_args['entry'] = args['note']
-            for imported_finding_id in imported_findings_ids:
-                tmp_args['finding_id'] = imported_finding_id
-                self.add_note(**tmp_args)
+        # If --note flag was passed (and the import worked)
+        note_summary = None
+        if (args['note'] is not None and not out_error and response.status_code == 201
+                and not import_out.get('skipped')):
+            # Get only the IDs of the findings that were imported (the test ID comes from the import output)
+            imported_findings = self.list(args['url'], args['api_key'], test_id=import_out['test'], fields=['id'])
+            if imported_findings.status_code != 200:
+                print(json.dumps(import_out, indent=4))
+                print('Failed to get the imported findings to add the note ('+str(imported_findings.status_code)
+                      +'): '+imported_findings.text, file=sys.stderr)
+                exit(1)
+            # Print the progress to stderr (at most twice a second) while the notes are added
+            last_print = [0]
+            def print_progress(done, failed):
+                if time.time() - last_print[0] < 0.5 and done < imported_findings.count:
+                    return
+                last_print[0] = time.time()
+                print('\rAdded notes: %d/%d (%d failed)' % (done, imported_findings.count, failed),
+                      end='', file=sys.stderr, flush=True)
+            note_summary = self.add_notes(args['url'], args['api_key'], imported_findings, args['note'],
+                                          progress=print_progress)
+            print('', file=sys.stderr)
+            for failure in note_summary['failed']:
+                print('Failed to add note to finding '+str(failure['finding_id'])+': '+failure['error'],
+                      file=sys.stderr)
+            if note_summary['error'] is not None:
+                print('Failed to get the imported findings: '+note_summary['error'], file=sys.stderr)
 
         # Pretty print JSON response
         if not out_error:
+            if note_summary is not None and (note_summary['failed'] or note_summary['error'] is not None):
+                print(json.dumps(import_out, indent=4))
+                exit(1)
             Util().default_output(response, sucess_status_code=201)
         else:
             print(response.text)
@@ -206,7 +384,7 @@ class Findings(object):
     def reimport(self, url, api_key, result_file, scanner, scan_date, test_id,
                   active=None, verified=None, min_severity=None, auto_close=None,
                   version=None, build_id=None, branch_tag=None, commit_hash=None,
-                  **kwargs):
+                  progress=None, force=False, prefilter=False, include_rule=None, exclude_rule=None, **kwargs):
         # Prepare JSON data to be send
         request_json = dict()
         API_URL = url+'/api/v2'
@@ -232,15 +410,10 @@ class Findings(object):
         if commit_hash is not None:
             request_json['commit_hash'] = commit_hash
 
-        # Prepare file data to be send
-        files = dict()
-        files['file'] = open(result_file)
-
-        # Make request
-        response = Util().request_apiv2(
-            'POST', REIMPORT_SCAN_URL, api_key, files=files, data=request_json
-        )
-        return response
+        # Upload the file (unless it was already re-imported to this test)
+        return self.upload_scan(url, api_key, REIMPORT_SCAN_URL, 'test:'+str(test_id), request_json,
+                                result_file, progress=progress, force=force, prefilter=prefilter,
+                                include_rule=include_rule, exclude_rule=exclude_rule)
 
     def _reimport(self):
         # Read user-supplied arguments
@@ -349,10 +522,59 @@ class Findings(object):
             help='Commit HASH'
         )
 
+        optional.add_argument(
+            '--progress',
+            help='Print the upload progress and throughput to stderr',
+            action='store_true'
+        )
+
+        optional.add_argument(
+            '--compress',
+            help='Upload the file gzip-compressed (if the server or a reverse proxy in front of it doesn\'t '
+                 'accept "Content-Encoding: gzip" request bodies, it\'s sent again uncompressed, and so are the '
+                 'next uploads to it) and print the amount of bytes saved',
+            action='store_true'
+        )
+
+        optional.add_argument(
+            '--force',
+            help='Upload the file even if the same one was already uploaded with the same settings (by default '
+                 'the upload is skipped and the ID of the test it was uploaded to is printed)',
+            action='store_true'
+        )
+
+        optional.add_argument(
+            '--prefilter',
+            help='Drop the findings below --min_severity from the file before uploading it, instead of only on '
+                 'DefectDojo (supported scanners: '+', '.join(sorted(ScanReport.SCANNERS))+')',
+            action='store_true'
+        )
+
+        optional.add_argument(
+            '--include_rule',
+            help='Upload only the findings whose rule/vulnerability ID matches this pattern (e.g. "CVE-*"), '
+                 'implies --prefilter (can be used multiple times)',
+            action='append'
+        )
+
+        optional.add_argument(
+            '--exclude_rule',
+            help='Drop the findings whose rule/vulnerability ID matches this pattern before uploading the file, '
+                 'implies --prefilter (can be used multiple times)',
+            action='append'
+        )
+
         parser._action_groups.append(optional)
 
         # Parse out arguments ignoring the first three (because we're inside a sub-command)
         args = vars(parser.parse_args(sys.argv[3:]))
+        self.check_prefilter_args(parser, args)
+        if args['compress']:
+            Util.compress = True
+        if args['progress']:
+            args['progress'] = UploadProgress()
+        else:
+            args['progress'] = None
         # Re-import results
         response = self.reimport(**args)
         # Load re-import response as JSON
@@ -368,16 +590,197 @@ class Findings(object):
         else:
             print(response.text)
 
+    # Arguments of import_/reimport that can be set for each report of a batch
+    BATCH_KEYS = ['result_file', 'scanner', 'engagement_id', 'lead_id', 'test_id', 'test_type', 'env', 'scan_date',
+                  'active', 'verified', 'min_severity', 'tag_test', 'auto_close', 'skip_duplicates', 'version',
+                  'build_id', 'branch_tag', 'commit_hash', 'force', 'prefilter', 'include_rule', 'exclude_rule']
+
+    # Import several scan reports concurrently (at most 'workers' uploads at a time). Each entry has the arguments
+    # of import_, or of reimport if it has a 'test_id'. Returns the result of each entry, in the same order
+    def import_batch(self, url, api_key, entries, workers=None, callback=None):
+        def upload(entry):
+            result = dict()
+            result['file'] = entry['result_file']
+            result['mode'] = 'reimport' if entry.get('test_id') is not None else 'import'
+            start = time.time()
+            try:
+                if result['mode'] == 'reimport':
+                    response = self.reimport(url=url, api_key=api_key, **entry)
+                else:
+                    response = self.import_(url=url, api_key=api_key, **entry)
+                result['status_code'] = response.status_code
+                result['status'] = 'ok' if response.status_code == 201 else 'failed'
+                try:
+                    result['response'] = json.loads(response.text)
+                    if result['response'].get('skipped'): # Already uploaded (see upload_scan)
+                        result['status'] = 'skipped'
+                except (ValueError, AttributeError): # Not a JSON object (e.g. an error page from a reverse proxy)
+                    result['response'] = response.text
+            except Exception as e:
+                result['status'] = 'failed'
+                result['error'] = str(e)
+            result['seconds'] = round(time.time() - start, 3)
+            if callback is not None:
+                callback(result)
+            return result
+        return AsyncClient(workers).map(upload, entries)
+
+    # Get the entries of a batch from a directory (all its files), a glob pattern or a JSON manifest. The
+    # manifest is a list of objects with the 'file' to import (relative to the manifest) and any of BATCH_KEYS,
+    # and 'defaults' are used for whatever an entry doesn't set
+    def batch_entries(self, source, defaults):
+        if os.path.isdir(source):
+            paths = [os.path.join(source, name) for name in sorted(os.listdir(source))]
+            manifest = [{'file': path} for path in paths if os.path.isfile(path)]
+        elif os.path.isfile(source):
+            with open(source) as manifest_file:
+                manifest = json.load(manifest_file)
+            if type(manifest) is not list:
+                raise Exception('The manifest must be a JSON list of objects')
+            base_dir = os.path.dirname(source)
+            for item in manifest:
+                if type(item) is not dict or 'file' not in item:
+                    raise Exception('Each entry of the manifest must be an object with a "file"')
+                item['file'] = os.path.join(base_dir, item['file'])
+        else:
+            manifest = [{'file': path} for path in sorted(glob.glob(source)) if os.path.isfile(path)]
+        if not manifest:
+            raise Exception('No scan reports found in '+source)
+
+        # Check all the entries before uploading any of them
+        entries = list()
+        errors = list()
+        for item in manifest:
+            entry = dict(defaults)
+            entry.update(item)
+            entry['result_file'] = entry.pop('file')
+            unknown = [key for key in entry if key not in self.BATCH_KEYS]
+            if unknown:
+                errors.append(entry['result_file']+': unknown settings '+', '.join(sorted(unknown)))
+            elif not os.path.isfile(entry['result_file']):
+                errors.append(entry['result_file']+': file not found')
+            elif entry.get('scanner') is None:
+                errors.append(entry['result_file']+': missing scanner')
+            elif self.prefilters(entry) and entry['scanner'] not in ScanReport.SCANNERS:
+                errors.append(entry['result_file']+': prefilter can\'t be used with '+entry['scanner']
+                              +' (supported scanners: '+', '.join(sorted(ScanReport.SCANNERS))+')')
+            elif entry.get('test_id') is None and (entry.get('engagement_id') is None
+                                                   or entry.get('lead_id') is None):
+                errors.append(entry['result_file']+': missing test_id (to re-import) or engagement_id and '
+                                                   'lead_id (to import)')
+            entries.append(entry)
+        if errors:
+            raise Exception('Invalid batch:\n  '+'\n  '.join(errors))
+        return entries
+
+    def _import_batch(self):
+        # Read user-supplied arguments
+        parser = argparse.ArgumentParser(description='Import several scan results to DefectDojo concurrently',
+                                         usage='defectdojo findings import-batch SOURCE [<args>]')
+        optional = parser._action_groups.pop()
+        required = parser.add_argument_group('required arguments')
+        parser.add_argument('source', help='Directory with the results to be imported, glob pattern (e.g. '
+                                           '"reports/*.json") or JSON manifest with a list of objects, each with '
+                                           'the "file" to import and its own settings (any of the arguments '
+                                           'below, e.g. "scanner" or "test_id" to re-import)')
+        required.add_argument('--url', help='DefectDojo URL', required=True)
+        required.add_argument('--api_key', help='API v2 Key', required=True)
+        optional.add_argument('--scanner', help='Type of scanner')
+        optional.add_argument('--engagement_id', help='Engagement ID')
+        optional.add_argument('--lead_id', help='ID of the user conducting the operation')
+        optional.add_argument('--test_type', help='Test type / title (default = scanner name)')
+        optional.add_argument('--env', help='Environment')
+        optional.add_argument('--scan_date', help='Date the scan was perfomed (default = TODAY)',
+                              metavar='YYYY-MM-DD', default=datetime.now().strftime('%Y-%m-%d'))
+        optional.add_argument('--active', help='Mark vulnerabilities found as active (default)',
+                              action='store_true', dest='active')
+        optional.add_argument('--inactive', help='Mark vulnerabilities found as inactive',
+                              action='store_false', dest='active')
+        optional.add_argument('--verified', help='Mark vulnerabilities found as verified',
+                              action='store_true', dest='verified')
+        optional.add_argument('--unverified', help='Mark vulnerabilities found as unverified (default)',
+                              action='store_false', dest='verified')
+        optional.set_defaults(active=True, verified=False)
+        optional.add_argument('--min_severity', help='Ignore findings below this severity', choices=SEVERITIES)
+        optional.add_argument('--tag_test', help='Test tag (can be used multiple times)', action='append')
+        optional.add_argument('--auto_close', help='Close all open findings from the same --test_type that are '
+                                                   'not listed on the import (default = False)',
+                              action='store_true', default=None)
+        optional.add_argument('--skip_duplicates', help='Dont import duplicates (requires deduplication) '
+                                                        '(default = False)', action='store_true', default=None)
+        optional.add_argument('--version', help='Current version of the project')
+        optional.add_argument('--build_id', help='Build ID')
+        optional.add_argument('--branch_tag', help='Branch or tag scanned')
+        optional.add_argument('--commit_hash', help='Commit HASH')
+        optional.add_argument('--force', help='Upload the files even if the same ones were already uploaded with '
+                                              'the same settings', action='store_true', default=None)
+        optional.add_argument('--prefilter', help='Drop the findings below --min_severity from the files before '
+                                                  'uploading them (see findings import --help)',
+                              action='store_true', default=None)
+        optional.add_argument('--include_rule', help='Upload only the findings whose rule/vulnerability ID matches '
+                                                     'this pattern (can be used multiple times)', action='append')
+        optional.add_argument('--exclude_rule', help='Drop the findings whose rule/vulnerability ID matches this '
+                                                     'pattern (can be used multiple times)', action='append')
+        optional.add_argument('--workers', type=int,
+                              help='Reports uploaded at the same time (default = '+str(Util.concurrency)+')')
+        optional.add_argument('--compress',
+                              help='Upload the files gzip-compressed (if the server or a reverse proxy in front '
+                                   'of it doesn\'t accept "Content-Encoding: gzip" request bodies, they\'re sent '
+                                   'uncompressed)',
+                              action='store_true')
+        parser._action_groups.append(optional)
+        # Parse out arguments ignoring the first three (because we're inside a sub_command)
+        args = vars(parser.parse_args(sys.argv[3:]))
+        if args.pop('compress'):
+            Util.compress = True
+        url = args.pop('url')
+        api_key = args.pop('api_key')
+        source = args.pop('source')
+        workers = args.pop('workers')
+        defaults = dict((key, value) for key, value in args.items() if value is not None)
+        try:
+            entries = self.batch_entries(source, defaults)
+        except Exception as e:
+            print(str(e), file=sys.stderr)
+            exit(1)
+
+        # Print each report to stderr as soon as it's done
+        done = itertools.count(1)
+        def print_result(result):
+            print('[%d/%d] %s: %s (%.1fs)' % (next(done), len(entries), result['file'], result['status'],
+                                               result['seconds']), file=sys.stderr)
+        start = time.time()
+        results = self.import_batch(url, api_key, entries, workers=workers, callback=print_result)
+        summary = {'total': len(results)}
+        for status in ['ok', 'skipped', 'failed']:
+            summary[status] = len([result for result in results if result['status'] == status])
+        failed = summary['failed']
+        summary['seconds'] = round(time.time() - start, 3)
+        summary['results'] = results
+        print(json.dumps(summary, indent=4))
+        if failed:
+            exit(1)
+        else:
+            exit(0)
+
 
     def list(self, url, api_key, finding_id=None, test_id=None, product_id=None,
              engagement_id=None, test_type=None, active=None, closed=None,
-             valid=None, scope=None, limit=None, tag_test=None, tags_operator=None, **kwargs):
+             valid=None, scope=None, limit=None, offset=None, tag_test=None, tags_operator=None,
+             page_size=None, parallel=None, pagination=None, resume_after=None, severity=None, raw=False,
+             fields=None, offline=False, db=None, **kwargs):
         # Create parameters to be requested
         request_params = dict()
         API_URL = url+'/api/v2'
         FINDINGS_URL = API_URL+'/findings/'
         if finding_id is not None:
             request_params['id'] = finding_id
+        if severity is not None:
+            request_params['severity'] = severity
+        if fields is not None:
+            # Ask the server to send only these fields (the ID is always needed to go through the pages). If it
+            # doesn't support it, they're projected when the pages are decoded
+            request_params['fields'] = ','.join(fields if 'id' in fields else ['id'] + fields)
         if test_id is not None:
             request_params['test'] = test_id
         if product_id is not None:
@@ -403,18 +806,12 @@ class Findings(object):
                 request_params['out_of_scope'] = 2
         if limit is not None:
             request_params['limit'] = limit
-        else:
-            # Make a request to API getting only one finding to retrieve the total amount of findings
-            temp_params = request_params.copy()
-            temp_params['url'] = url
-            temp_params['api_key'] = api_key
-            temp_params['limit'] = 1
-            temp_response = self.list(**temp_params)
-            limit = int(json.loads(temp_response.text)['count'])
-            request_params['limit'] = limit
+        if offset is not None:
+            request_params['offset'] = offset
         if tag_test:
             # First get all test types with the tags we're looking for
-            test_type_list = Tests().get_test_type_by_tags(url, api_key, tag_test, tags_operator, engagement_id)
+            test_type_list = Tests().get_test_type_by_tags(url, api_key, tag_test, tags_operator, engagement_id,
+                                                           offline=offline, db=db)
             # Add them to request parameters
             #   (so the tags aren't actually passed to request, only their test_types)
             if test_type is not None:
@@ -422,29 +819,76 @@ class Findings(object):
                 test_type_list = test_type_list + test_type
             test_type = test_type_list
         if test_type is not None:
-            # Transform test_type names to IDs
-            test_type_ids = set()
-            for tt in test_type:
-                if type(tt) is str:
-                    temp_params = dict()
-                    temp_params['name'] = tt
-                    # Make a get request to /test_types passing the test_type as parameter
-                    temp_response = Util().request_apiv2('GET', API_URL+'/test_types/', api_key, params=temp_params)
-                    # Tranform the above response in json and get the id
-                    test_type_ids.add(json.loads(temp_response.text)['results'][0]['id'])
-                else:
-                    test_type_ids.add(tt)
+            # Transform test_type names to IDs, all at once (using the cached test types, or the mirror when offline)
+            test_type_ids = set(tt for tt in test_type if type(tt) is not str)
+            test_type_names = sorted(set(tt for tt in test_type if type(tt) is str))
+            if test_type_names and offline:
+                from defectdojo_cli.mirror import Mirror
+                test_type_ids.update(Mirror(url, path=db).get_test_type_ids(test_type_names))
+            elif test_type_names:
+                test_type_ids.update(Cache(url, api_key).get_ids('test_types', test_type_names))
+            if not test_type_ids:
+                # No test type to filter by (e.g. no test has the tags), so no finding matches either. An empty
+                # filter would be ignored by the server, listing all the findings
+                return self.list_empty(FINDINGS_URL, request_params, raw=raw)
+            if offline: # The mirror can filter by several test types at once
+                request_params['test__test_type'] = ','.join(str(tt) for tt in sorted(test_type_ids))
             # If there's only one test_type
-            if (len(test_type_ids) == 1):
+            elif (len(test_type_ids) == 1):
                 # Add to request_params
                 request_params['test__test_type'] = list(test_type_ids)[0]
             else:
                 # Use the appropriate method
-                return self.list_multiple_test_types(url, api_key, test_type_ids, **request_params)
-
-        # Make request
-        response = Util().request_apiv2('GET', FINDINGS_URL, api_key, params=request_params)
-        return response
+                return self.list_multiple_test_types(url, api_key, test_type_ids, page_size=page_size,
+                                                     parallel=parallel, pagination=pagination,
+                                                     resume_after=resume_after, raw=raw, projection=fields,
+                                                     **request_params)
+
+        if offline:
+            # Answer from the local mirror instead of DefectDojo
+            from defectdojo_cli.mirror import Mirror
+            if resume_after is not None:
+                request_params['id__gt'] = resume_after
+            pages = Mirror(url, path=db).query_pages('findings', FINDINGS_URL, request_params, page_size=page_size)
+            return PagedResponse(pages, fields=fields)
+
+        # Make request (going through all the pages unless a limit was passed)
+        pages = self.list_pages(FINDINGS_URL, api_key, request_params, page_size=page_size, parallel=parallel,
+                                pagination=pagination, resume_after=resume_after, raw=raw)
+        if raw: # Pages are returned without being parsed (see Util.request_apiv2_pages_raw)
+            return pages
+        return PagedResponse(pages, fields=fields)
+
+    # Listing without results, answered without making a request
+    def list_empty(self, findings_url, request_params, raw=False):
+        import requests
+        request = requests.PreparedRequest()
+        request.prepare(method='GET', url=findings_url, params=request_params)
+        response = EmptyResponse(request)
+        if raw:
+            return iter([(response, [response.content])])
+        return PagedResponse(iter([(response, response.json())]))
+
+    # Choose how to go through the pages of a findings listing
+    def list_pages(self, findings_url, api_key, request_params, page_size=None, parallel=None,
+                   pagination=None, resume_after=None, raw=False):
+        if raw: # Pages aren't parsed, so the only way to go through them is following their 'next' links
+            return Util().request_apiv2_pages_raw(findings_url, api_key, params=request_params, page_size=page_size,
+                                                  follow='limit' not in request_params)
+        if 'limit' in request_params: # Only one page
+            return Util().request_apiv2_pages(findings_url, api_key, params=request_params, follow=False)
+        # Resuming from an ID is only possible with keyset pagination
+        if pagination == 'keyset' or resume_after is not None:
+            if parallel:
+                return Util().request_apiv2_pages_keyset_parallel(findings_url, api_key, params=request_params,
+                                                                  page_size=page_size, after_id=resume_after,
+                                                                  workers=parallel)
+            return Util().request_apiv2_pages_keyset(findings_url, api_key, params=request_params,
+                                                     page_size=page_size, after_id=resume_after)
+        if parallel:
+            return Util().request_apiv2_pages_parallel(findings_url, api_key, params=request_params,
+                                                       page_size=page_size, workers=parallel)
+        return Util().request_apiv2_pages(findings_url, api_key, params=request_params, page_size=page_size)
 
     def _list(self):
         # Read user-supplied arguments
@@ -478,16 +922,46 @@ class Findings(object):
         optional.add_argument('--out_of_scope', help='List only findings out-of-scope',
                               action='store_false', dest='scope')
         optional.add_argument('--json', help='Print output in JSON format', action='store_true', default=False)
+        optional.add_argument('--ndjson', help='Print output in JSON format, one finding per line, as the pages '
+                                               'of findings are received', action='store_true')
+        optional.add_argument('--raw', help='Print the pages of findings exactly as received from DefectDojo, '
+                                            'one page (JSON) per line, without parsing them', action='store_true')
+        optional.add_argument('--fields', metavar='FIELD,...',
+                              help='Comma separated fields of each finding to be printed with --json or --ndjson '
+                                   '(by default all of them)')
         optional.add_argument('--limit',
                               help='Number of results to return (by default it gets all the findings)')
         optional.add_argument('--offset', help='The initial index from which to return the results '
                               +'(not needed if the --limit flag is not set)')
+        optional.add_argument('--page_size', type=int,
+                              help='Amount of findings requested at a time when getting all the findings '
+                                   '(default = '+str(Util.page_size)+')')
+        optional.add_argument('--parallel', type=int, metavar='N',
+                              help='Request up to N pages of findings in parallel when getting all the findings')
+        optional.add_argument(
+            '--pagination',
+            help='How to go through the pages of findings. "keyset" orders the findings by ID and asks for '
+                 'the IDs after the last one received, which is faster for big listings (default = "offset")',
+            default='offset',
+            choices=['offset', 'keyset']
+        )
+        optional.add_argument(
+            '--resume_after', type=int, metavar='FINDING_ID',
+            help='List only findings with an ID greater than this one, using keyset pagination. Used to '
+                 'resume an interrupted --json export (its last ID is printed when interrupted)'
+        )
         optional.add_argument(
             '--fail_if_found',
             help='Returns a non-zero exit code if any findings with the passed '
                  'severity (or higher) are returned (default = NULL)',
             default='NULL',
-            choices=['NULL', 'Info', 'Low', 'Medium', 'High', 'Critical']
+            choices=['NULL'] + SEVERITIES
+        )
+        optional.add_argument(
+            '--gate',
+            help='Only check if there are findings with the --fail_if_found severity (or higher), counting them '
+                 'on DefectDojo (one request per severity) instead of listing them',
+            action='store_true'
         )
         optional.add_argument(
             '--tag_test',
@@ -505,115 +979,262 @@ class Findings(object):
             default='union',
             choices=['union', 'intersect']
         )
+        optional.add_argument(
+            '--compress',
+            help='Print the amount of bytes saved by compressed responses (gzip is always used; this also '
+                 'accepts brotli and zstd if they are installed)',
+            action='store_true'
+        )
+        optional.add_argument('--no_pager', help='Don\'t use a pager (PAGER, by default "less") when printing '
+                                                 'the findings to a terminal', action='store_true')
+        optional.add_argument('--offline', help='Answer from the local mirror (see "defectdojo findings sync") '
+                                                'instead of DefectDojo', action='store_true')
+        optional.add_argument('--db', help='Path of the SQLite database of the local mirror (default = the one '
+                                           'of the DefectDojo URL in the cache directory)')
         optional.set_defaults(active=None, valid=None, scope=None)
         parser._action_groups.append(optional)
         # Parse out arguments ignoring the first three (because we're inside a sub-command)
         args = vars(parser.parse_args(sys.argv[3:]))
+        if args['compress']:
+            Util.compress = True
 
         # Adjust args
         if args['id'] is not None:
             # Rename key from 'id' to 'finding_id' to match the argument of self.list
             args['finding_id'] = args.pop('id')
 
+        if args['fields'] is not None:
+            args['fields'] = args['fields'].split(',')
+        if not (args['json'] or args['ndjson'] or args['raw']):
+            # The table only needs a few fields of each finding
+            args['fields'] = Finding.FIELDS
+
+        if args['gate']:
+            if args['fail_if_found'] == 'NULL':
+                parser.error('--gate requires --fail_if_found')
+            self.gate(**args)
+        if args['raw']:
+            if args['offline']:
+                parser.error('--raw can\'t be used with --offline')
+            if args['parallel'] or args['pagination'] == 'keyset' or args['resume_after'] is not None:
+                parser.error('--raw can\'t be used with --parallel, --pagination keyset or --resume_after')
+            if args['fields'] is not None:
+                # The pages are printed as the server sent them
+                parser.error('--raw can\'t be used with --fields')
+            self.print_raw(self.list(**args))
+
         # Get findings
         response = self.list(**args)
 
         # Print output
-        json_out = json.loads(response.text)
         if response.status_code == 200: # Sucess
 
-            if args['json'] is True: # If --json flag was passed
-                # Pretty print output in json
-                pretty_json_out = json.dumps(json_out, indent=4)
-                print(pretty_json_out)
+            if args['ndjson'] is True: # If --ndjson flag was passed
+                self.print_ndjson(response, resume=(args['pagination'] == 'keyset'
+                                                    or args['resume_after'] is not None))
+                exit(0)
+
+            elif args['json'] is True: # If --json flag was passed
+                if args['pagination'] == 'keyset' or args['resume_after'] is not None:
+                    # Collect the findings by hand so that, if the export is interrupted, the findings received
+                    # so far are still printed along with the ID from which the export can be resumed
+                    results = list()
+                    try:
+                        for finding in response:
+                            results.append(response.compact(finding))
+                    except (Exception, KeyboardInterrupt) as e:
+                        response.write_json(sys.stdout, results)
+                        if results:
+                            resume_after = response.last_id
+                        else:
+                            resume_after = args['resume_after']
+                        print('\nExport interrupted ('+(str(e) or type(e).__name__)+'). To resume it use: '
+                              '--resume_after '+str(resume_after), file=sys.stderr)
+                        exit(1)
+                    response.write_json(sys.stdout, results)
+                else:
+                    # Get all the findings before printing them (a page after the first one may fail, e.g. with
+                    # an error page of a reverse proxy once the retries are exhausted)
+                    try:
+                        response.load()
+                    except Exception as e:
+                        print(str(e), file=sys.stderr)
+                        exit(1)
+                    # Pretty print output in json
+                    response.write_json(sys.stdout)
 
             else: # Print output in a more human readable way
-                # Print findings amount
-                findings_amount = json_out['count']
-                print('\nFindings amount: '+str(json_out['count']))
-                if findings_amount > 0:
-
-                    # Print components and its version (usefull for Software Composition Analysis)
-                    components = set()
-                    for finding in json_out['results']:
-                        if finding['component_name'] is not None:
-                            if finding['component_version'] is not None:
-                                components.add('    ' + finding['component_name']+' v'+finding['component_version'])
+                sev_max = None
+                # Go through a pager when printing to a terminal
+                with Pager(enabled=not args['no_pager']) as output:
+                    # Print findings amount
+                    findings_amount = response.count
+                    print('\nFindings amount: '+str(findings_amount), file=output)
+                    if findings_amount > 0:
+
+                        # Print link to the list of findings on DefectDojo
+                        if args['product_id'] is not None: # If a product id was passed
+                            # Print link specific for that product
+                            findings_list_url = response.request.url.replace('api/v2/findings/', 'product/'+args['product_id']+'/finding/all') # Mount URL using the previous API call as base
+                            findings_list_url = re.sub('test__engagement__product=\d+&?', '', findings_list_url)
+                            findings_list_url = re.sub('limit=\d+&?', '', findings_list_url)
+                            findings_list_url = re.sub('%0A', '', findings_list_url)
+                            findings_list_url = re.sub('fields=[^&]*&?', '', findings_list_url)
+                            print('\nYou can also view this list on DefectDojo:\n'+findings_list_url+'\n', file=output) # Print URL
+                        else:
+                            # Print general link
+                            findings_list_url = response.request.url.replace('api/v2/findings/', 'finding') # Mount URL using the previous API call as base
+                            findings_list_url = re.sub('fields=[^&]*&?', '', findings_list_url)
+                            print('\nYou can also view this list on DefectDojo:\n'+findings_list_url+'\n', file=output) # Print URL
+
+                        # Print the findings as they're received (page by page), keeping only their components
+                        # and the maximum severity. Big listings are printed in a plain format. The columns get
+                        # their largest possible width, since only the first rows are measured
+                        components = set()
+                        table = TableRenderer(['Severity', 'Title', 'URL'], stream=output,
+                                              plain=findings_amount > TableRenderer.plain_threshold,
+                                              min_widths=[max(len(severity) for severity in SEVERITIES), 73,
+                                                          len(args['url']+'/finding/'+str(MAX_ID))])
+                        for finding_json in response:
+                            finding = Finding.from_json(finding_json)
+                            if finding.component_name is not None:
+                                if finding.component_version is not None:
+                                    components.add('    ' + finding.component_name+' v'+finding.component_version)
+                                else:
+                                    components.add('    ' + finding.component_name)
+                            if sev_max is None or SEVERITIES.index(finding.severity) > sev_max:
+                                sev_max = SEVERITIES.index(finding.severity)
+                            if len(finding.title) <= 70: # Truncate title bigger then 70 chars
+                                title = finding.title
                             else:
-                                components.add('    ' + finding['component_name'])
-                    if components:
-                        print('\nVulnerable components:')
-                        for component in sorted(components):
-                            print(component)
-
-                    # Print link to the list of findings on DefectDojo
-                    if args['product_id'] is not None: # If a product id was passed
-                        # Print link specific for that product
-                        findings_list_url = response.request.url.replace('api/v2/findings/', 'product/'+args['product_id']+'/finding/all') # Mount URL using the previous API call as base
-                        findings_list_url = re.sub('test__engagement__product=\d+&?', '', findings_list_url)
-                        findings_list_url = re.sub('limit=\d+&?', '', findings_list_url)
-                        findings_list_url = re.sub('%0A', '', findings_list_url)
-                        print('\n\nYou can also view this list on DefectDojo:\n'+findings_list_url) # Print URL
+                                title = finding.title[:70]+'...'
+                            table.add_row([finding.severity, title, args['url']+'/finding/'+str(finding.id)])
+                        table.close()
+
+                        # Print components and its version (usefull for Software Composition Analysis)
+                        if components:
+                            print('\nVulnerable components:', file=output)
+                            for component in sorted(components):
+                                print(component, file=output)
+
+                # Exit
+                if args['fail_if_found'] != 'NULL' and sev_max is not None: # If --fail_if_found flag was passed
+                    # Parse fail_if_found flag
+                    fail_if_found = SEVERITIES.index(args['fail_if_found'])
+
+                    if sev_max >= fail_if_found:
+                        exit(1)
                     else:
-                        # Print general link
-                        findings_list_url = response.request.url.replace('api/v2/findings/', 'finding') # Mount URL using the previous API call as base
-                        print('\n\nYou can also view this list on DefectDojo:\n'+findings_list_url) # Print URL
-
-                    # Print findings using tabulate (https://pypi.org/project/tabulate)
-                    table = dict()
-                    table['Severity'] = list()
-                    table['Title'] = list()
-                    table['URL'] = list()
-                    for finding in json_out['results']:
-                        table['Severity'].append(finding['severity'])
-                        if len(finding['title']) <= 70: # Truncate title bigger then 70 chars
-                            table['Title'].append(finding['title'])
-                        else:
-                            table['Title'].append(finding['title'][:70]+'...')
-                        table['URL'].append(args['url']+'/finding/'+str(finding['id']))
-                    print(tabulate(table, headers='keys', tablefmt='fancy_grid'))
-
-                    # Exit
-                    if args['fail_if_found'] != 'NULL': # If --fail_if_found flag was passed
-
-                        findings_sev = set(table['Severity'])
-                        # Get maximum severity from listed findings
-                        if 'Info' in findings_sev:
-                            sev_max = 1
-                        if 'Low' in findings_sev:
-                            sev_max = 2
-                        if 'Medium' in findings_sev:
-                            sev_max = 3
-                        if 'High' in findings_sev:
-                            sev_max = 4
-                        if 'Critical' in findings_sev:
-                            sev_max = 5
-
-                        # Parse fail_if_found flag
-                        if args['fail_if_found'] == 'Info':
-                            fail_if_found = 1
-                        if args['fail_if_found'] == 'Low':
-                            fail_if_found = 2
-                        if args['fail_if_found'] == 'Medium':
-                            fail_if_found = 3
-                        if args['fail_if_found'] == 'High':
-                            fail_if_found = 4
-                        if args['fail_if_found'] == 'Critical':
-                            fail_if_found = 5
-
-                        if sev_max >= fail_if_found:
-                            exit(1)
-                        else:
-                            exit(0)
-
-                else:
-                    exit(0)
+                        exit(0)
+                exit(0)
         else: # Failure
-            # Pretty print output in json
-            pretty_json_out = json.dumps(json_out, indent=4)
-            print(pretty_json_out)
+            # Pretty print output in json (or as it is if it's not a JSON), exiting with a failure
+            Util().default_output(response, sucess_status_code=200)
+
+    # Print each finding as a JSON line as soon as its page is received
+    def print_ndjson(self, response, resume=False):
+        last_id = None
+        try:
+            for finding in response:
+                sys.stdout.write(json.dumps(finding)+'\n')
+                last_id = response.last_id
+        except (Exception, KeyboardInterrupt) as e:
+            sys.stdout.flush()
+            message = 'Export interrupted ('+(str(e) or type(e).__name__)+').'
+            if resume and last_id is not None:
+                # With keyset pagination findings are ordered by ID, so the export can continue after the last one
+                message += ' To resume it use: --resume_after '+str(last_id)
+            print(message, file=sys.stderr)
             exit(1)
 
+    # Copy the pages of findings to stdout as they're received, one per line
+    def print_raw(self, pages):
+        output = sys.stdout.buffer
+        for response, page in pages:
+            for chunk in page:
+                output.write(chunk)
+            output.write(b'\n')
+            output.flush()
+            if response.status_code != 200: # Failure
+                exit(1)
+        exit(0)
+
+    # Count the findings of each severity (one request with limit=1 per severity, all of them at the same time),
+    # returning a list of (severity, response) in the order of severities. The other arguments are the filters of
+    # self.list
+    def count_by_severity(self, severities, **kwargs):
+        kwargs['limit'] = 1
+        kwargs['offset'] = None
+        kwargs['fields'] = ['id'] # Only the count is used
+
+        def count(severity):
+            return severity, self.list(severity=severity, **kwargs)
+
+        return AsyncClient(len(severities)).map(count, severities)
+
+    # Exit with a non-zero exit code if there's any finding with the fail_if_found severity (or higher)
+    def gate(self, fail_if_found, **kwargs):
+        severities = SEVERITIES[SEVERITIES.index(fail_if_found):]
+        for severity, response in self.count_by_severity(severities, **kwargs):
+            if response.status_code != 200: # Failure
+                # Pretty print output in json (or as it is if it's not a JSON), exiting with a failure
+                Util().default_output(response, sucess_status_code=200)
+            if response.count > 0:
+                print('\nFound '+str(response.count)+' findings with severity '+severity
+                      +' (failing on '+fail_if_found+' or higher)')
+                exit(1)
+        print('\nNo findings with severity '+fail_if_found+' or higher')
+        exit(0)
+
+    # Count the findings of each severity of a scan report, reading it locally (without DefectDojo). Returns a
+    # list with the amount of findings of each severity, indexed like SEVERITIES
+    def count_report(self, result_file, scanner, include_rule=None, exclude_rule=None, **kwargs):
+        report = ScanReport(scanner, include_rules=include_rule, exclude_rules=exclude_rule)
+        with open(result_file, 'rb') as source:
+            report.filter(source)
+        return report.kept
+
+    def _gate(self):
+        # Read user-supplied arguments
+        parser = argparse.ArgumentParser(description='Check the severity of the findings of a scan report '
+                                                     'locally, without uploading it to DefectDojo',
+                                         usage='defectdojo findings gate RESULT_FILE [<args>]')
+        optional = parser._action_groups.pop()
+        required = parser.add_argument_group('required arguments')
+        parser.add_argument('result_file', help='File with the results to be checked')
+        required.add_argument('--scanner', help='Type of scanner (one of: '+', '.join(sorted(ScanReport.SCANNERS))
+                                                +')', required=True)
+        optional.add_argument(
+            '--fail_if_found',
+            help='Returns a non-zero exit code if any findings with the passed '
+                 'severity (or higher) are found (default = NULL)',
+            default='NULL',
+            choices=['NULL'] + SEVERITIES
+        )
+        optional.add_argument('--include_rule', help='Count only the findings whose rule/vulnerability ID matches '
+                                                     'this pattern (can be used multiple times)', action='append')
+        optional.add_argument('--exclude_rule', help='Don\'t count the findings whose rule/vulnerability ID matches '
+                                                     'this pattern (can be used multiple times)', action='append')
+        parser._action_groups.append(optional)
+        # Parse out arguments ignoring the first three (because we're inside a sub_command)
+        args = vars(parser.parse_args(sys.argv[3:]))
+
+        try:
+            counts = self.count_report(**args)
+        except Exception as e:
+            print('Failed to read '+args['result_file']+': '+str(e), file=sys.stderr)
+            exit(1)
+        print(', '.join(severity+': '+str(count) for severity, count in reversed(list(zip(SEVERITIES, counts)))))
+
+        if args['fail_if_found'] != 'NULL': # If --fail_if_found flag was passed
+            fail_if_found = args['fail_if_found']
+            found = sum(counts[SEVERITIES.index(fail_if_found):])
+            if found > 0:
+                print('\nFound '+str(found)+' findings with severity '+fail_if_found+' or higher')
+                exit(1)
+            print('\nNo findings with severity '+fail_if_found+' or higher')
+        exit(0)
+
     def update(self, url, api_key, finding_id, active=None, mitigated=None, **kwargs):
         # Prepare JSON data to be send
         request_json = dict()
@@ -695,6 +1316,193 @@ class Findings(object):
         # Pretty print JSON response
         Util().default_output(response, sucess_status_code=200)
 
+    # Aggregate the findings by component (name and version), counting its findings, tests and products and
+    # getting its maximum severity. Findings are streamed, so memory only grows with the amount of components
+    def components(self, url, api_key, offline=False, db=None, **kwargs):
+        kwargs['fields'] = Finding.FIELDS
+        kwargs['json'] = True # Only to be sure no output-only argument changes the listing
+        # For each component: [findings, maximum severity, test IDs]
+        aggregates = dict()
+        response = self.list(url, api_key, offline=offline, db=db, **kwargs)
+        if response.status_code != 200:
+            raise Exception('Failed to list findings ('+str(response.status_code)+'): '+response.text)
+        for finding_json in response:
+            finding = Finding.from_json(finding_json)
+            if finding.component_name is None:
+                continue
+            key = (finding.component_name, finding.component_version)
+            aggregate = aggregates.get(key)
+            if aggregate is None:
+                aggregate = aggregates[key] = [0, 0, set()]
+            aggregate[0] += 1
+            aggregate[1] = max(aggregate[1], SEVERITIES.index(finding.severity))
+            aggregate[2].add(finding.test)
+
+        # Map the tests to their products (tests have their engagement and engagements their product)
+        if kwargs.get('product_id') is not None:
+            test_products = None # All of them are from the same product
+        else:
+            test_ids = set()
+            for aggregate in aggregates.values():
+                test_ids.update(aggregate[2])
+            # Only the tests with findings, and their engagements, are requested
+            test_engagements = self.lookup_field(Tests().list, 'test_id', test_ids, 'engagement', url=url,
+                                                 api_key=api_key, offline=offline, db=db)
+            engagement_products = self.lookup_field(Engagements().list, 'engagement_id',
+                                                    set(test_engagements.values()), 'product', url=url,
+                                                    api_key=api_key, offline=offline, db=db)
+            test_products = dict()
+            for test_id, engagement_id in test_engagements.items():
+                test_products[test_id] = engagement_products.get(engagement_id)
+
+        components = list()
+        for (name, version), aggregate in aggregates.items():
+            component = dict()
+            component['component'] = name
+            component['version'] = version
+            component['findings'] = aggregate[0]
+            component['max_severity'] = SEVERITIES[aggregate[1]]
+            if test_products is None:
+                component['products'] = 1
+            else:
+                component['products'] = len(set(test_products.get(test) for test in aggregate[2]))
+            component['tests'] = len(aggregate[2])
+            components.append(component)
+        # Most severe and most common components first
+        components.sort(key=lambda component: (-SEVERITIES.index(component['max_severity']), -component['findings'],
+                                               component['component'], component['version'] or ''))
+        return components
+
+    # Get a field of the results with the given IDs ({ID: value}) from a listing method (e.g. Tests().list), which
+    # is called with the IDs to be listed (comma separated, 'chunk_size' at a time) as its 'id_argument'. Servers
+    # that don't support filtering by several IDs (they either reject it or ignore the filter) are asked for the
+    # whole listing once instead
+    def lookup_field(self, list_function, id_argument, ids, field, chunk_size=100, **kwargs):
+        ids = sorted(ids)
+        if not ids:
+            return dict()
+
+        def get_listing(list_kwargs, allowed_status_codes=(200,)):
+            response = list_function(**list_kwargs)
+            if response.status_code not in allowed_status_codes:
+                raise Exception('Failed to list '+response.url+' ('+str(response.status_code)+'): '+response.text)
+            return response
+
+        def lookup(chunk, allowed_status_codes=(200,)):
+            chunk_kwargs = dict(kwargs)
+            chunk_kwargs[id_argument] = ','.join(str(result_id) for result_id in chunk)
+            return get_listing(chunk_kwargs, allowed_status_codes=allowed_status_codes)
+
+        def get_values(response, result_ids):
+            return [(result['id'], result[field]) for result in response if result['id'] in result_ids]
+
+        chunks = [set(ids[start:start + chunk_size]) for start in range(0, len(ids), chunk_size)]
+        # The first chunk tells whether the server supports the filter, before asking for the other ones
+        response = lookup(chunks[0], allowed_status_codes=(200, 400))
+        if response.status_code == 400: # Several IDs rejected
+            return dict(get_values(get_listing(kwargs), set(ids)))
+        if response.count > len(chunks[0]): # Filter ignored, so this already is the whole listing
+            return dict(get_values(response, set(ids)))
+        values = dict(get_values(response, chunks[0]))
+        for chunk_values in AsyncClient().map(lambda chunk: get_values(lookup(chunk), chunk), chunks[1:]):
+            values.update(chunk_values)
+        return values
+
+    def _components(self):
+        # Read user-supplied arguments
+        parser = argparse.ArgumentParser(description='Summarize the vulnerable components of the findings stored '
+                                                     'on DefectDojo (useful for Software Composition Analysis)',
+                                         usage='defectdojo findings components [<args>]')
+        optional = parser._action_groups.pop()
+        required = parser.add_argument_group('required arguments')
+        required.add_argument('--url', help='DefectDojo URL', required=True)
+        required.add_argument('--api_key', help='API v2 Key', required=True)
+        optional.add_argument('--test_id', help='Filter by test')
+        optional.add_argument('--product_id', help='Filter by product')
+        optional.add_argument('--engagement_id', help='Filter by engagement')
+        optional.add_argument('--test_type', help='Filter by test type (can be used multiple times)',
+                              action='append')
+        optional.add_argument('--active', help='Only active findings', action='store_true', dest='active')
+        optional.add_argument('--inactive', help='Only inactive findings', action='store_false', dest='active')
+        optional.add_argument('--tag_test', help='Test tag (can be used multiple times)', action='append')
+        optional.add_argument('--tags_operator', help='Determine the operation to perform when working with '
+                                                      'multiple tags (default = "union")',
+                              default='union', choices=['union', 'intersect'])
+        optional.add_argument('--format', help='Output format (default = "table")', default='table',
+                              choices=['table', 'csv', 'json'])
+        optional.add_argument('--page_size', type=int,
+                              help='Amount of findings requested at a time (default = '+str(Util.page_size)+')')
+        optional.add_argument('--offline', help='Answer from the local mirror (see "defectdojo findings sync") '
+                                                'instead of DefectDojo', action='store_true')
+        optional.add_argument('--db', help='Path of the SQLite database of the local mirror (default = the one '
+                                           'of the DefectDojo URL in the cache directory)')
+        optional.set_defaults(active=None)
+        parser._action_groups.append(optional)
+        # Parse out arguments ignoring the first three (because we're inside a sub_command)
+        args = vars(parser.parse_args(sys.argv[3:]))
+        output_format = args.pop('format')
+
+        # Get components
+        try:
+            components = self.components(**args)
+        except Exception as e:
+            print(str(e), file=sys.stderr)
+            exit(1)
+
+        # Print them
+        headers = ['component', 'version', 'findings', 'max_severity', 'products', 'tests']
+        if output_format == 'json':
+            print(json.dumps(components, indent=4))
+        elif output_format == 'csv':
+            import csv
+            writer = csv.DictWriter(sys.stdout, fieldnames=headers)
+            writer.writeheader()
+            writer.writerows(components)
+        else:
+            table = TableRenderer(['Component', 'Version', 'Findings', 'Max severity', 'Products', 'Tests'],
+                                  plain=len(components) > TableRenderer.plain_threshold,
+                                  sample_size=max(len(components), 1))
+            for component in components:
+                table.add_row([component[header] for header in headers])
+            table.close()
+        exit(0)
+
+    def sync(self, url, api_key, product_id=None, db=None, full=False, page_size=None, **kwargs):
+        from defectdojo_cli.mirror import Mirror
+        return Mirror(url, api_key, path=db).sync(product_ids=product_id, full=full, page_size=page_size)
+
+    def _sync(self):
+        # Read user-supplied arguments
+        parser = argparse.ArgumentParser(description='Update a local SQLite mirror of the findings, tests and '
+                                                     'engagements on DefectDojo, getting only the ones changed '
+                                                     'since the last sync',
+                                         usage='defectdojo findings sync [<args>]')
+        optional = parser._action_groups.pop()
+        required = parser.add_argument_group('required arguments')
+        required.add_argument('--url', help='DefectDojo URL', required=True)
+        required.add_argument('--api_key', help='API v2 Key', required=True)
+        optional.add_argument('--product_id', help='Sync only this product (can be used multiple times)',
+                              action='append')
+        optional.add_argument('--db', help='Path of the SQLite database (default = one per DefectDojo URL '
+                                           'in the cache directory)')
+        optional.add_argument('--full', help='Get all the records again, not only the ones changed since '
+                                             'the last sync, and delete the ones that were deleted on DefectDojo',
+                              action='store_true')
+        optional.add_argument('--page_size', type=int,
+                              help='Amount of records requested at a time (default = '+str(Util.page_size)+')')
+        parser._action_groups.append(optional)
+        # Parse out arguments ignoring the first three (because we're inside a sub_command)
+        args = vars(parser.parse_args(sys.argv[3:]))
+
+        # Sync and print a summary of it
+        try:
+            summary = self.sync(**args)
+        except Exception as e:
+            print('Sync failed: '+str(e), file=sys.stderr)
+            exit(1)
+        print(json.dumps(summary, indent=4))
+        exit(0)
+
     def add_note(self, url, api_key, finding_id, entry, private=None, note_type=None, **kwargs):
         # Prepare parameters
         API_URL = url+'/api/v2/'
@@ -715,31 +1523,66 @@ class Findings(object):
         response = Util().request_apiv2('POST', FINDINGS_ID_NOTES_URL, api_key, data=request_json)
         return response
 
-    def list_multiple_test_types(self, url, api_key, test_types, **kwargs):
+    # Add a note to each finding of a listing (e.g. a PagedResponse) concurrently, starting while the next pages
+    # are still being fetched. 'progress' is called with the amount of findings done and failed after each one.
+    # Returns the amount of notes added, the findings that failed and the error that stopped the listing (if any)
+    def add_notes(self, url, api_key, findings, entry, workers=None, progress=None, **kwargs):
+        summary = {'added': 0, 'failed': list(), 'error': None}
+        lock = threading.Lock()
+        def add_note(finding):
+            try:
+                response = self.add_note(url, api_key, finding['id'], entry, **kwargs)
+                error = None if response.status_code == 201 else str(response.status_code)+' '+response.text[:200]
+            except Exception as e:
+                error = str(e)
+            with lock:
+                if error is None:
+                    summary['added'] += 1
+                else:
+                    summary['failed'].append({'finding_id': finding['id'], 'error': error})
+                if progress is not None:
+                    progress(summary['added'] + len(summary['failed']), len(summary['failed']))
+        try:
+            AsyncClient(workers).map(add_note, findings)
+        except Exception as e: # A page of the listing couldn't be fetched
+            summary['error'] = str(e)
+        return summary
+
+    def list_multiple_test_types(self, url, api_key, test_types, page_size=None, parallel=None,
+                                 pagination=None, resume_after=None, raw=False, projection=None, **kwargs):
+        # The fields to be kept of each finding are 'projection' (kwargs are the request parameters, which may
+        # already have the 'fields' asked to the server)
         # Create parameters to be requested
         request_params = kwargs
         API_URL = url+'/api/v2'
         FINDINGS_URL = API_URL+'/findings/'
-
-        # Get list of json responses
-        json_out_list = list()
+        test_types = sorted(test_types)
+
+        # Newer DefectDojo versions accept a comma separated list of test types, so all of them are listed
+        # with a single paginated query. Older versions reject it (400), so they're listed one by one
+        temp_params = request_params.copy()
+        temp_params['test__test_type'] = ','.join(str(test_type) for test_type in test_types)
+        pages = self.list_pages(FINDINGS_URL, api_key, temp_params, page_size=page_size, parallel=parallel,
+                                pagination=pagination, resume_after=resume_after, raw=raw)
+        if raw: # Unparsed pages can't be merged, so there's no fallback
+            return pages
+        first_page = next(pages)
+        if first_page[0].status_code != 400:
+            return PagedResponse(itertools.chain([first_page], pages), fields=projection)
+        pages.close()
+
+        # Prepare the pages of each test type (nothing is requested yet)
+        pages_list = list()
         for test_type in test_types:
-            request_params['test__test_type'] = test_type
-            response = Util().request_apiv2('GET', FINDINGS_URL, api_key, params=request_params)
-            json_out_list.append(json.loads(response.text))
-
-        # Merge responses
-        json_out_result = dict()
-        json_out_result['count'] = 0
-        json_out_result['results'] = list()
-        for json_out in json_out_list:
-            for finding in json_out['results']:
-                json_out_result['count'] += 1
-                json_out_result['results'].append(finding)
-
-        # Make a request passing the list of test_types so that the url at the tool output works properly
+            temp_params = request_params.copy()
+            temp_params['test__test_type'] = test_type
+            pages_list.append(self.list_pages(FINDINGS_URL, api_key, temp_params, page_size=page_size,
+                                              parallel=parallel, pagination=pagination, resume_after=resume_after))
+        # Mount the URL of a listing of all test types (without requesting it) so that the url at the tool
+        # output works properly
+        import requests
+        request = requests.PreparedRequest()
         request_params['test__test_type'] = test_types
-        response = Util().request_apiv2('GET', FINDINGS_URL, api_key, params=request_params)
-        # Replace the response body with the one we created
-        type(response).text = PropertyMock(return_value=json.dumps(json_out_result))
-        return response
+        request.prepare(method='GET', url=FINDINGS_URL, params=request_params)
+        # Go through the pages of all test types at the same time, merging them
+        return PagedResponse(Util().request_apiv2_pages_merged(pages_list), request=request, fields=projection)
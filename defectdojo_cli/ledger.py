@@ -0,0 +1,78 @@
+import json
+import os
+import time
+import hashlib
+import threading
+from defectdojo_cli.cache import Cache
+
+# Local record of the scan reports uploaded to a DefectDojo URL, so uploading a report that is byte-identical to
+# the last one uploaded to the same engagement/test (with the same settings) can be skipped. Reports are
+# identified by a BLAKE2 hash of their content. It's stored next to the cache, one file per DefectDojo URL
+class UploadLedger(object):
+    # Can be disabled with the DEFECTDOJO_LEDGER environment variable
+    enabled = os.environ.get('DEFECTDOJO_LEDGER', 'true').lower() == 'true'
+    # Uploads can be done by several threads at once (e.g. findings import-batch)
+    _lock = threading.Lock()
+
+    def __init__(self, url):
+        self.url = url
+
+    def ledger_file(self):
+        url_hash = hashlib.sha256(self.url.rstrip('/').encode()).hexdigest()[:16]
+        return os.path.join(Cache.directory, url_hash+'.uploads')
+
+    # Hash of a file, read chunk by chunk so big reports aren't loaded into memory
+    @staticmethod
+    def file_hash(path, chunk_size=1024 * 1024):
+        file_hash = hashlib.blake2b(digest_size=32)
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(chunk_size), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    # Key of an upload: where it goes (e.g. 'test:12' or 'engagement:3') and its settings (e.g. the scanner)
+    @staticmethod
+    def upload_key(target, settings):
+        return target+' '+json.dumps(settings, sort_keys=True)
+
+    def read_file(self):
+        try:
+            with open(self.ledger_file()) as file:
+                return json.load(file)
+        except (OSError, ValueError): # Missing or corrupted file
+            return {'url': self.url, 'uploads': dict()}
+
+    # Get the last successful upload of a key ({'hash', 'test', 'uploaded_at'}) if it had this hash
+    def get(self, key, file_hash):
+        with self._lock:
+            upload = self.read_file()['uploads'].get(key)
+        if upload is not None and upload['hash'] == file_hash:
+            return upload
+        return None
+
+    def record(self, key, file_hash, test_id):
+        with self._lock:
+            ledger_out = self.read_file()
+            ledger_out['uploads'][key] = {'hash': file_hash, 'test': test_id, 'uploaded_at': time.time()}
+            try:
+                os.makedirs(Cache.directory, exist_ok=True)
+                # Write to a temporary file first so other processes never read a partial file
+                tmp_file = self.ledger_file()+'.'+str(os.getpid())+'.tmp'
+                with open(tmp_file, 'w') as file:
+                    json.dump(ledger_out, file)
+                os.replace(tmp_file, self.ledger_file())
+            except OSError: # Worst case the next upload of the same report isn't skipped
+                pass
+
+# Response-like object returned instead of uploading a report that is already on DefectDojo
+class SkippedUploadResponse(object):
+    def __init__(self, upload):
+        self.status_code = 201
+        self.request = None
+        self.json_out = {'test': upload['test'], 'skipped': True,
+                         'reason': 'Same report as the last upload (use --force to upload it anyway)',
+                         'uploaded_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(upload['uploaded_at']))}
+        self.text = json.dumps(self.json_out)
+
+    def json(self):
+        return self.json_out
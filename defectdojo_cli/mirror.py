@@ -0,0 +1,393 @@
+from datetime import datetime, timezone
+import json
+import os
+import re
+import sys
+import sqlite3
+import hashlib
+from defectdojo_cli.util import Util, UsageError
+from defectdojo_cli.cache import Cache
+
+# Local SQLite mirror of the findings, tests and engagements of a DefectDojo instance (or of some of its products).
+# Each sync only asks for the records changed since the previous one (its watermark is the highest change date
+# received) and upserts them in batches, one transaction per page. If the server doesn't send the change date of
+# some records, the next sync gets the whole table again
+class Mirror(object):
+    # Tables that are mirrored: their API endpoints, the field with the date of their last change (and the filter
+    # used to ask only for the records changed after a date), the filter by product and the columns kept besides
+    # the whole JSON of each record
+    TABLES = {
+        'engagements': {
+            'endpoint': '/engagements/',
+            'updated_field': 'updated',
+            'updated_filter': 'updated__gte',
+            'product_filter': 'product',
+            'columns': ['product', 'name', 'status', 'updated'],
+            # Tables joined when querying offline and the columns used by each filter of the API
+            'joins': '',
+            'filters': {
+                'id': 'engagements.id',
+                'name': 'engagements.name',
+                'product': 'engagements.product',
+            },
+        },
+        'tests': {
+            'endpoint': '/tests/',
+            'updated_field': 'updated',
+            'updated_filter': 'updated__gte',
+            'product_filter': 'engagement__product',
+            'columns': ['engagement', 'test_type', 'title', 'updated'],
+            'joins': ' LEFT JOIN engagements ON engagements.id = tests.engagement',
+            # Column with the ID of the record each one belongs to, and its table
+            'parent': ('engagement', 'engagements'),
+            'filters': {
+                'id': 'tests.id',
+                'title': 'tests.title',
+                'engagement': 'tests.engagement',
+                'engagement__product': 'engagements.product',
+                'test_type': 'tests.test_type',
+                'tags': None, # Tags are only in the JSON of the test (see query_pages)
+            },
+        },
+        'findings': {
+            'endpoint': '/findings/',
+            # last_status_update only changes with the status, so other edits (e.g. the title) would be missed
+            'updated_field': 'updated',
+            'updated_filter': 'updated__gte',
+            'product_filter': 'test__engagement__product',
+            'columns': ['test', 'severity', 'title', 'active', 'verified', 'false_p', 'out_of_scope',
+                        'is_mitigated', 'component_name', 'component_version', 'last_status_update'],
+            'joins': ' LEFT JOIN tests ON tests.id = findings.test'
+                     ' LEFT JOIN engagements ON engagements.id = tests.engagement',
+            'parent': ('test', 'tests'),
+            'filters': {
+                'id': 'findings.id',
+                'id__gt': None, # To resume a listing (see query_pages)
+                'test': 'findings.test',
+                'test__engagement': 'tests.engagement',
+                'test__engagement__product': 'engagements.product',
+                'test__test_type': 'tests.test_type',
+                'severity': 'findings.severity',
+                'active': 'findings.active',
+                'is_Mitigated': 'findings.is_mitigated',
+                'false_p': 'findings.false_p',
+                'out_of_scope': 'findings.out_of_scope',
+            },
+        },
+    }
+    # Engagements and tests first, so the findings synced can always be joined with them
+    SYNC_ORDER = ['engagements', 'tests', 'findings']
+    # Mirrors whose age was already reported by this process
+    _reported = set()
+
+    def __init__(self, url, api_key=None, path=None):
+        self.url = url
+        self.api_key = api_key
+        self.path = path if path is not None else self.default_path(url)
+        self.connection = None
+
+    @staticmethod
+    def default_path(url):
+        # One database per DefectDojo URL, next to the cache
+        url_hash = hashlib.sha256(url.rstrip('/').encode()).hexdigest()[:16]
+        return os.path.join(Cache.directory, url_hash+'.sqlite')
+
+    # Open the database, creating it if it doesn't exist (unless 'create' is False, to only read an existing mirror)
+    def connect(self, create=True):
+        if self.connection is None:
+            if not create and not os.path.exists(self.path):
+                raise UsageError('There\'s no local mirror at '+self.path+', create it with: defectdojo findings sync')
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path)
+            self.create_tables()
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def create_tables(self):
+        with self.connection:
+            for table, settings in self.TABLES.items():
+                columns = ', '.join(settings['columns'])
+                self.connection.execute('CREATE TABLE IF NOT EXISTS '+table+' (id INTEGER PRIMARY KEY, '+columns
+                                        +', json TEXT NOT NULL)')
+            # Watermark of each table for each scope ('all' or 'product:<id>')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS sync_state (table_name TEXT, scope TEXT, '
+                                    'watermark TEXT, synced_at TEXT, PRIMARY KEY (table_name, scope))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS findings_test ON findings (test)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS tests_engagement ON tests (engagement)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS engagements_product ON engagements (product)')
+
+    def get_watermark(self, table, scope):
+        row = self.connect().execute('SELECT watermark FROM sync_state WHERE table_name = ? AND scope = ?',
+                                     (table, scope)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_watermark(self, table, scope, watermark):
+        with self.connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, datetime('now'))",
+                               (table, scope, watermark))
+
+    def upsert(self, table, records):
+        if not records:
+            return
+        columns = self.TABLES[table]['columns']
+        rows = list()
+        for record in records:
+            row = [record['id']]
+            for column in columns:
+                value = record.get(column)
+                if type(value) in (dict, list):
+                    value = json.dumps(value)
+                row.append(value)
+            row.append(json.dumps(record))
+            rows.append(row)
+        placeholders = ', '.join(['?'] * (len(columns) + 2))
+        # The whole batch is written in a single transaction
+        with self.connect() as connection:
+            connection.executemany('INSERT OR REPLACE INTO '+table+' VALUES ('+placeholders+')', rows)
+
+    # Sync a table, returning the amount of records received and the new watermark. When all the records are
+    # received (the first sync, --full, or when there's no watermark) the ones that aren't on DefectDojo anymore
+    # are deleted. Incremental syncs only get the records that changed, so they can't see deletions
+    def sync_table(self, table, product_id=None, full=False, page_size=None):
+        settings = self.TABLES[table]
+        scope = 'product:'+str(product_id) if product_id is not None else 'all'
+        watermark = None if full else self.get_watermark(table, scope)
+        if watermark is None:
+            # IDs received, to delete the other records of the scope at the end
+            with self.connect() as connection:
+                connection.execute('CREATE TEMP TABLE IF NOT EXISTS received_ids (id INTEGER PRIMARY KEY)')
+                connection.execute('DELETE FROM received_ids')
+        request_params = dict()
+        if product_id is not None:
+            request_params[settings['product_filter']] = product_id
+        if watermark is not None:
+            # Records changed at the watermark itself are asked again, as others may have changed at the same time
+            request_params[settings['updated_filter']] = watermark
+
+        # Keyset pagination, so records that change while syncing don't shift the pages
+        fetched = 0
+        new_watermark = watermark
+        new_watermark_date = self.parse_date(watermark)
+        all_dated = True
+        pages = Util().request_apiv2_pages_keyset(self.url+'/api/v2'+settings['endpoint'], self.api_key,
+                                                  params=request_params, page_size=page_size)
+        for response, json_out in pages:
+            if json_out is None:
+                raise Exception('Failed to sync '+table+' ('+str(response.status_code)+'): '+response.text)
+            self.upsert(table, json_out['results'])
+            fetched += len(json_out['results'])
+            if watermark is None:
+                with self.connect() as connection:
+                    connection.executemany('INSERT OR IGNORE INTO received_ids VALUES (?)',
+                                           [(record['id'],) for record in json_out['results']])
+            for record in json_out['results']:
+                updated = record.get(settings['updated_field'])
+                updated_date = self.parse_date(updated)
+                if updated_date is None: # The server doesn't have the change date of this record
+                    all_dated = False
+                elif new_watermark_date is None or updated_date > new_watermark_date:
+                    # The date is kept as sent by the server, to be sent back as is on the next sync
+                    new_watermark = updated
+                    new_watermark_date = updated_date
+        # The watermark is only moved after the whole table was synced, so an interrupted sync is redone.
+        # Without the change dates of all the records there's no safe watermark, so the next sync is a full one
+        if not all_dated:
+            new_watermark = None
+        if new_watermark is not None or not all_dated:
+            self.set_watermark(table, scope, new_watermark)
+        if watermark is None:
+            self.prune(table, product_id)
+        return fetched, new_watermark
+
+    # Delete the records of a scope that weren't received by a full sync (see sync_table), and the ones whose
+    # engagement or test was deleted
+    def prune(self, table, product_id=None):
+        settings = self.TABLES[table]
+        query = ('SELECT '+table+'.id FROM '+table+settings['joins']+' WHERE '+table+'.id NOT IN (SELECT id FROM '
+                 'received_ids)')
+        values = list()
+        if product_id is not None:
+            query += ' AND '+settings['filters'][settings['product_filter']]+' = ?'
+            values.append(int(product_id))
+        with self.connect() as connection:
+            connection.execute('DELETE FROM '+table+' WHERE id IN ('+query+')', values)
+            if 'parent' in settings:
+                column, parent_table = settings['parent']
+                connection.execute('DELETE FROM '+table+' WHERE '+column+' NOT IN (SELECT id FROM '+parent_table+')')
+            connection.execute('DELETE FROM received_ids')
+
+    # Parse an ISO 8601 date of the API (e.g. '2024-01-31T10:00:00.123Z'), returning None if it isn't one.
+    # Dates without a timezone are taken as UTC
+    @staticmethod
+    def parse_date(value):
+        if not value:
+            return None
+        match = re.match(r'^(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2})?)(?:\.(\d+))?(Z|[+-]\d{2}:?\d{2})?$',
+                         str(value).strip())
+        if match is None:
+            return None
+        date, fraction, offset = match.groups()
+        # fromisoformat only accepts 3 or 6 decimals and no 'Z' before python 3.11
+        if fraction:
+            date += '.'+fraction[:6].ljust(6, '0')
+        if offset and offset != 'Z':
+            date += offset if ':' in offset else offset[:3]+':'+offset[3:]
+        try:
+            parsed = datetime.fromisoformat(date)
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed
+
+    def sync(self, product_ids=None, full=False, page_size=None):
+        summary = dict()
+        try:
+            for product_id in (product_ids or [None]):
+                for table in self.SYNC_ORDER:
+                    fetched, watermark = self.sync_table(table, product_id=product_id, full=full,
+                                                         page_size=page_size)
+                    table_summary = summary.setdefault(table, {'fetched': 0, 'watermarks': dict()})
+                    table_summary['fetched'] += fetched
+                    table_summary['watermarks'][str(product_id) if product_id is not None else 'all'] = watermark
+        finally:
+            self.close()
+        return summary
+
+    # Get the time of the last sync of a table for the products queried (None for all of them), failing if they
+    # weren't synced. If some products were synced at different times, the oldest time is returned
+    def get_synced_at(self, table, product_ids=None):
+        scopes = dict(self.connect(create=False).execute('SELECT scope, synced_at FROM sync_state WHERE table_name = ?',
+                                                         (table,)).fetchall())
+        if not scopes:
+            raise UsageError('The local mirror ('+self.path+') has no '+table+', create it with: defectdojo findings '
+                             'sync')
+        if 'all' in scopes:
+            synced_at = scopes['all']
+        elif product_ids is None:
+            products = sorted(scope.split(':', 1)[1] for scope in scopes)
+            raise UsageError('The local mirror ('+self.path+') only has the '+table+' of some products ('
+                             +', '.join(products)+'), filter by one of them or sync all of them with: defectdojo '
+                             'findings sync')
+        else:
+            missing = [str(product_id) for product_id in product_ids if 'product:'+str(product_id) not in scopes]
+            if missing:
+                raise UsageError('The '+table+' of product '+', '.join(missing)+' are not on the local mirror ('
+                                 +self.path+'), sync them with: defectdojo findings sync --product_id '
+                                 +' --product_id '.join(missing))
+            synced_at = min(scopes['product:'+str(product_id)] for product_id in product_ids)
+        return datetime.strptime(synced_at, '%Y-%m-%d %H:%M:%S')
+
+    # Get the IDs of test types from the tests on the mirror. Raises an exception with all the names that don't
+    # have any test
+    def get_test_type_ids(self, names):
+        placeholders = ', '.join(['?'] * len(names))
+        index = dict(self.connect(create=False).execute("SELECT DISTINCT json_extract(json, '$.test_type_name'), test_type "
+                                            "FROM tests WHERE json_extract(json, '$.test_type_name') IN ("
+                                            +placeholders+')', list(names)).fetchall())
+        missing = [name for name in names if name not in index]
+        if missing:
+            raise UsageError('Unknown test types (on the local mirror): '+', '.join(sorted(set(missing))))
+        return [index[name] for name in names]
+
+    @staticmethod
+    def filter_values(value):
+        # Values can be lists or comma separated strings, and IDs are stored as integers
+        values = value if type(value) in (list, tuple, set) else str(value).split(',')
+        return [int(value) if str(value).isdigit() else value for value in values]
+
+    @staticmethod
+    def boolean_value(value):
+        # The API uses 2 for true and 3 for false on some boolean filters
+        return str(value).lower() in ('2', 'true')
+
+    # Generator that answers a listing of the API from the mirror, yielding pages like Util.request_apiv2_pages
+    # (with response-like objects). 'params' are the same parameters that would be sent to the API at 'url'
+    def query_pages(self, table, url, params=dict(), page_size=None):
+        settings = self.TABLES[table]
+        params = dict(params)
+        limit = params.pop('limit', None)
+        offset = params.pop('offset', None)
+        params.pop('fields', None) # Fields are projected by PagedResponse
+        conditions = list()
+        values = list()
+        for name, value in params.items():
+            if name not in settings['filters']:
+                raise UsageError('The '+name+' filter can\'t be used offline')
+            column = settings['filters'][name]
+            if name == 'tags':
+                tags = self.filter_values(value)
+                conditions.append("EXISTS (SELECT 1 FROM json_each("+table+".json, '$.tags') WHERE json_each.value "
+                                  'IN ('+', '.join(['?'] * len(tags))+'))')
+                values.extend(tags)
+            elif name == 'id__gt':
+                conditions.append(table+'.id > ?')
+                values.append(int(value))
+            elif name in ('active', 'is_Mitigated', 'false_p', 'out_of_scope'):
+                conditions.append(column+' = ?')
+                values.append(1 if self.boolean_value(value) else 0)
+            else:
+                filter_values = self.filter_values(value)
+                conditions.append(column+' IN ('+', '.join(['?'] * len(filter_values))+')')
+                values.extend(filter_values)
+        query = ' FROM '+table+settings['joins']
+        if conditions:
+            query += ' WHERE '+' AND '.join(conditions)
+
+        # Tell how old the data is (once per process)
+        product_ids = None
+        if settings['product_filter'] in params:
+            product_ids = self.filter_values(params[settings['product_filter']])
+        synced_at = self.get_synced_at(table, product_ids)
+        age = datetime.now(timezone.utc).replace(tzinfo=None) - synced_at
+        if self.path not in self._reported:
+            self._reported.add(self.path)
+            print('Using the local mirror synced '+str(int(age.total_seconds() // 60))+' minutes ago ('
+                  +synced_at.strftime('%Y-%m-%d %H:%M:%S')+' UTC)', file=sys.stderr)
+
+        connection = self.connect(create=False)
+        count = connection.execute('SELECT COUNT(*)'+query, values).fetchone()[0]
+        query = 'SELECT '+table+'.json'+query+' ORDER BY '+table+'.id'
+        if limit is not None:
+            query += ' LIMIT '+str(int(limit))+' OFFSET '+str(int(offset or 0))
+            page_size = int(limit)
+        page_size = page_size if page_size else Util.page_size
+        request = self.prepare_request(url, dict(params, limit=limit, offset=offset))
+        cursor = connection.execute(query, values)
+        while True:
+            rows = cursor.fetchmany(page_size)
+            json_out = dict()
+            json_out['count'] = count
+            json_out['next'] = None
+            json_out['previous'] = None
+            json_out['results'] = [json.loads(row[0]) for row in rows]
+            yield MirrorResponse(request, json_out), json_out
+            if len(rows) < page_size:
+                return
+
+    @staticmethod
+    def prepare_request(url, params):
+        # URL of the same listing on the API (e.g. to mount links to DefectDojo)
+        import requests
+        request = requests.PreparedRequest()
+        request.prepare(method='GET', url=url, params={name: value for name, value in params.items()
+                                                       if value is not None})
+        return request
+
+# Response-like object for the pages read from the mirror, so they can be used as the responses of the API
+class MirrorResponse(object):
+    def __init__(self, request, json_out):
+        self.status_code = 200
+        self.request = request
+        self.url = request.url
+        self.json_out = json_out
+
+    @property
+    def text(self):
+        return json.dumps(self.json_out)
@@ -0,0 +1,387 @@
+import json
+import re
+import fnmatch
+from defectdojo_cli.util import SEVERITIES, UsageError
+
+# Copies a JSON document while it's read, decoding only the values at some paths (e.g. the elements of a list of
+# findings) and dropping the array elements rejected by their callback. Paths are tuples of object keys, with '*'
+# for array elements, e.g. ('runs', '*', 'results', '*'). Everything else is copied as it is (only the whitespace
+# between them changes), so the document is never loaded into memory as a whole. If 'output' is None nothing is
+# written (e.g. to only go through the findings)
+class JsonArrayFilter(object):
+    WHITESPACE = re.compile(r'\s*')
+    # Quotes and brackets, the only characters that matter when copying a value without decoding it
+    STRUCTURE = re.compile(r'["\[\]{}]')
+    # Rest of a string, after its opening quote
+    STRING_END = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+    SCALAR = re.compile(r'[^\s,:\]}]+')
+
+    def __init__(self, targets, chunk_size=1024 * 1024):
+        # {path: callback}, the callback is called with each decoded value and returns whether to keep it
+        self.targets = targets
+        # Paths containing a target, the only ones that have to be parsed
+        self.prefixes = set(path[:i] for path in targets for i in range(len(path)))
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+
+    def filter(self, source, output=None):
+        self.source = source
+        self.output = output
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.value(())
+        if self.peek(required=False) is not None:
+            raise ValueError('Extra data after the end of the JSON document')
+
+    # Read more of the source, discarding what was already consumed. Returns False at the end of the source
+    def fill(self):
+        # Read at least as much as there's already buffered, so values bigger than a chunk don't take too many tries
+        chunk = self.source.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:]+chunk
+        self.pos = 0
+        return True
+
+    # Consume the buffer up to 'end', writing it to the output unless 'copy' is False
+    def emit(self, end, copy=True):
+        if copy and self.output is not None:
+            self.output.write(self.buf[self.pos:end])
+        self.pos = end
+
+    # Get the next character that isn't whitespace (the whitespace is dropped)
+    def peek(self, required=True):
+        while True:
+            self.pos = self.WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                if required:
+                    raise ValueError('Unexpected end of the JSON document')
+                return None
+
+    # Decode the value at the current position, returning it and where it ends
+    def decode(self):
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number at the end of the buffer may continue on the next chunk
+                if end < len(self.buf) or self.eof:
+                    return value, end
+            except ValueError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def value(self, path):
+        char = self.peek()
+        if path in self.targets:
+            value, end = self.decode()
+            self.targets[path](value)
+            self.emit(end)
+        elif path not in self.prefixes:
+            self.copy()
+        elif char == '{':
+            self.object(path)
+        elif char == '[':
+            self.array(path)
+        else:
+            self.copy()
+
+    def object(self, path):
+        self.emit(self.pos + 1)
+        if self.peek() == '}':
+            self.emit(self.pos + 1)
+            return
+        while True:
+            key, end = self.decode()
+            self.emit(end)
+            if self.peek() != ':':
+                raise ValueError('Expected ":" at position '+str(self.pos))
+            self.emit(self.pos + 1)
+            self.value(path + (key,))
+            char = self.peek()
+            self.emit(self.pos + 1)
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError('Expected "," or "}" at position '+str(self.pos))
+            self.peek()
+
+    def array(self, path):
+        element_path = path + ('*',)
+        callback = self.targets.get(element_path)
+        self.emit(self.pos + 1)
+        if self.peek() == ']':
+            self.emit(self.pos + 1)
+            return
+        # Commas are written before each element that is kept (but the first one)
+        empty = True
+        while True:
+            if callback is not None:
+                value, end = self.decode()
+                keep = callback(value) is not False
+                if keep and not empty and self.output is not None:
+                    self.output.write(',')
+                self.emit(end, copy=keep)
+                empty = empty and not keep
+            else:
+                if not empty and self.output is not None:
+                    self.output.write(',')
+                self.value(element_path)
+                empty = False
+            char = self.peek()
+            if char == ']':
+                self.emit(self.pos + 1)
+                return
+            if char != ',':
+                raise ValueError('Expected "," or "]" at position '+str(self.pos))
+            self.emit(self.pos + 1, copy=False)
+            self.peek()
+
+    # Copy the value at the current position without decoding it
+    def copy(self):
+        char = self.buf[self.pos]
+        if char not in '"[{':
+            while True:
+                match = self.SCALAR.match(self.buf, self.pos)
+                if match.end() < len(self.buf) or self.eof:
+                    self.emit(match.end())
+                    return
+                self.fill()
+        depth = 0
+        pos = self.pos
+        while True:
+            match = self.STRUCTURE.search(self.buf, pos)
+            if match is None:
+                self.emit(len(self.buf))
+                if not self.fill():
+                    raise ValueError('Unexpected end of the JSON document')
+                pos = self.pos
+                continue
+            char = match.group()
+            if char == '"':
+                string_end = self.STRING_END.match(self.buf, match.end())
+                if string_end is None: # The string continues on the next chunk
+                    self.emit(match.start())
+                    if not self.fill():
+                        raise ValueError('Unexpected end of the JSON document')
+                    pos = self.pos
+                    continue
+                pos = string_end.end()
+            elif char in '[{':
+                depth += 1
+                pos = match.end()
+            else:
+                depth -= 1
+                pos = match.end()
+            if depth == 0:
+                self.emit(pos)
+                return
+
+# Same as JsonArrayFilter for XML documents: elements with a given name (e.g. 'vulnerability') are passed to the
+# callback, as a dict with the text of their children, and dropped if it returns False. The rest of the document
+# is copied as it's read (comments are dropped)
+class XmlElementFilter(object):
+    def __init__(self, element_name, callback):
+        self.element_name = element_name
+        self.callback = callback
+
+    def filter(self, source, output=None):
+        # Only imported when needed, as most commands don't parse XML
+        import xml.sax
+        from xml.sax.saxutils import XMLGenerator
+        from xml.sax.handler import ContentHandler
+
+        element_name = self.element_name
+        callback = self.callback
+        generator = XMLGenerator(output, encoding='utf-8', short_empty_elements=True) if output else ContentHandler()
+
+        class Handler(ContentHandler):
+            def __init__(self):
+                ContentHandler.__init__(self)
+                # Events of the element being read, replayed once it's known whether it's kept
+                self.events = None
+                self.depth = 0
+                self.fields = dict()
+                self.text = list()
+
+            def startDocument(self):
+                generator.startDocument()
+
+            def endDocument(self):
+                generator.endDocument()
+
+            def startElement(self, name, attrs):
+                if self.events is None and name == element_name:
+                    self.events = list()
+                    self.depth = 0
+                    self.fields = dict(attrs)
+                if self.events is None:
+                    generator.startElement(name, attrs)
+                    return
+                self.events.append((generator.startElement, name, attrs.copy()))
+                self.depth += 1
+                self.text = list()
+
+            def endElement(self, name):
+                if self.events is None:
+                    generator.endElement(name)
+                    return
+                self.events.append((generator.endElement, name))
+                self.depth -= 1
+                # Keep the text of the direct children of the element
+                if self.depth == 1:
+                    self.fields.setdefault(name, ''.join(self.text).strip())
+                if self.depth == 0:
+                    events, self.events = self.events, None
+                    if callback(self.fields) is not False:
+                        for event in events:
+                            event[0](*event[1:])
+
+            def characters(self, content):
+                if self.events is None:
+                    generator.characters(content)
+                    return
+                self.events.append((generator.characters, content))
+                self.text.append(content)
+
+            def ignorableWhitespace(self, content):
+                self.characters(content)
+
+            def processingInstruction(self, target, data):
+                if self.events is None:
+                    generator.processingInstruction(target, data)
+
+        parser = xml.sax.make_parser()
+        # Don't resolve external entities
+        parser.setFeature(xml.sax.handler.feature_external_ges, False)
+        parser.setContentHandler(Handler())
+        parser.parse(source)
+
+# Findings of the scan reports that can be read locally (without DefectDojo), for the scanners of DefectDojo
+# with a common format. A report can be filtered (e.g. by severity) while it's copied, or only gone through to
+# count its findings
+class ScanReport(object):
+    # DefectDojo scanners that can be read and the format of their reports
+    SCANNERS = {
+        'SARIF': 'sarif',
+        'Trivy Scan': 'trivy',
+        'Dependency Check Scan': 'dependency_check',
+        'ZAP Scan': 'zap',
+    }
+    # Severity of each SARIF level (as DefectDojo sees it)
+    SARIF_LEVELS = {'none': 'Info', 'note': 'Info', 'warning': 'Medium', 'error': 'High'}
+
+    def __init__(self, scanner, min_severity=None, include_rules=None, exclude_rules=None):
+        if scanner not in self.SCANNERS:
+            raise UsageError('Reading the report of "'+str(scanner)+'" locally is not supported (supported '
+                            'scanners: '+', '.join(sorted(self.SCANNERS))+')')
+        self.format = self.SCANNERS[scanner]
+        # 'Informational' is accepted too, as it's the name used by reimport
+        if min_severity == 'Informational':
+            min_severity = 'Info'
+        self.min_severity = SEVERITIES.index(min_severity) if min_severity is not None else 0
+        self.include_rules = include_rules or list()
+        self.exclude_rules = exclude_rules or list()
+        # Findings of each severity (indexed like SEVERITIES) found and kept
+        self.found = [0] * len(SEVERITIES)
+        self.kept = [0] * len(SEVERITIES)
+        # Rules of the SARIF run being read, {rule ID: rule}
+        self.sarif_rules = dict()
+
+    # Copy the report from 'source' to 'output' (both binary files) keeping only the findings that pass the
+    # filters. If 'output' is None the report is only read (e.g. to get the amount of findings of each severity)
+    def filter(self, source, output=None):
+        if self.format in ('sarif', 'trivy'):
+            import io
+            text_source = io.TextIOWrapper(source, encoding='utf-8-sig')
+            text_output = io.TextIOWrapper(output, encoding='utf-8') if output is not None else None
+            try:
+                JsonArrayFilter(getattr(self, self.format+'_targets')()).filter(text_source, text_output)
+            finally:
+                if text_output is not None:
+                    text_output.detach()
+                text_source.detach()
+        elif self.format == 'dependency_check':
+            XmlElementFilter('vulnerability', self.dependency_check_finding).filter(source, output)
+        else:
+            XmlElementFilter('alertitem', self.zap_finding).filter(source, output)
+
+    # Count a finding and return whether it passes the filters
+    def check(self, severity, rule_id):
+        self.found[severity] += 1
+        if severity < self.min_severity:
+            return False
+        rule_id = str(rule_id)
+        if self.include_rules and not any(fnmatch.fnmatchcase(rule_id, rule) for rule in self.include_rules):
+            return False
+        if any(fnmatch.fnmatchcase(rule_id, rule) for rule in self.exclude_rules):
+            return False
+        self.kept[severity] += 1
+        return True
+
+    @staticmethod
+    def cvss_severity(score):
+        score = float(score)
+        if score >= 9:
+            return SEVERITIES.index('Critical')
+        if score >= 7:
+            return SEVERITIES.index('High')
+        if score >= 4:
+            return SEVERITIES.index('Medium')
+        if score > 0:
+            return SEVERITIES.index('Low')
+        return SEVERITIES.index('Info')
+
+    def sarif_targets(self):
+        return {('runs', '*', 'tool'): self.sarif_tool, ('runs', '*', 'results', '*'): self.sarif_finding}
+
+    def sarif_tool(self, tool):
+        # The rules come before the results in the reports of all common tools
+        self.sarif_rules = dict()
+        for component in [tool.get('driver', dict())] + tool.get('extensions', list()):
+            for rule in component.get('rules', list()):
+                self.sarif_rules[rule.get('id')] = rule
+
+    def sarif_finding(self, result):
+        rule = self.sarif_rules.get(result.get('ruleId'), dict())
+        # The CVSS score of the result or its rule, or the level (of the result or the default of its rule)
+        score = result.get('properties', dict()).get('security-severity',
+                                                     rule.get('properties', dict()).get('security-severity'))
+        try:
+            severity = self.cvss_severity(score)
+        except (TypeError, ValueError):
+            level = result.get('level', rule.get('defaultConfiguration', dict()).get('level'))
+            severity = SEVERITIES.index(self.SARIF_LEVELS.get(level, 'Medium'))
+        return self.check(severity, result.get('ruleId'))
+
+    def trivy_targets(self):
+        targets = dict()
+        for kind in ['Vulnerabilities', 'Misconfigurations', 'Secrets']:
+            targets[('Results', '*', kind, '*')] = self.trivy_finding
+            # Reports made before Trivy 0.20 are a list of results
+            targets[('*', kind, '*')] = self.trivy_finding
+        return targets
+
+    def trivy_finding(self, finding):
+        severity = str(finding.get('Severity', '')).capitalize()
+        severity = SEVERITIES.index(severity) if severity in SEVERITIES else 0 # UNKNOWN
+        return self.check(severity, finding.get('VulnerabilityID', finding.get('ID', finding.get('RuleID'))))
+
+    def dependency_check_finding(self, vulnerability):
+        severity = vulnerability.get('severity', '').capitalize()
+        if severity == 'Moderate':
+            severity = 'Medium'
+        severity = SEVERITIES.index(severity) if severity in SEVERITIES else 0
+        return self.check(severity, vulnerability.get('name'))
+
+    def zap_finding(self, alert):
+        # The risk codes are 0 (Informational), 1 (Low), 2 (Medium) and 3 (High), like the start of SEVERITIES
+        try:
+            severity = min(max(int(alert.get('riskcode')), 0), SEVERITIES.index('High'))
+        except (TypeError, ValueError):
+            severity = 0
+        return self.check(severity, alert.get('pluginid'))
@@ -0,0 +1,109 @@
+import io
+import os
+import sys
+import shlex
+import subprocess
+
+# Table printed row by row, as the rows are added, instead of measuring all of them first. The column widths are
+# taken from the first 'sample_size' rows and 'min_widths', so columns whose size is known beforehand should get it
+# in 'min_widths'. Cells that are wider later on are truncated, to keep the borders aligned.
+# Small tables look like tabulate's fancy_grid, tables with more than 'plain_threshold' rows use a leaner format
+class TableRenderer(object):
+    # Can be changed with the DEFECTDOJO_TABLE_PLAIN_ROWS environment variable
+    plain_threshold = int(os.environ.get('DEFECTDOJO_TABLE_PLAIN_ROWS', 1000))
+
+    def __init__(self, headers, stream=None, sample_size=100, plain=False, min_widths=None):
+        self.headers = [str(header) for header in headers]
+        self.min_widths = min_widths if min_widths is not None else [0] * len(self.headers)
+        self.stream = stream if stream is not None else sys.stdout
+        self.sample_size = sample_size
+        self.plain = plain
+        self.widths = None
+        self.sample = list()
+        self.rows = 0
+
+    def add_row(self, row):
+        row = ['' if cell is None else str(cell) for cell in row]
+        if self.widths is None:
+            self.sample.append(row)
+            if len(self.sample) >= self.sample_size:
+                self.start()
+        else:
+            self.write_row(row)
+
+    def start(self):
+        # Like tabulate, columns are 2 characters wider than their headers (except in the lean format)
+        padding = 0 if self.plain else 2
+        self.widths = [max(len(header) + padding, width) for header, width in zip(self.headers, self.min_widths)]
+        for row in self.sample:
+            for i, cell in enumerate(row):
+                self.widths[i] = max(self.widths[i], len(cell))
+        if self.plain:
+            self.stream.write(self.line(self.headers)+'\n')
+            self.stream.write('  '.join('-' * width for width in self.widths)+'\n')
+        else:
+            self.stream.write(self.border('╒', '═', '╤', '╕')+'\n')
+            self.stream.write(self.line(self.headers)+'\n')
+            self.stream.write(self.border('╞', '═', '╪', '╡')+'\n')
+        for row in self.sample:
+            self.write_row(row)
+        self.sample = None
+
+    def write_row(self, row):
+        row = [cell if len(cell) <= width else self.truncate(cell, width) for cell, width in zip(row, self.widths)]
+        if not self.plain and self.rows > 0:
+            self.stream.write(self.border('├', '─', '┼', '┤')+'\n')
+        self.stream.write(self.line(row)+'\n')
+        self.rows += 1
+
+    @staticmethod
+    def truncate(cell, width):
+        if width > 3:
+            return cell[:width - 3]+'...'
+        return cell[:width]
+
+    def line(self, cells):
+        cells = [cell.ljust(width) for cell, width in zip(cells, self.widths)]
+        if self.plain:
+            return '  '.join(cells).rstrip()
+        return '│ '+' │ '.join(cells)+' │'
+
+    def border(self, left, fill, middle, right):
+        return left+middle.join(fill * (width + 2) for width in self.widths)+right
+
+    # Print the rows still in the sample and the end of the table
+    def close(self):
+        if self.widths is None:
+            self.start()
+        if not self.plain:
+            self.stream.write(self.border('╘', '═', '╧', '╛')+'\n')
+        self.stream.flush()
+
+# Output stream that goes through a pager (the PAGER environment variable, or 'less') when stdout is a terminal,
+# and is stdout otherwise. If the pager is closed before all the output is written, the rest is discarded
+class Pager(object):
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.process = None
+        self.stream = sys.stdout
+
+    def __enter__(self):
+        pager = os.environ.get('PAGER', 'less -FRX')
+        if self.enabled and sys.stdout.isatty() and pager and pager != 'cat':
+            try:
+                self.process = subprocess.Popen(shlex.split(pager), stdin=subprocess.PIPE)
+                self.stream = io.TextIOWrapper(self.process.stdin, encoding=sys.stdout.encoding or 'utf-8',
+                                               errors='replace')
+            except OSError: # Pager not found
+                self.process = None
+        return self.stream
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.process is not None:
+            try:
+                self.stream.close()
+            except BrokenPipeError:
+                pass
+            self.process.wait()
+        # The pager was closed by the user
+        return exc_type is BrokenPipeError and self.process is not None
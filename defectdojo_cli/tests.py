@@ -2,10 +2,8 @@ from datetime import datetime
 import json
 import sys
 import argparse
-import requests
-from unittest.mock import PropertyMock
-from tabulate import tabulate
-from defectdojo_cli.util import Util
+from defectdojo_cli.util import Util, PagedResponse, AsyncClient, UsageError
+from defectdojo_cli.cache import Cache
 
 class Tests(object):
     def parse_cli_args(self):
@@ -25,11 +23,23 @@ class Tests(object):
         # Get sub_command
         args = parser.parse_args(sys.argv[2:3])
         # Use dispatch pattern to invoke method with same name (that starts with _)
-        getattr(self, '_'+args.sub_command)()
+        try:
+            getattr(self, '_'+args.sub_command)()
+        except UsageError as e:
+            print(str(e), file=sys.stderr)
+            exit(1)
+        except Exception as e:
+            # Requests that still failed after being retried (e.g. connection refused) are printed without a traceback
+            message = Util.request_failure(e)
+            if message is None:
+                raise
+            print(message, file=sys.stderr)
+            exit(1)
 
 
     def list(self, url, api_key, test_id=None, title=None, engagement_id=None,
-             test_type=None, tag=None, limit=None, **kwargs):
+             test_type=None, tag=None, limit=None, page_size=None, parallel=None, offline=False, db=None,
+             **kwargs):
         # Create parameters to be requested
         request_params = dict()
         API_URL = url+'/api/v2'
@@ -44,13 +54,13 @@ class Tests(object):
             # In order to filter test_type we need to get its ID via API
             if type(test_type) is int:
                 test_type_id = test_type
+            elif offline:
+                # Get the ID from the tests on the local mirror
+                from defectdojo_cli.mirror import Mirror
+                test_type_id = Mirror(url, path=db).get_test_type_ids([test_type])[0]
             else:
-                temp_params = dict()
-                temp_params['name'] = test_type
-                # Make a get request to /test_types passing the test_type as parameter
-                temp_response = Util().request_apiv2('GET', API_URL+'/test_types/', api_key, params=temp_params)
-                # Tranform the above response in json and get the id
-                test_type_id = json.loads(temp_response.text)['results'][0]['id']
+                # Get the ID from the cached test types
+                test_type_id = Cache(url, api_key).get_ids('test_types', [test_type])[0]
             # Add to request_params
             request_params['test_type'] = test_type_id
         if tag is not None:
@@ -60,19 +70,21 @@ class Tests(object):
                 request_params['tags'] = tag
         if limit is not None:
             request_params['limit'] = limit
-        else:
-            # Make a request to API getting only one test to retrieve the total amount of tests
-            temp_params = request_params.copy()
-            temp_params['url'] = url
-            temp_params['api_key'] = api_key
-            temp_params['limit'] = 1
-            temp_response = self.list(**temp_params)
-            limit = int(json.loads(temp_response.text)['count'])
-            request_params['limit'] = limit
 
-        # Make request
-        response = Util().request_apiv2('GET', TESTS_URL, api_key, params=request_params)
-        return response
+        if offline:
+            # Answer from the local mirror instead of DefectDojo
+            from defectdojo_cli.mirror import Mirror
+            return PagedResponse(Mirror(url, path=db).query_pages('tests', TESTS_URL, request_params,
+                                                                  page_size=page_size))
+
+        # Make request (going through all the pages unless a limit was passed)
+        if parallel and limit is None:
+            pages = Util().request_apiv2_pages_parallel(TESTS_URL, api_key, params=request_params,
+                                                        page_size=page_size, workers=parallel)
+        else:
+            pages = Util().request_apiv2_pages(TESTS_URL, api_key, params=request_params,
+                                               page_size=page_size, follow=(limit is None))
+        return PagedResponse(pages)
 
 
     def _list(self):
@@ -112,6 +124,19 @@ class Tests(object):
             '--limit',
             help='Number of results to return (by default it gets all the tests)'
         )
+        optional.add_argument(
+            '--page_size', type=int,
+            help='Amount of tests requested at a time when getting all the tests '
+                 '(default = '+str(Util.page_size)+')'
+        )
+        optional.add_argument(
+            '--parallel', type=int, metavar='N',
+            help='Request up to N pages of tests in parallel when getting all the tests'
+        )
+        optional.add_argument('--offline', help='Answer from the local mirror (see "defectdojo findings sync") '
+                                                'instead of DefectDojo', action='store_true')
+        optional.add_argument('--db', help='Path of the SQLite database of the local mirror (default = the one '
+                                           'of the DefectDojo URL in the cache directory)')
         optional.set_defaults(active=None, valid=None, scope=None)
         parser._action_groups.append(optional)
         # Parse out arguments ignoring the first three (because we're inside a sub-command)
@@ -129,41 +154,38 @@ class Tests(object):
         Util().default_output(response, sucess_status_code=200)
 
 
-    def get_test_type_by_tags(self, url, api_key, tags, tags_operator, engagement_id=None):
+    def get_test_type_by_tags(self, url, api_key, tags, tags_operator, engagement_id=None, offline=False, db=None):
         # First make a request to API getting all test types with the tags we're looking for
         request_params = dict()
         request_params['url'] = url
         request_params['api_key'] = api_key
+        request_params['offline'] = offline
+        request_params['db'] = db
         if engagement_id:
             request_params['engagement_id'] = engagement_id
 
         if tags_operator == 'union': # Default behaviour
             request_params['tag'] = tags
             response = self.list(**request_params)
-            # Parse output
-            json_out = json.loads(response.text)
-            results = json_out['results']
             # Create set of all test types from the tag
             test_type_set = set()
-            for test in results:
+            for test in response:
                 test_type_set.add(test['test_type_name'])
             # Transform set to list
             test_type_list = list(test_type_set)
 
         elif tags_operator == 'intersect':
-            test_type_list_of_sets = list()
-            for tag in tags:
-                request_params['tag'] = tag
-                response = self.list(**request_params)
-                # Parse output
-                json_out = json.loads(response.text)
-                results = json_out['results']
+            def get_test_types(tag):
+                tag_params = request_params.copy()
+                tag_params['tag'] = tag
+                response = self.list(**tag_params)
                 # Create set of all test types from the tag
                 test_type_set = set()
-                for test in results:
+                for test in response:
                     test_type_set.add(test['test_type'])
-                # Add set of test_type to list
-                test_type_list_of_sets.append(test_type_set)
+                return test_type_set
+            # Get the set of test_type of each tag at the same time
+            test_type_list_of_sets = AsyncClient().map(get_test_types, tags)
 
             # Get intersection between all sets
             test_type_intersection = test_type_list_of_sets[0]
@@ -408,12 +430,8 @@ class Tests(object):
             if type(test_type) is int:
                 test_type_id = test_type
             else:
-                temp_params = dict()
-                temp_params['name'] = test_type
-                # Make a get request to /test_types passing the test_type as parameter
-                temp_response = Util().request_apiv2('GET', API_URL+'/test_types/', api_key, params=temp_params)
-                # Tranform the above response in json and get the id
-                test_type_id = json.loads(temp_response.text)['results'][0]['id']
+                # Get the ID from the cached test types
+                test_type_id = Cache(url, api_key).get_ids('test_types', [test_type])[0]
             # Add to request_params
             request_json['test_type'] = test_type_id
         if env:
@@ -421,18 +439,13 @@ class Tests(object):
             if type(env) is int:
                 env_id = env
             else:
-                # Make a get request to /development_environments passing the environment as parameter
-                temp_response = Util().request_apiv2('GET', API_URL+'/development_environments/', api_key)
-                # Tranform the above response in json and get the results list
-                results = json.loads(temp_response.text)['results']
-                for result in results:
-                    if result['name'] == env:
-                        env_id = result['id']
+                # Get the ID from the cached environments
+                try:
+                    env_id = Cache(url, api_key).get_id('development_environments', env)
+                except KeyError:
+                    raise Exception("Environment does not exists")
             # Add to request_params
-            try:
-                request_json['environment'] = env_id
-            except:
-                raise Exception("Environment does not exists")
+            request_json['environment'] = env_id
         if tag:
             request_json['tags'] = tag
         request_json = json.dumps(request_json)
@@ -0,0 +1,176 @@
+import atexit
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+
+# Records every request made through Util.request_apiv2 (enabled with --trace FILE). At exit the requests are
+# written to FILE as Chrome trace events (open it on chrome://tracing or https://ui.perfetto.dev) and a summary
+# of them, grouped by method and URL template, is printed on stderr
+class Tracer(object):
+    enabled = False
+    trace_file = None
+    subcommand = None
+    records = list()
+    _start = None
+    _lock = threading.Lock()
+    # Timings of the connection being opened by the current thread (DNS, connect and TLS)
+    _local = threading.local()
+
+    @classmethod
+    def start(cls, trace_file, subcommand=None):
+        cls.enabled = True
+        cls.trace_file = trace_file
+        cls.subcommand = subcommand
+        cls._start = time.perf_counter()
+        cls.patch_connections()
+        atexit.register(cls.stop)
+
+    @classmethod
+    def patch_connections(cls):
+        # Wrap the functions used when opening connections, to time each phase of it
+        from urllib3.connection import HTTPConnection, HTTPSConnection
+        getaddrinfo = socket.getaddrinfo
+        new_conn = HTTPConnection._new_conn
+        https_connect = HTTPSConnection.connect
+
+        def timed(phase, function):
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    phases = getattr(cls._local, 'phases', None)
+                    if phases is not None:
+                        phases[phase] = phases.get(phase, 0) + time.perf_counter() - start
+            return wrapper
+
+        socket.getaddrinfo = timed('dns', getaddrinfo)
+        HTTPConnection._new_conn = timed('new_conn', new_conn)
+        HTTPSConnection.connect = timed('https_connect', https_connect)
+
+    @classmethod
+    def begin(cls):
+        if not cls.enabled:
+            return None
+        cls._local.phases = dict()
+        return {'start': time.perf_counter(), 'thread': threading.get_ident()}
+
+    @classmethod
+    def end(cls, trace, http_method, url, data=None, response=None, error=None):
+        if trace is None:
+            return
+        end = time.perf_counter()
+        phases = cls._local.phases
+        cls._local.phases = None
+        # Connection phases (all zero when a pooled connection was reused)
+        dns = phases.get('dns', 0)
+        connect = max(0, phases.get('new_conn', 0) - dns)
+        tls = max(0, phases.get('https_connect', 0) - phases.get('new_conn', 0))
+
+        record = dict()
+        record['method'] = http_method
+        record['url_template'] = cls.url_template(url)
+        record['url'] = response.url if response is not None else url
+        record['subcommand'] = cls.subcommand
+        record['thread'] = trace['thread']
+        record['start'] = trace['start'] - cls._start
+        record['total'] = end - trace['start']
+        record['dns'] = dns
+        record['connect'] = connect
+        record['tls'] = tls
+        record['ttfb'] = response.elapsed.total_seconds() if response is not None else None
+        record['bytes_out'] = cls.body_size(data)
+        if response is not None:
+            record['status'] = response.status_code
+            # tell() has the amount of bytes read from the connection (before decoding)
+            record['bytes_in'] = response.raw.tell() if response.raw is not None else len(response.content)
+        else:
+            record['status'] = type(error).__name__ if error is not None else 'error'
+            record['bytes_in'] = 0
+        with cls._lock:
+            cls.records.append(record)
+
+    @staticmethod
+    def url_template(url):
+        # Remove the host and query, and replace IDs, so requests to the same endpoint are grouped together
+        path = re.sub(r'^[a-z]+://[^/]+', '', url.split('?')[0])
+        return re.sub(r'/\d+(?=/|$)', '/{id}', path)
+
+    @staticmethod
+    def body_size(data):
+        if data is None:
+            return 0
+        if hasattr(data, 'bytes_out'): # Compressed stream
+            return data.bytes_out
+        if hasattr(data, '__len__'):
+            return len(data)
+        return 0
+
+    @classmethod
+    def stop(cls):
+        if not cls.enabled:
+            return
+        cls.enabled = False
+        cls.write_trace()
+        cls.print_summary()
+
+    @classmethod
+    def write_trace(cls):
+        events = list()
+        for record in cls.records:
+            event = dict()
+            event['name'] = record['method']+' '+record['url_template']
+            event['cat'] = 'http'
+            event['ph'] = 'X' # Complete event (has a duration)
+            event['ts'] = round(record['start'] * 1e6) # In microseconds
+            event['dur'] = round(record['total'] * 1e6)
+            event['pid'] = os.getpid()
+            event['tid'] = record['thread']
+            event['args'] = record
+            events.append(event)
+        trace_out = dict()
+        trace_out['traceEvents'] = events
+        trace_out['displayTimeUnit'] = 'ms'
+        trace_out['otherData'] = {'subcommand': cls.subcommand}
+        with open(cls.trace_file, 'w') as trace_file:
+            json.dump(trace_out, trace_file)
+
+    @classmethod
+    def print_summary(cls):
+        from tabulate import tabulate
+
+        groups = dict()
+        for record in cls.records:
+            key = (record['method'], record['url_template'])
+            group = groups.setdefault(key, {'requests': 0, 'errors': 0, 'durations': list(),
+                                            'connect': 0, 'bytes_in': 0, 'bytes_out': 0})
+            group['requests'] += 1
+            if type(record['status']) is not int or record['status'] >= 400:
+                group['errors'] += 1
+            group['durations'].append(record['total'])
+            group['connect'] += record['dns'] + record['connect'] + record['tls']
+            group['bytes_in'] += record['bytes_in']
+            group['bytes_out'] += record['bytes_out']
+
+        table = list()
+        # Slowest endpoints first
+        for key, group in sorted(groups.items(), key=lambda item: -sum(item[1]['durations'])):
+            durations = sorted(group['durations'])
+            table.append([
+                key[0], key[1], group['requests'], group['errors'],
+                '%.0f' % (sum(durations) * 1000),
+                '%.0f' % (sum(durations) / len(durations) * 1000),
+                '%.0f' % (durations[int(len(durations) * 0.95)] * 1000),
+                '%.0f' % (group['connect'] * 1000),
+                '%.1f' % (group['bytes_in'] / 1024),
+                '%.1f' % (group['bytes_out'] / 1024),
+            ])
+        headers = ['Method', 'URL', 'Requests', 'Errors', 'Total ms', 'Avg ms', 'p95 ms',
+                   'DNS+connect+TLS ms', 'KB in', 'KB out']
+        print('\nRequests made by "'+str(cls.subcommand)+'" (trace written to '+cls.trace_file+'):',
+              file=sys.stderr)
+        print(tabulate(table, headers=headers), file=sys.stderr)
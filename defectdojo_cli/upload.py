@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import uuid
+import zlib
+
+# Streaming multipart/form-data body. Files are read in binary mode, chunk by chunk, only when the request is being
+# sent, so uploading a big scan report doesn't need to load it (nor the whole body) in memory. The total length is
+# known beforehand, so requests sends it with a Content-Length instead of chunked transfer encoding
+class MultipartEncoder(object):
+    def __init__(self, fields=None, files=None, chunk_size=64 * 1024, callback=None):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary='+self.boundary
+        self.chunk_size = chunk_size
+        # Called with (bytes_read, total_bytes) each time a chunk is read
+        self.callback = callback
+        # The body is a list of parts, each one either bytes or the path of a file
+        self.parts = list()
+        for name, value in (fields or dict()).items():
+            if value is None:
+                continue
+            values = value if type(value) in (list, tuple) else [value]
+            for value in values:
+                self.parts.append(self.part_header(name)+str(value).encode()+b'\r\n')
+        for name, path in (files or dict()).items():
+            self.parts.append(self.part_header(name, os.path.basename(path)))
+            self.parts.append(path)
+            self.parts.append(b'\r\n')
+        self.parts.append(('--'+self.boundary+'--\r\n').encode())
+        self.len = 0
+        for part in self.parts:
+            self.len += len(part) if type(part) is bytes else os.path.getsize(part)
+        self.rewind()
+
+    def part_header(self, name, file_name=None):
+        header = '--'+self.boundary+'\r\nContent-Disposition: form-data; name="'+name+'"'
+        if file_name is not None:
+            header += '; filename="'+file_name+'"\r\nContent-Type: application/octet-stream'
+        return (header+'\r\n\r\n').encode()
+
+    def __len__(self):
+        return self.len
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    # Go back to the beginning of the body (e.g. to send it again)
+    def rewind(self):
+        self.close()
+        self.part_index = 0
+        self.part_offset = 0
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.len
+        chunks = list()
+        while size > 0 and self.part_index < len(self.parts):
+            part = self.parts[self.part_index]
+            if type(part) is bytes:
+                chunk = part[self.part_offset:self.part_offset + size]
+                self.part_offset += len(chunk)
+                if self.part_offset >= len(part):
+                    self.part_index += 1
+                    self.part_offset = 0
+            else:
+                if self.file is None:
+                    self.file = open(part, 'rb')
+                chunk = self.file.read(min(size, self.chunk_size))
+                if not chunk: # End of file
+                    self.file.close()
+                    self.file = None
+                    self.part_index += 1
+                    continue
+            chunks.append(chunk)
+            size -= len(chunk)
+        data = b''.join(chunks)
+        self.bytes_read += len(data)
+        if self.callback is not None and data:
+            self.callback(self.bytes_read, self.len)
+        return data
+
+    def close(self):
+        if getattr(self, 'file', None) is not None:
+            self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Upload progress callback that prints the amount uploaded and the throughput on stderr
+class UploadProgress(object):
+    def __init__(self, interval=0.5, stream=sys.stderr):
+        self.interval = interval
+        self.stream = stream
+        self.start = None
+        self.last_print = 0
+
+    def __call__(self, bytes_read, total_bytes):
+        now = time.time()
+        if self.start is None:
+            self.start = now
+        if now - self.last_print < self.interval and bytes_read < total_bytes:
+            return
+        self.last_print = now
+        elapsed = max(now - self.start, 0.001)
+        self.stream.write('\rUploaded %.1f/%.1f MB (%.1f MB/s)' % (bytes_read / 1e6, total_bytes / 1e6,
+                                                                 bytes_read / 1e6 / elapsed))
+        if bytes_read >= total_bytes:
+            self.stream.write('\n')
+        self.stream.flush()
+
+# Gzip-compressed view of a readable body (e.g. a MultipartEncoder), compressed chunk by chunk while it's read.
+# Its length isn't known beforehand, so requests sends it with chunked transfer encoding
+class GzipStream(object):
+    def __init__(self, source, chunk_size=64 * 1024, level=6):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.level = level
+        self.rewind()
+
+    def rewind(self):
+        if hasattr(self.source, 'rewind'):
+            self.source.rewind()
+        # wbits=31 means a gzip header and trailer
+        self.compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        self.buffer = b''
+        self.finished = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def read(self, size=-1):
+        while (size is None or size < 0 or len(self.buffer) < size) and not self.finished:
+            chunk = self.source.read(self.chunk_size)
+            self.bytes_in += len(chunk)
+            if chunk:
+                self.buffer += self.compressor.compress(chunk)
+            else:
+                self.buffer += self.compressor.flush()
+                self.finished = True
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        self.bytes_out += len(data)
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        if hasattr(self.source, 'close'):
+            self.source.close()
@@ -1,28 +1,851 @@
 from datetime import datetime
+import atexit
+import collections
+import functools
 import json
-import requests
+import os
+import sys
+import itertools
+import math
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+from defectdojo_cli.upload import GzipStream
+from defectdojo_cli.trace import Tracer
+
+# Severities of DefectDojo findings, from the lowest to the highest
+SEVERITIES = ['Info', 'Low', 'Medium', 'High', 'Critical']
+
+# Error caused by what the user asked for (e.g. an unknown test type or a missing local mirror). The sub_command
+# dispatchers print its message and exit with a failure, without a traceback
+class UsageError(Exception):
+    pass
+
+# AIMD (additive increase, multiplicative decrease) limit of requests in flight. Every request takes a slot,
+# so sequential code is never held back, but when the server pushes back (429/503) the limit is halved,
+# throttling parallel fan-outs, and then it slowly grows again (by 1 for each 'limit' successful requests)
+class AdaptiveLimiter(object):
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.last_decrease = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                # Requests that were already in flight when the server started pushing back
+                # will fail too, so only decrease once per second
+                now = time.monotonic()
+                if now - self.last_decrease > 1:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self.last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify_all()
 
 class Util(object):
+    # Process-wide HTTP session, so every request reuses the same pool of keep-alive
+    # connections instead of paying for a new TCP+TLS handshake on each API call
+    _session = None
+    _session_lock = threading.Lock()
+    # Connection pool settings (can be changed with Util.configure_session or with the
+    # DEFECTDOJO_POOL_CONNECTIONS, DEFECTDOJO_POOL_MAXSIZE, DEFECTDOJO_POOL_BLOCK and
+    # DEFECTDOJO_KEEP_ALIVE environment variables)
+    pool_connections = int(os.environ.get('DEFECTDOJO_POOL_CONNECTIONS', 10)) # Amount of hosts to keep pools for
+    pool_maxsize = int(os.environ.get('DEFECTDOJO_POOL_MAXSIZE', 10)) # Connections kept per host
+    pool_block = os.environ.get('DEFECTDOJO_POOL_BLOCK', 'false').lower() == 'true' # Never open more than pool_maxsize per host
+    keep_alive = os.environ.get('DEFECTDOJO_KEEP_ALIVE', 'true').lower() == 'true'
+    # Amount of results requested per page when walking through a paginated listing
+    page_size = int(os.environ.get('DEFECTDOJO_PAGE_SIZE', 100))
+    # Compress uploaded scan reports and print the bytes saved by compression. Responses are always asked for
+    # compressed (requests sends 'Accept-Encoding: gzip, deflate' by default), this only adds brotli and zstd if
+    # they are installed
+    compress = os.environ.get('DEFECTDOJO_COMPRESS', 'false').lower() == 'true'
+    # Bytes transferred while compression was enabled (printed on stderr at exit)
+    compression_stats = {'sent': 0, 'sent_uncompressed': 0, 'received': 0, 'received_uncompressed': 0}
+    _compression_stats_lock = threading.Lock()
+    _compression_stats_registered = False
+    # Retry policy (can be changed with the DEFECTDOJO_RETRIES and DEFECTDOJO_BACKOFF environment variables).
+    # Waits between retries grow exponentially (backoff * 2^attempt, with jitter) unless the server sends Retry-After
+    retries = int(os.environ.get('DEFECTDOJO_RETRIES', 5))
+    backoff = float(os.environ.get('DEFECTDOJO_BACKOFF', 0.5)) # In seconds
+    backoff_max = 60 # In seconds
+    RETRY_STATUS_CODES = (429, 502, 503, 504)
+    # Status codes meaning the server refused to process the request, so even non-idempotent ones can be retried
+    REJECTED_STATUS_CODES = (429, 503)
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'PATCH', 'DELETE')
+    # DefectDojo URLs whose server doesn't accept compressed uploads (also remembered in the Cache)
+    _uncompressed_urls = set()
+    # Limit of requests in flight in this process (see AdaptiveLimiter)
+    limiter = AdaptiveLimiter(int(os.environ.get('DEFECTDOJO_MAX_IN_FLIGHT', 64)))
+    # Amount of requests made at the same time when fanning out (see AsyncClient)
+    concurrency = int(os.environ.get('DEFECTDOJO_CONCURRENCY', 8))
+
+    @classmethod
+    def configure_session(cls, pool_connections=None, pool_maxsize=None, pool_block=None, keep_alive=None):
+        with cls._session_lock:
+            if pool_connections is not None:
+                cls.pool_connections = int(pool_connections)
+            if pool_maxsize is not None:
+                cls.pool_maxsize = int(pool_maxsize)
+            if pool_block is not None:
+                cls.pool_block = pool_block
+            if keep_alive is not None:
+                cls.keep_alive = keep_alive
+            # Drop the current session so the next request creates one with the new settings
+            if cls._session is not None:
+                cls._session.close()
+                cls._session = None
+
+    # Make sure at least 'pool_maxsize' connections per host are kept (e.g. one per parallel worker). Unlike
+    # configure_session, the session isn't replaced since other threads may be using it: a bigger adapter is
+    # mounted on it instead (requests already in flight finish on the previous one)
+    @classmethod
+    def grow_pool(cls, pool_maxsize):
+        with cls._session_lock:
+            if pool_maxsize <= cls.pool_maxsize:
+                return
+            cls.pool_maxsize = int(pool_maxsize)
+            if cls._session is not None:
+                cls.mount_adapter(cls._session)
+
+    @classmethod
+    def mount_adapter(cls, session):
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(pool_connections=cls.pool_connections,
+                              pool_maxsize=cls.pool_maxsize,
+                              pool_block=cls.pool_block)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+    @classmethod
+    def get_session(cls):
+        if cls._session is None:
+            with cls._session_lock:
+                if cls._session is None: # Another thread may have created it while we waited
+                    # requests is imported only when the first request is made, as it's slow to import
+                    import requests
+                    session = requests.Session()
+                    cls.mount_adapter(session)
+                    cls._session = session
+        return cls._session
+
     # Generic method for all HTTP requests
     # IMPORTANT: The url must end with '/', otherwise some requests will not work
-    def request_apiv2(self, http_method, url, api_key, params=dict(), data=None, files=None, verify=True):
+    def request_apiv2(self, http_method, url, api_key, params=dict(), data=None, files=None, verify=True,
+                      headers=None, compress=None, stream=False):
+        import requests
+        extra_headers = headers
         headers = dict()
         headers['Authorization'] = 'Token '+api_key
         if not files:
             headers['Accept'] = 'application/json'
             headers['Content-Type'] = 'application/json'
+        if not self.keep_alive:
+            headers['Connection'] = 'close'
+        if extra_headers:
+            headers.update(extra_headers)
+        if compress is None:
+            compress = self.compress
+        compressed_body = None
+        if compress:
+            # Accept every encoding urllib3 is able to decode (gzip and deflate are accepted anyway)
+            from urllib3.util import make_headers
+            headers['Accept-Encoding'] = make_headers(accept_encoding=True)['accept-encoding']
+            if http_method in ('POST', 'PUT', 'PATCH') and hasattr(data, 'read') and self.accepts_compression(url):
+                # Only streamed bodies (scan reports) are compressed, other bodies are tiny JSONs
+                data = compressed_body = GzipStream(data)
+                headers['Content-Encoding'] = 'gzip'
+
+        attempt = 0
+        while True:
+            response = None
+            error = None
+            self.limiter.acquire()
+            trace = Tracer.begin() # None unless --trace was passed
+            try:
+                response = self.get_session().request(method=http_method, url=url, params=params, data=data,
+                                                      files=files, headers=headers, verify=verify, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+                if attempt >= self.retries or not self.should_retry(http_method, data, files, error=e):
+                    raise
+            finally:
+                Tracer.end(trace, http_method, url, data=data, response=response, error=error)
+                self.limiter.release(throttled=(response is not None and
+                                                response.status_code in self.REJECTED_STATUS_CODES))
+            if response is not None:
+                if attempt >= self.retries or not self.should_retry(http_method, data, files, response=response):
+                    break
+                response.close()
+            time.sleep(self.retry_delay(attempt, response))
+            attempt += 1
+            if hasattr(data, 'rewind'): # Streamed body has to be sent again from the beginning
+                data.rewind()
 
-        response = requests.request(method=http_method, url=url, params=params, data=data,
-                                    files=files, headers=headers, verify=verify)
+        if compressed_body is not None and self.rejected_compression(response):
+            # The server (or a proxy in front of it) doesn't accept compressed bodies, so send it again as is
+            print('The server rejected the compressed upload ('+str(response.status_code)+'), sending it '
+                  'uncompressed (and the next ones too)', file=sys.stderr)
+            self.disable_compression(url)
+            response.close()
+            compressed_body.rewind()
+            return self.request_apiv2(http_method, url, api_key, params=params, data=compressed_body.source,
+                                      files=files, verify=verify, headers=extra_headers, compress=False,
+                                      stream=stream)
+        if compress and not stream: # The body of a streamed response hasn't been read yet
+            self.add_compression_stats(response, compressed_body)
         return response
 
+    # Whether a compressed upload failed because its body couldn't be decoded: 415 (Unsupported Media Type), or
+    # a 400 with a parse error (what Django REST framework answers to a body it can't read). Other 400s are
+    # validation errors (e.g. an unknown scan type) that sending it uncompressed wouldn't fix
+    @staticmethod
+    def rejected_compression(response):
+        if response.status_code == 415:
+            return True
+        return response.status_code == 400 and 'parse error' in response.text.lower()
+
+    # DefectDojo URL (without the API path) of an endpoint
+    @staticmethod
+    def base_url(url):
+        return url.split('/api/v2/', 1)[0]
+
+    def accepts_compression(self, url):
+        base_url = self.base_url(url)
+        if base_url in Util._uncompressed_urls:
+            return False
+        from defectdojo_cli.cache import Cache
+        if Cache(base_url).get_setting('uncompressed_uploads'):
+            Util._uncompressed_urls.add(base_url)
+            return False
+        return True
+
+    def disable_compression(self, url):
+        base_url = self.base_url(url)
+        Util._uncompressed_urls.add(base_url)
+        from defectdojo_cli.cache import Cache
+        Cache(base_url).set_setting('uncompressed_uploads', True)
+
+    # Message of an error of a request that couldn't be made (e.g. connection refused, timeout or invalid
+    # certificate), or None if 'error' is something else
+    @staticmethod
+    def request_failure(error):
+        # requests is only loaded once a request is made
+        requests = sys.modules.get('requests')
+        if requests is None or not isinstance(error, requests.exceptions.RequestException):
+            return None
+        url = error.request.url if error.request is not None else 'DefectDojo'
+        # urllib3 wraps the actual reason (e.g. in a MaxRetryError), so get to the innermost one
+        reason = error
+        while reason.args and isinstance(reason.args[0], Exception):
+            reason = reason.args[0]
+        reason = getattr(reason, 'reason', reason)
+        # Drop the representation of the connection object (e.g. '<urllib3.connection.HTTPConnection object ...>: ')
+        reason = re.sub(r'^<[^>]*>: ', '', str(reason))
+        return 'Failed to reach '+url+': '+reason
+
+    def should_retry(self, http_method, data, files, response=None, error=None):
+        # Bodies that were streamed and can't be rewound can't be sent again
+        if hasattr(data, 'read') and not hasattr(data, 'rewind'):
+            return False
+        if files and any(hasattr(file, 'read') for file in files.values()):
+            return False
+        if error is not None:
+            import requests
+            from urllib3.exceptions import NewConnectionError
+            if isinstance(error, requests.exceptions.SSLError): # e.g. invalid certificate, retrying won't help
+                return False
+            if http_method in self.IDEMPOTENT_METHODS:
+                return True
+            # Non-idempotent requests (e.g. an import) are only retried if the connection wasn't even established,
+            # otherwise the server may have received and processed it
+            reason = getattr(error.args[0], 'reason', None) if error.args else None
+            return (isinstance(error, requests.exceptions.ConnectTimeout)
+                    or isinstance(reason, NewConnectionError))
+        if response.status_code in self.REJECTED_STATUS_CODES:
+            return True
+        return response.status_code in self.RETRY_STATUS_CODES and http_method in self.IDEMPOTENT_METHODS
+
+    def retry_delay(self, attempt, response=None):
+        # Honour the Retry-After header (in seconds or as a date)
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return min(self.backoff_max, max(0, float(retry_after)))
+            except ValueError:
+                from email.utils import parsedate_to_datetime
+                try:
+                    retry_date = parsedate_to_datetime(retry_after)
+                    return min(self.backoff_max, max(0, retry_date.timestamp() - time.time()))
+                except (TypeError, ValueError):
+                    pass
+        # Exponential backoff with full jitter, so concurrent clients don't retry all at once
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def add_compression_stats(self, response, compressed_body=None):
+        with self._compression_stats_lock:
+            stats = Util.compression_stats
+            if compressed_body is not None:
+                stats['sent'] += compressed_body.bytes_out
+                stats['sent_uncompressed'] += compressed_body.bytes_in
+            # tell() has the amount of bytes read from the connection, before decoding
+            stats['received'] += response.raw.tell() if response.raw is not None else len(response.content)
+            stats['received_uncompressed'] += len(response.content)
+            if not Util._compression_stats_registered:
+                Util._compression_stats_registered = True
+                atexit.register(Util.print_compression_stats)
+
+    @staticmethod
+    def print_compression_stats():
+        stats = Util.compression_stats
+        output = 'Compression:'
+        if stats['sent_uncompressed']:
+            output += ' uploaded %.1f KB instead of %.1f KB (saved %.1f KB),' % (
+                stats['sent'] / 1024, stats['sent_uncompressed'] / 1024,
+                (stats['sent_uncompressed'] - stats['sent']) / 1024)
+        output += ' downloaded %.1f KB instead of %.1f KB (saved %.1f KB)' % (
+            stats['received'] / 1024, stats['received_uncompressed'] / 1024,
+            (stats['received_uncompressed'] - stats['received']) / 1024)
+        print(output, file=sys.stderr)
+
+    # Generator that goes through a paginated listing following the 'next' links returned by the API,
+    # yielding a (response, json_out) tuple for each page (json_out is None if the request failed)
+    def request_apiv2_pages(self, url, api_key, params=dict(), page_size=None, follow=True, verify=True):
+        request_params = dict(params)
+        if 'limit' not in request_params:
+            request_params['limit'] = page_size if page_size else self.page_size
+        next_url = url
+        while next_url:
+            response = self.request_apiv2('GET', next_url, api_key, params=request_params, verify=verify)
+            if response.status_code != 200:
+                yield response, None
+                return
+            json_out = json.loads(response.text)
+            next_url = json_out.get('next') if follow else None
+            yield response, json_out
+            if next_url:
+                next_url = self.next_page_url(url, next_url)
+                request_params = dict()
+
+    @staticmethod
+    def next_page_url(url, next_url):
+        # The 'next' link already has all the parameters in its query string. Only its query is used
+        # because DefectDojo may not know the scheme/host it is being accessed through (e.g. behind a proxy)
+        split_url = urlsplit(url)
+        return urlunsplit((split_url.scheme, split_url.netloc, split_url.path, urlsplit(next_url).query, ''))
+
+    # Same as request_apiv2_pages, but the pages aren't parsed: it yields (response, RawPage) tuples, each page
+    # being read from the connection only while it's iterated. The link to the next page is taken from the head
+    # of the page, so a page has to be consumed before the next one is requested
+    def request_apiv2_pages_raw(self, url, api_key, params=dict(), page_size=None, follow=True, verify=True):
+        request_params = dict(params)
+        if 'limit' not in request_params:
+            request_params['limit'] = page_size if page_size else self.page_size
+        next_url = url
+        while next_url:
+            response = self.request_apiv2('GET', next_url, api_key, params=request_params, verify=verify,
+                                          stream=True)
+            if response.status_code != 200:
+                yield response, [response.content]
+                return
+            page = RawPage(response)
+            yield response, page
+            for chunk in page: # In case the page wasn't (completely) consumed
+                pass
+            next_url = page.next_url if follow else None
+            if next_url:
+                next_url = self.next_page_url(url, next_url)
+                request_params = dict()
+
+    # Same as request_apiv2_pages, but after the first page (which has the total amount of results) the other
+    # pages are requested by offset using up to 'workers' parallel requests. Pages are still yielded in order
+    def request_apiv2_pages_parallel(self, url, api_key, params=dict(), page_size=None, workers=4, verify=True):
+        page_size = page_size if page_size else self.page_size
+        # Make sure there are enough connections in the pool for all the workers
+        Util.grow_pool(workers)
+        request_params = dict(params)
+        request_params['limit'] = page_size
+        first_offset = int(request_params.get('offset', 0))
+        request_params['offset'] = first_offset
+
+        response = self.request_apiv2('GET', url, api_key, params=request_params, verify=verify)
+        if response.status_code != 200:
+            yield response, None
+            return
+        json_out = json.loads(response.text)
+        count = json_out['count']
+        yield response, json_out
+
+        def get_page(offset):
+            page_params = request_params.copy()
+            page_params['offset'] = offset
+            page_response = self.request_apiv2('GET', url, api_key, params=page_params, verify=verify)
+            if page_response.status_code != 200:
+                return page_response, None
+            return page_response, json.loads(page_response.text)
+
+        offsets = iter(range(first_offset + page_size, count, page_size))
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Keep only a few pages ahead of the one being consumed, so memory doesn't grow with the listing size
+            futures = [executor.submit(get_page, offset) for offset in itertools.islice(offsets, workers * 2)]
+            try:
+                while futures:
+                    page = futures.pop(0).result()
+                    for offset in itertools.islice(offsets, 1):
+                        futures.append(executor.submit(get_page, offset))
+                    yield page
+                    if page[1] is None: # Request failed
+                        return
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    # Generator that goes through a listing using keyset pagination: results are ordered by ID and each page asks
+    # only for IDs greater than the last one received, so the server never has to skip rows like with big offsets
+    def request_apiv2_pages_keyset(self, url, api_key, params=dict(), page_size=None, after_id=None, verify=True):
+        request_params = dict(params)
+        request_params.pop('offset', None)
+        request_params['limit'] = page_size if page_size else self.page_size
+        request_params['ordering'] = 'id'
+        if after_id is not None:
+            request_params['id__gt'] = after_id
+        while True:
+            response = self.request_apiv2('GET', url, api_key, params=request_params, verify=verify)
+            if response.status_code != 200:
+                yield response, None
+                return
+            json_out = json.loads(response.text)
+            self.check_keyset_page(json_out['results'], request_params.get('id__gt'), request_params.get('id__lte'))
+            yield response, json_out
+            if not json_out['next'] or not json_out['results']:
+                return
+            request_params['id__gt'] = json_out['results'][-1]['id']
+
+    # Make sure the server (or a proxy in front of it) honoured the ordering and the ID limits of a keyset page.
+    # Otherwise the same page would be requested forever or results would be silently skipped
+    @staticmethod
+    def check_keyset_page(results, after_id=None, until_id=None):
+        previous_id = int(after_id) if after_id is not None else None
+        for result in results:
+            if previous_id is not None and result['id'] <= previous_id:
+                raise UsageError('The server doesn\'t support keyset pagination (ID '+str(result['id'])
+                                +' came after '+str(previous_id)+', so "ordering=id" or "id__gt" was ignored). '
+                                'Use --pagination offset')
+            if until_id is not None and result['id'] > int(until_id):
+                raise UsageError('The server doesn\'t support keyset pagination (ID '+str(result['id'])
+                                +' is above the "id__lte" limit '+str(until_id)+'). Use --pagination offset')
+            previous_id = result['id']
+
+    # Same as request_apiv2_pages_keyset, but the ID range is split in 'workers' shards that are walked in parallel.
+    # Pages are still yielded in ID order, the shards that aren't being consumed yet wait in temporary files
+    def request_apiv2_pages_keyset_parallel(self, url, api_key, params=dict(), page_size=None, after_id=None,
+                                            workers=4, verify=True):
+        # Make sure there are enough connections in the pool for all the workers
+        Util.grow_pool(workers)
+        # Get the lowest and the highest IDs to be listed
+        request_params = dict(params)
+        request_params.pop('offset', None)
+        request_params['limit'] = 1
+        if after_id is not None:
+            request_params['id__gt'] = after_id
+        edges = list()
+        for ordering in ['id', '-id']:
+            request_params['ordering'] = ordering
+            response = self.request_apiv2('GET', url, api_key, params=request_params, verify=verify)
+            if response.status_code != 200:
+                yield response, None
+                return
+            edges.append((response, json.loads(response.text)))
+        first_json_out = edges[0][1]
+        if not first_json_out['results']: # Nothing to list
+            yield edges[0]
+            return
+        lowest_id = first_json_out['results'][0]['id']
+        highest_id = edges[1][1]['results'][0]['id']
+        # Both edges must be within the limits and in order (see check_keyset_page), they're the same result
+        # when only one is left
+        self.check_keyset_page([first_json_out['results'][0]], after_id)
+        self.check_keyset_page([edges[1][1]['results'][0]], lowest_id - 1)
+
+        # Split the IDs in shards of (greater than, less than or equal) limits
+        shard_size = max(1, math.ceil((highest_id - lowest_id + 1) / workers))
+        pagers = list()
+        for shard_start in range(lowest_id - 1, highest_id, shard_size):
+            shard_params = dict(params)
+            shard_params['id__lte'] = min(shard_start + shard_size, highest_id)
+            pagers.append(self.request_apiv2_pages_keyset(url, api_key, params=shard_params, page_size=page_size,
+                                                          after_id=shard_start, verify=verify))
+        for page in self.request_apiv2_pages_merged(pagers):
+            yield page
+
+    # Go through several listings (generators of pages) at the same time, each one on its own thread. It first
+    # yields an empty page with the total amount of results of all listings and then the pages of each listing,
+    # one listing after the other. Listings are fetched ahead independently of the one being consumed: only a
+    # couple of pages of each one are kept in memory, the rest wait in a temporary file (see PageBuffer)
+    def request_apiv2_pages_merged(self, pagers):
+        stop = threading.Event()
+        buffers = [PageBuffer() for pager in pagers]
+
+        def walk_pager(pager, buffer):
+            try:
+                for page in pager:
+                    if stop.is_set(): # The consumer stopped consuming
+                        return
+                    buffer.put(page)
+                    if page[1] is None:
+                        return
+            except Exception as e:
+                buffer.put(e)
+            finally:
+                pager.close()
+                buffer.put(None) # End of listing
+
+        def get(buffer):
+            page = buffer.get()
+            if isinstance(page, Exception):
+                raise page
+            return page
+
+        from concurrent.futures import ThreadPoolExecutor
+        try:
+            # Every listing needs its own thread, as the first page of all of them is needed to start yielding
+            with ThreadPoolExecutor(max_workers=max(1, len(pagers))) as executor:
+                for pager, buffer in zip(pagers, buffers):
+                    executor.submit(walk_pager, pager, buffer)
+                try:
+                    first_pages = [get(buffer) for buffer in buffers]
+                    count = 0
+                    for page in first_pages:
+                        if page is None or page[1] is None: # Request failed
+                            if page is not None:
+                                yield page
+                            return
+                        count += page[1]['count']
+                    # Start with an empty page that has the total amount of results
+                    yield first_pages[0][0], {'count': count, 'next': None, 'previous': None, 'results': []}
+                    for first_page, buffer in zip(first_pages, buffers):
+                        page = first_page
+                        while page is not None:
+                            yield page
+                            if page[1] is None: # Request failed
+                                return
+                            page = get(buffer)
+                finally:
+                    stop.set()
+        finally:
+            # The threads are done at this point, so the temporary files can be removed
+            for buffer in buffers:
+                buffer.close()
+
     # Pretty print JSON response exiting with a sucess if the response status code is the same as the 'sucess_status_code' argument
     def default_output(self, response, sucess_status_code):
-        json_out = json.loads(response.text)
-        pretty_json_out = json.dumps(json_out, indent=4)
-        print(pretty_json_out)
+        try:
+            json_out = json.loads(response.text)
+            pretty_json_out = json.dumps(json_out, indent=4)
+            print(pretty_json_out)
+        except ValueError: # Not a JSON (e.g. an error page from a reverse proxy)
+            print(response.text)
 
         if response.status_code == sucess_status_code: # Sucess
             exit(0)
         else: # Failure
             exit(1)
+
+# Body of a page of a listing that is read from the connection chunk by chunk, while it's iterated. As DefectDojo
+# puts 'next' before 'results', the link to the next page is found at the head of the page without parsing it
+class RawPage(object):
+    # Amount of bytes where the link to the next page is looked for
+    HEAD_SIZE = 64 * 1024
+    NEXT_PATTERN = re.compile(rb'"next"\s*:\s*(null|"(?:[^"\\]|\\.)*")')
+
+    def __init__(self, response, chunk_size=64 * 1024):
+        self.response = response
+        self.chunk_size = chunk_size
+        self.next_url = None
+        self._consumed = False
+
+    def __iter__(self):
+        if self._consumed:
+            return
+        self._consumed = True
+        head = b''
+        try:
+            for chunk in self.response.iter_content(self.chunk_size):
+                if head is not None:
+                    head += chunk
+                    match = self.NEXT_PATTERN.search(head)
+                    if match:
+                        self.next_url = json.loads(match.group(1).decode())
+                        head = None
+                    elif b'"results"' in head or len(head) > self.HEAD_SIZE:
+                        raise Exception('The link to the next page was not found at the beginning of the page')
+                yield chunk
+        finally:
+            self.response.close()
+
+# Response-like object for paginated listings. It has the same attributes as the response of the
+# first page (status_code, url, request and text) and iterating over it yields the results of all
+# pages, requesting each page only when the previous one has been consumed. It only reads its own
+# state, so different instances can be used by different threads. If 'fields' is passed, only those
+# fields of each result are kept (when the server doesn't project them already)
+class PagedResponse(object):
+    def __init__(self, pages, request=None, count=None, fields=None):
+        self._pages = iter(pages)
+        first_response, self._first_page = next(self._pages)
+        # The request can be overwritten when merging listings, to point to a URL with all their filters
+        # (a requests.PreparedRequest built without sending it)
+        self._merged = request is not None
+        self.request = request if request is not None else first_response.request
+        self.status_code = first_response.status_code
+        self.url = self.request.url
+        self._first_response = first_response
+        if count is not None:
+            self.count = count
+        elif self._first_page is not None:
+            self.count = self._first_page['count']
+        else:
+            self.count = 0
+        self.fields = fields
+        # ID of the last result iterated (e.g. to resume an interrupted listing)
+        self.last_id = None
+        self._page_amount = 1
+        self._results = None
+        self._iterated = False
+
+    def __iter__(self):
+        if self._results is not None:
+            return map(self.expand, self._results)
+        if self._iterated:
+            raise RuntimeError('The results of a paginated listing can only be iterated once')
+        self._iterated = True
+        return self._iter_results()
+
+    def _iter_results(self):
+        if self._first_page is None: # Request failed
+            return
+        page, self._first_page = self._first_page, None # Don't keep the first page in memory after it was consumed
+        for result in page['results']:
+            yield self.project(result)
+        for response, page in self._pages:
+            if page is None:
+                raise Exception('Failed to get page ('+str(response.status_code)+'): '+response.text)
+            self._page_amount += 1
+            for result in page['results']:
+                yield self.project(result)
+
+    def project(self, result):
+        self.last_id = result.get('id')
+        if self.fields is None:
+            return result
+        return {field: result.get(field) for field in self.fields}
+
+    # Results that are kept in memory (e.g. to print them as a single JSON) are kept as tuples of the projected
+    # fields, which take a fraction of the memory of dicts. Without a projection they're kept as they are
+    def compact(self, result):
+        if self.fields is None:
+            return result
+        return tuple(result[field] for field in self.fields)
+
+    def expand(self, row):
+        if self.fields is None:
+            return row
+        return dict(zip(self.fields, row))
+
+    # Keep all the results in memory (compacted)
+    def load(self):
+        if self._results is None:
+            self._results = [self.compact(result) for result in self]
+        return self._results
+
+    @property
+    def text(self):
+        if self.status_code != 200:
+            return self._first_response.text
+        self.load()
+        if self._page_amount == 1 and not self._merged and self.fields is None:
+            # Nothing to merge, so keep the exact output of the API
+            return self._first_response.text
+        json_out = dict()
+        json_out['count'] = self.count
+        json_out['next'] = None
+        json_out['previous'] = None
+        json_out['results'] = [self.expand(row) for row in self._results]
+        return json.dumps(json_out)
+
+    def json(self):
+        return json.loads(self.text)
+
+    # Write the listing as indented JSON, the same as json.dumps(json_out, indent=4) but expanding one kept
+    # result at a time, so the results are never all in memory as dicts. 'rows' are compacted results (all the
+    # results of the listing by default, with the count of the listing)
+    def write_json(self, stream, rows=None):
+        count = len(rows) if rows is not None else self.count
+        if rows is None:
+            rows = self.load()
+            if self._page_amount == 1 and not self._merged and self.fields is None:
+                # Nothing to merge, so keep the output of the API
+                stream.write(json.dumps(json.loads(self._first_response.text), indent=4)+'\n')
+                return
+        stream.write('{\n    "count": '+json.dumps(count)+',\n'
+                     '    "next": null,\n    "previous": null,\n    "results": [')
+        for i, row in enumerate(rows):
+            stream.write(',\n        ' if i else '\n        ')
+            stream.write(json.dumps(self.expand(row), indent=4).replace('\n', '\n        '))
+        stream.write('\n    ]\n}\n' if rows else ']\n}\n')
+
+# Pages of a listing waiting to be consumed, in order. The first 'memory_pages' are kept in memory and the next
+# ones are written to a temporary file, so a listing can be fetched ahead of its consumer without holding all of
+# it in memory. Anything else (e.g. a failed page or an exception) is kept as it is
+class PageBuffer(object):
+    def __init__(self, memory_pages=2):
+        self.memory_pages = memory_pages
+        self.condition = threading.Condition()
+        # Pages (and other items) in order, the ones written to the file are (request, offset, length)
+        self.items = collections.deque()
+        self.in_memory = 0
+        self.file = None
+
+    def put(self, item):
+        with self.condition:
+            if type(item) is tuple and item[1] is not None and self.in_memory >= self.memory_pages:
+                if self.file is None:
+                    import tempfile
+                    self.file = tempfile.TemporaryFile()
+                data = json.dumps(item[1]).encode()
+                self.file.seek(0, os.SEEK_END)
+                item = SpilledPage(item[0].request, self.file.tell(), len(data))
+                self.file.write(data)
+            elif type(item) is tuple and item[1] is not None:
+                self.in_memory += 1
+            self.items.append(item)
+            self.condition.notify()
+
+    # Get the next item, waiting for it if it wasn't received yet
+    def get(self):
+        with self.condition:
+            while not self.items:
+                self.condition.wait()
+            item = self.items.popleft()
+            if type(item) is SpilledPage:
+                self.file.seek(item.offset)
+                text = self.file.read(item.length).decode()
+                return SpilledResponse(item.request, text), json.loads(text)
+            if type(item) is tuple and item[1] is not None:
+                self.in_memory -= 1
+            return item
+
+    def close(self):
+        with self.condition:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.items.clear()
+
+# Position of a page in the file of a PageBuffer
+SpilledPage = collections.namedtuple('SpilledPage', ['request', 'offset', 'length'])
+
+# Response-like object of a page that was read back from the file of a PageBuffer
+class SpilledResponse(object):
+    def __init__(self, request, text):
+        self.status_code = 200
+        self.request = request
+        self.url = request.url if request is not None else None
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+# Response-like object of a listing without results that wasn't requested (see Findings.list_empty)
+class EmptyResponse(object):
+    def __init__(self, request):
+        self.status_code = 200
+        self.request = request
+        self.url = request.url
+        self.text = json.dumps({'count': 0, 'next': None, 'previous': None, 'results': []})
+        self.content = self.text.encode()
+
+    def json(self):
+        return json.loads(self.text)
+
+# Asyncio counterpart of Util.request_apiv2. Requests still use the shared session, but run on a pool of
+# 'concurrency' worker threads (which limits how many of them are in flight), so a fan-out of N requests takes
+# about as long as the slowest one instead of the sum of all of them
+class AsyncClient(object):
+    # Marks the end of the iterable consumed by map()
+    _end = object()
+
+    def __init__(self, concurrency=None):
+        self.concurrency = int(concurrency) if concurrency else Util.concurrency
+        self._executor = None
+
+    async def __aenter__(self):
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        # Make sure there are enough connections in the pool for all the requests
+        Util.grow_pool(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._executor.shutdown(wait=True)
+
+    # Run a blocking function on a worker thread as soon as one is free
+    async def run(self, function, *args, **kwargs):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
+
+    async def request_apiv2(self, http_method, url, api_key, **kwargs):
+        return await self.run(Util().request_apiv2, http_method, url, api_key, **kwargs)
+
+    # Call function for each item of iterable concurrently, returning the results in the same order.
+    # The iterable is only consumed when there's a free slot, so it can be a lazy stream (e.g. a PagedResponse)
+    def map(self, function, iterable):
+        # asyncio is only imported when needed, as it's slow to import
+        import asyncio
+
+        async def map_all():
+            async with self:
+                loop = asyncio.get_running_loop()
+                iterator = iter(iterable)
+                tasks = list()
+                running = set()
+                while True:
+                    # Wait for a free worker before getting the next item, so the iterable is consumed lazily
+                    if len(running) >= self.concurrency:
+                        _, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    # Getting the next item may block (e.g. requesting the next page), so do it on a worker too
+                    item = await loop.run_in_executor(self._executor, next, iterator, self._end)
+                    if item is self._end:
+                        break
+                    task = asyncio.ensure_future(self.run(function, item))
+                    tasks.append(task)
+                    running.add(task)
+                return await asyncio.gather(*tasks)
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError: # No event loop in this thread
+            return asyncio.run(map_all())
+        # asyncio.run can't be called while an event loop is running in this thread (e.g. in a notebook),
+        # so the event loop of map() runs on its own thread
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, map_all()).result()
+
+    # Run all calls (functions without arguments) concurrently, returning their results in the same order
+    def gather(self, calls):
+        return self.map(lambda call: call(), calls)
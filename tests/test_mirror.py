@@ -0,0 +1,155 @@
+import json
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+from urllib.parse import urlsplit, parse_qs, urlencode
+from defectdojo_cli.mirror import Mirror
+from defectdojo_cli.util import Util
+
+URL = 'http://defectdojo.test'
+
+class FakeResponse(object):
+    def __init__(self, status_code, json_out):
+        self.status_code = status_code
+        self.text = json.dumps(json_out)
+
+# Engagements, tests and findings of two products, answered like by DefectDojo to the parameters used by
+# Mirror.sync_table. Used in place of Util.request_apiv2
+class FakeDefectDojo(object):
+    def __init__(self):
+        self.records = {'engagements': dict(), 'tests': dict(), 'findings': dict()}
+        self.requests = list()
+        for product in [1, 2]:
+            engagement = self.add('engagements', {'id': product * 10, 'product': product, 'name': 'E'})
+            test = self.add('tests', {'id': product * 100, 'engagement': engagement['id'], 'test_type': 1})
+            for i in range(1, 6):
+                self.add('findings', {'id': product * 1000 + i, 'test': test['id'], 'severity': 'High',
+                                      'title': 'Finding '+str(i)})
+
+    def add(self, table, record, updated='2024-01-01T10:00:00.000000Z'):
+        record = dict(record, updated=updated)
+        self.records[table][record['id']] = record
+        return record
+
+    def product(self, table, record):
+        if table == 'findings':
+            record = self.records['tests'][record['test']]
+        if table in ('tests', 'findings'):
+            record = self.records['engagements'][record['engagement']]
+        return record['product']
+
+    def request_apiv2(self, http_method, url, api_key, params=dict(), **kwargs):
+        table = urlsplit(url).path.strip('/').split('/')[-1]
+        query = {name: values[0] for name, values in parse_qs(urlsplit(url).query).items()}
+        query.update({name: str(value) for name, value in params.items()})
+        self.requests.append((table, query))
+        records = sorted(self.records[table].values(), key=lambda record: record['id'])
+        for name, value in query.items():
+            if name.endswith('product'):
+                records = [record for record in records if self.product(table, record) == int(value)]
+            elif name == 'updated__gte':
+                records = [record for record in records
+                           if Mirror.parse_date(record['updated']) >= Mirror.parse_date(value)]
+            elif name == 'id__gt':
+                records = [record for record in records if record['id'] > int(value)]
+        limit = int(query['limit'])
+        next_url = None
+        if len(records) > limit:
+            next_url = url.split('?')[0]+'?'+urlencode(dict(query, id__gt=records[limit - 1]['id']))
+        return FakeResponse(200, {'count': len(records), 'next': next_url, 'previous': None,
+                                  'results': records[:limit]})
+
+class ParseDateTest(unittest.TestCase):
+    def test_formats(self):
+        utc = timezone.utc
+        cases = {
+            '2024-01-31T10:00:00.123Z': datetime(2024, 1, 31, 10, 0, 0, 123000, tzinfo=utc),
+            '2024-01-31T10:00:00.123456789Z': datetime(2024, 1, 31, 10, 0, 0, 123456, tzinfo=utc),
+            '2024-01-31T12:00:00+02:00': datetime(2024, 1, 31, 10, 0, 0, tzinfo=utc),
+            '2024-01-31T05:30:00.5-0430': datetime(2024, 1, 31, 10, 0, 0, 500000, tzinfo=utc),
+            # Dates without a timezone are taken as UTC
+            '2024-01-31 10:00:00': datetime(2024, 1, 31, 10, 0, 0, tzinfo=utc),
+            '2024-01-31T10:00': datetime(2024, 1, 31, 10, 0, tzinfo=utc),
+        }
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(Mirror.parse_date(value), expected)
+
+    def test_invalid(self):
+        for value in [None, '', 'yesterday', '2024-01-31', '2024-13-01T10:00:00Z', '31/01/2024 10:00']:
+            with self.subTest(value=value):
+                self.assertIsNone(Mirror.parse_date(value))
+
+class SyncTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = FakeDefectDojo()
+        self.mirror = Mirror(URL, 'key', path=self.directory+'/mirror.sqlite')
+        patch = mock.patch.object(Util, 'request_apiv2', new=self.server.request_apiv2)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.mirror.close()
+        shutil.rmtree(self.directory)
+
+    def ids(self, table):
+        return [row[0] for row in self.mirror.connect().execute('SELECT id FROM '+table+' ORDER BY id')]
+
+    def sync(self, **kwargs):
+        self.server.requests = list()
+        return self.mirror.sync(page_size=2, **kwargs)
+
+    def test_incremental(self):
+        summary = self.sync()
+        self.assertEqual(summary['findings']['fetched'], 10)
+        self.assertEqual(self.ids('findings'), [1001, 1002, 1003, 1004, 1005, 2001, 2002, 2003, 2004, 2005])
+        # Only the records changed since the watermark (and the ones changed at the same time) are asked again
+        self.server.add('findings', dict(self.server.records['findings'][1002], title='Changed'),
+                        updated='2024-01-01T12:00:00.5+02:00')
+        self.server.add('findings', dict(self.server.records['findings'][1003], title='Changed'),
+                        updated='2024-01-01T10:30:00.000001Z')
+        summary = self.sync()
+        findings_requests = [query for table, query in self.server.requests if table == 'findings']
+        self.assertEqual(findings_requests[0]['updated__gte'], '2024-01-01T10:00:00.000000Z')
+        # The watermark is the latest date, not the highest string
+        self.assertEqual(summary['findings']['watermarks']['all'], '2024-01-01T10:30:00.000001Z')
+        titles = self.mirror.connect().execute('SELECT title FROM findings WHERE id IN (1002, 1003)').fetchall()
+        self.assertEqual(titles, [('Changed',), ('Changed',)])
+        summary = self.sync()
+        self.assertEqual(summary['findings']['fetched'], 1)
+        self.assertEqual(len(self.ids('findings')), 10)
+
+    def test_undated_records(self):
+        self.server.add('findings', {'id': 1006, 'test': 100, 'severity': 'Low', 'title': 'Undated'}, updated=None)
+        summary = self.sync()
+        # Without the dates of all the findings the next sync is a full one
+        self.assertIsNone(summary['findings']['watermarks']['all'])
+        summary = self.sync()
+        self.assertEqual(summary['findings']['fetched'], 11)
+
+    def test_full_sync_deletes(self):
+        self.sync()
+        del self.server.records['findings'][1001]
+        del self.server.records['tests'][200]
+        # Incremental syncs can't see deletions
+        self.sync()
+        self.assertIn(1001, self.ids('findings'))
+        self.sync(full=True)
+        self.assertEqual(self.ids('findings'), [1002, 1003, 1004, 1005])
+        self.assertEqual(self.ids('tests'), [100])
+
+    def test_product_scope(self):
+        self.sync()
+        del self.server.records['findings'][1001]
+        del self.server.records['findings'][2001]
+        # Only the records of the product synced are deleted
+        self.sync(product_ids=[2], full=True)
+        self.assertEqual(self.ids('findings'), [1001, 1002, 1003, 1004, 1005, 2002, 2003, 2004, 2005])
+        products = [query.get('engagement__product') for table, query in self.server.requests if table == 'tests']
+        self.assertEqual(set(products), {'2'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import io
+import json
+import unittest
+from unittest import mock
+from urllib.parse import urlsplit, parse_qs
+from defectdojo_cli.findings import Findings
+from defectdojo_cli.util import Util, PagedResponse
+
+URL = 'http://defectdojo.test'
+
+class FakeRequest(object):
+    def __init__(self, url):
+        self.url = url
+
+class FakeResponse(object):
+    def __init__(self, status_code, json_out, url):
+        self.status_code = status_code
+        self.text = json.dumps(json_out)
+        self.request = FakeRequest(url)
+
+# Findings of two test types (the IDs of the findings of test type N are N01 to N25), answered like by an
+# older DefectDojo that doesn't accept a comma separated list of test types. Used in place of Util.request_apiv2
+class FakeFindingsApi(object):
+    def __init__(self, comma_separated=False):
+        self.comma_separated = comma_separated
+        self.requests = list()
+
+    def request_apiv2(self, http_method, url, api_key, params=dict(), **kwargs):
+        query = {name: values[0] for name, values in parse_qs(urlsplit(url).query).items()}
+        query.update({name: str(value) for name, value in params.items()})
+        self.requests.append(query)
+        test_types = query['test__test_type'].split(',')
+        if len(test_types) > 1 and not self.comma_separated:
+            return FakeResponse(400, {'test__test_type': ['Enter a whole number.']}, url)
+        findings = [{'id': int(test_type) * 100 + i, 'test_type': int(test_type)}
+                    for test_type in test_types for i in range(1, 26)]
+        limit = int(query['limit'])
+        offset = int(query.get('offset', 0))
+        next_url = None
+        if offset + limit < len(findings):
+            next_url = URL+'/api/v2/findings/?test__test_type='+query['test__test_type']+'&limit='+str(limit) \
+                +'&offset='+str(offset + limit)
+        return FakeResponse(200, {'count': len(findings), 'next': next_url, 'previous': None,
+                                  'results': findings[offset:offset + limit]}, url)
+
+class MergedListingTest(unittest.TestCase):
+    IDS = list(range(101, 126)) + list(range(201, 226))
+
+    def list(self, api, **kwargs):
+        with mock.patch.object(Util, 'request_apiv2', new=api.request_apiv2):
+            response = Findings().list_multiple_test_types(URL, 'key', [2, 1], page_size=10, **kwargs)
+            response.load()
+        return response
+
+    def test_merged(self):
+        for parallel in [None, 2]:
+            with self.subTest(parallel=parallel):
+                api = FakeFindingsApi()
+                response = self.list(api, parallel=parallel)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.count, 50)
+                self.assertEqual([finding['id'] for finding in response], self.IDS)
+                self.assertEqual(response.json(), {'count': 50, 'next': None, 'previous': None,
+                                                   'results': [{'id': id, 'test_type': id // 100}
+                                                               for id in self.IDS]})
+                # The URL has the filters of all the test types
+                self.assertEqual(parse_qs(urlsplit(response.url).query)['test__test_type'], ['1', '2'])
+                # The first request asked for both test types at once
+                self.assertEqual(api.requests[0]['test__test_type'], '1,2')
+
+    def test_comma_separated(self):
+        api = FakeFindingsApi(comma_separated=True)
+        response = self.list(api)
+        self.assertEqual([finding['id'] for finding in response], self.IDS)
+        self.assertTrue(all(request['test__test_type'] == '1,2' for request in api.requests))
+
+    def test_write_json(self):
+        response = self.list(FakeFindingsApi(), projection=['id'])
+        output = io.StringIO()
+        response.write_json(output)
+        self.assertEqual(output.getvalue(), json.dumps(json.loads(response.text), indent=4)+'\n')
+        self.assertEqual(json.loads(output.getvalue())['results'], [{'id': id} for id in self.IDS])
+
+class PagedResponseTest(unittest.TestCase):
+    def pages(self, amount, failed=False):
+        for page in range(amount):
+            json_out = {'count': amount * 2, 'next': None, 'previous': None,
+                        'results': [{'id': page * 2 + 1, 'title': 'a'}, {'id': page * 2 + 2, 'title': 'b'}]}
+            yield FakeResponse(200, json_out, URL+'/api/v2/findings/?page='+str(page)), json_out
+        if failed:
+            yield FakeResponse(500, {'detail': 'Server error'}, URL), None
+
+    def test_single_page(self):
+        first_page = next(self.pages(1))
+        response = PagedResponse(iter([first_page]))
+        # Nothing to merge, so it's the exact output of the API
+        self.assertEqual(response.text, first_page[0].text)
+        self.assertEqual(response.url, first_page[0].request.url)
+
+    def test_iterated_once(self):
+        response = PagedResponse(self.pages(3))
+        self.assertEqual([finding['id'] for finding in response], list(range(1, 7)))
+        self.assertEqual(response.last_id, 6)
+        with self.assertRaises(RuntimeError):
+            iter(response)
+
+    def test_projection(self):
+        response = PagedResponse(self.pages(3), fields=['id'])
+        # Kept in memory as tuples, expanded when iterated
+        self.assertEqual(response.load(), [(id,) for id in range(1, 7)])
+        self.assertEqual(list(response), [{'id': id} for id in range(1, 7)])
+        self.assertEqual(list(response), [{'id': id} for id in range(1, 7)])
+
+    def test_failed_page(self):
+        response = PagedResponse(self.pages(2, failed=True))
+        with self.assertRaises(Exception):
+            list(response)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import json
+import time
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from urllib.parse import urlsplit, parse_qs, urlencode
+from defectdojo_cli.util import Util, PageBuffer, SpilledResponse, UsageError
+
+URL = 'http://defectdojo.test/api/v2/findings/'
+
+class FakeRequest(object):
+    def __init__(self, url):
+        self.url = url
+
+class FakeResponse(object):
+    def __init__(self, status_code, json_out, url):
+        self.status_code = status_code
+        self.text = json.dumps(json_out)
+        self.request = FakeRequest(url)
+
+# Findings endpoint answering like DefectDojo to the parameters used by the pagers (limit, offset, ordering,
+# id__gt and id__lte), used in place of Util.request_apiv2
+class FakeFindingsApi(object):
+    def __init__(self, ids, latency=0, ignore_keyset=False):
+        self.findings = [{'id': id, 'title': 'Finding '+str(id)} for id in ids]
+        self.latency = latency
+        self.ignore_keyset = ignore_keyset
+        self.requests = list()
+        self.lock = threading.Lock()
+
+    def request_apiv2(self, http_method, url, api_key, params=dict(), **kwargs):
+        # The link to the next page has the parameters in its query string
+        query = {name: values[0] for name, values in parse_qs(urlsplit(url).query).items()}
+        query.update({name: str(value) for name, value in params.items()})
+        with self.lock:
+            self.requests.append(query)
+        time.sleep(self.latency)
+        findings = self.findings
+        if not self.ignore_keyset:
+            if 'id__gt' in query:
+                findings = [finding for finding in findings if finding['id'] > int(query['id__gt'])]
+            if 'id__lte' in query:
+                findings = [finding for finding in findings if finding['id'] <= int(query['id__lte'])]
+            if query.get('ordering') == '-id':
+                findings = findings[::-1]
+        limit = int(query['limit'])
+        offset = int(query.get('offset', 0))
+        next_url = None
+        if offset + limit < len(findings):
+            next_url = URL+'?'+urlencode(dict(query, offset=offset + limit))
+        json_out = {'count': len(findings), 'next': next_url, 'previous': None,
+                    'results': findings[offset:offset + limit]}
+        return FakeResponse(200, json_out, URL+'?'+urlencode(query))
+
+    def patch(self):
+        return mock.patch.object(Util, 'request_apiv2', new=self.request_apiv2)
+
+def result_ids(pages):
+    return [result['id'] for response, json_out in pages for result in json_out['results']]
+
+class KeysetPaginationTest(unittest.TestCase):
+    # IDs with gaps, as left by deleted findings
+    IDS = [id for id in range(1, 300) if id % 7 and id % 11]
+
+    def test_keyset(self):
+        api = FakeFindingsApi(self.IDS)
+        with api.patch():
+            self.assertEqual(result_ids(Util().request_apiv2_pages_keyset(URL, 'key', page_size=20)), self.IDS)
+            self.assertEqual(result_ids(Util().request_apiv2_pages_keyset(URL, 'key', page_size=20, after_id=150)),
+                             [id for id in self.IDS if id > 150])
+        self.assertTrue(all(request['ordering'] == 'id' and 'offset' not in request for request in api.requests))
+
+    def test_keyset_parallel(self):
+        for workers in [1, 2, 3, 4, 7, 500]:
+            for after_id in [None, 0, 100, 298, 299]:
+                with self.subTest(workers=workers, after_id=after_id):
+                    with FakeFindingsApi(self.IDS).patch():
+                        pages = list(Util().request_apiv2_pages_keyset_parallel(URL, 'key', page_size=20,
+                                                                                 after_id=after_id, workers=workers))
+                    expected = [id for id in self.IDS if after_id is None or id > after_id]
+                    self.assertEqual(result_ids(pages), expected)
+                    # The first page has the total amount of results
+                    self.assertEqual(pages[0][1]['count'], len(expected))
+
+    def test_ignored_keyset_parameters(self):
+        pagers = [lambda: Util().request_apiv2_pages_keyset(URL, 'key', page_size=20),
+                  lambda: Util().request_apiv2_pages_keyset_parallel(URL, 'key', page_size=20, workers=4)]
+        for pager in pagers:
+            with self.subTest(pager=pager):
+                with FakeFindingsApi(self.IDS, ignore_keyset=True).patch():
+                    with self.assertRaises(UsageError):
+                        result_ids(pager())
+
+    def test_shards_fetched_ahead(self):
+        api = FakeFindingsApi(range(1, 401), latency=0.005)
+        with api.patch():
+            pages = Util().request_apiv2_pages_keyset_parallel(URL, 'key', page_size=10, workers=4)
+            next(pages) # Page with the count
+            next(pages)
+            # While the first page isn't consumed, the other shards keep being fetched until their end
+            # (2 requests for the edges and 10 pages per shard)
+            deadline = time.time() + 10
+            while len(api.requests) < 2 + 4 * 10 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(api.requests), 2 + 4 * 10)
+            self.assertEqual(result_ids(pages), list(range(11, 401)))
+
+    def test_early_close(self):
+        api = FakeFindingsApi(range(1, 2001), latency=0.01)
+        threads = threading.active_count()
+        files = list()
+        create_file = tempfile.TemporaryFile
+
+        def temporary_file():
+            files.append(create_file())
+            return files[-1]
+        with api.patch(), mock.patch('tempfile.TemporaryFile', new=temporary_file):
+            pages = Util().request_apiv2_pages_keyset_parallel(URL, 'key', page_size=10, workers=4)
+            for i in range(3):
+                next(pages)
+            # Let the shards fetch a few pages ahead
+            time.sleep(0.1)
+            pages.close()
+            # The shards stopped, instead of going through the whole listing
+            self.assertLess(len(api.requests), 2 + 200)
+            self.assertEqual(threading.active_count(), threads)
+            # The temporary files of the pages fetched ahead are removed
+            self.assertTrue(files)
+            self.assertTrue(all(file.closed for file in files))
+
+class MergedPaginationTest(unittest.TestCase):
+    def pager(self, ids, delay=0, fail_after=None):
+        for page, start in enumerate(range(0, len(ids), 10)):
+            time.sleep(delay)
+            if fail_after is not None and page == fail_after:
+                yield FakeResponse(500, {'detail': 'Server error'}, URL), None
+                return
+            json_out = {'count': len(ids), 'next': None, 'previous': None,
+                        'results': [{'id': id} for id in ids[start:start + 10]]}
+            yield FakeResponse(200, json_out, URL), json_out
+
+    def test_order(self):
+        # The last listings are the fastest ones, they're still yielded after the first ones
+        listings = [list(range(1, 51)), list(range(51, 81)), list(range(81, 200))]
+        pagers = [self.pager(ids, delay=delay) for ids, delay in zip(listings, [0.02, 0.01, 0])]
+        pages = list(Util().request_apiv2_pages_merged(pagers))
+        self.assertEqual(pages[0][1], {'count': 199, 'next': None, 'previous': None, 'results': []})
+        self.assertEqual(result_ids(pages), list(range(1, 200)))
+
+    def test_failed_page(self):
+        pagers = [self.pager(list(range(1, 51))), self.pager(list(range(51, 101)), fail_after=2)]
+        pages = list(Util().request_apiv2_pages_merged(pagers))
+        self.assertEqual(pages[-1][0].status_code, 500)
+        self.assertIsNone(pages[-1][1])
+        self.assertEqual(result_ids(pages[:-1]), list(range(1, 71)))
+
+    def test_exception(self):
+        def failing_pager():
+            yield from self.pager(list(range(1, 21)))
+            raise ValueError('Invalid page')
+        pages = Util().request_apiv2_pages_merged([self.pager(list(range(1, 51))), failing_pager()])
+        with self.assertRaises(ValueError):
+            result_ids(pages)
+
+class PageBufferTest(unittest.TestCase):
+    def test_spilled_pages(self):
+        buffer = PageBuffer(memory_pages=2)
+        pages = [(FakeResponse(200, {}, URL+str(i)), {'results': [{'id': i}]}) for i in range(5)]
+        for page in pages:
+            buffer.put(page)
+        buffer.put(None)
+        try:
+            received = [buffer.get() for i in range(6)]
+        finally:
+            buffer.close()
+        # The first pages are kept as they are, the next ones are read back from the file
+        self.assertEqual(received[:2], pages[:2])
+        for (response, json_out), page in zip(received[2:5], pages[2:]):
+            self.assertIsInstance(response, SpilledResponse)
+            self.assertEqual(response.url, page[0].request.url)
+            self.assertEqual(json_out, page[1])
+        self.assertIsNone(received[5])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import io
+import sys
+import json
+import unittest
+from unittest import mock
+from urllib.parse import urlsplit, parse_qs
+from defectdojo_cli.findings import Findings
+from defectdojo_cli.util import Util, RawPage, PagedResponse
+
+URL = 'http://defectdojo.test/api/v2/findings/'
+
+# Streamed response, whose body is read in chunks of at most 'size' bytes
+class FakeStreamedResponse(object):
+    def __init__(self, status_code, body, size=7):
+        self.status_code = status_code
+        self.content = body
+        self.size = size
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), min(self.size, chunk_size)):
+            yield self.content[start:start + min(self.size, chunk_size)]
+
+    def close(self):
+        self.closed = True
+
+def page_body(ids, next_url=None):
+    return json.dumps({'count': 25, 'next': next_url, 'previous': None,
+                       'results': [{'id': id, 'title': 'Finding "'+str(id)+'" ]}'} for id in ids]}).encode()
+
+class RawPageTest(unittest.TestCase):
+    NEXT_URL = 'http://defectdojo.test/api/v2/findings/?limit=10&offset=10&title=%22a%22'
+
+    def test_splicing(self):
+        body = page_body(range(1, 11), self.NEXT_URL)
+        for size in [1, 2, 7, 64, 100000]:
+            with self.subTest(size=size):
+                response = FakeStreamedResponse(200, body, size)
+                page = RawPage(response)
+                # The chunks are copied as they are, the link to the next page is found while they're read
+                self.assertEqual(b''.join(page), body)
+                self.assertEqual(page.next_url, self.NEXT_URL)
+                self.assertTrue(response.closed)
+                # A page can only be read once
+                self.assertEqual(list(page), [])
+
+    def test_next_url(self):
+        cases = [(b'{"count": 1, "next": null, "results": []}', None),
+                 (b'{"count":1,"next" : "http://a/?q=\\"b\\"", "results": []}', 'http://a/?q="b"'),
+                 (b'{"count": 1, "next": "http://a/?q=\\u00e9", "results": []}', 'http://a/?q=é')]
+        for body, next_url in cases:
+            with self.subTest(body=body):
+                page = RawPage(FakeStreamedResponse(200, body, 3))
+                self.assertEqual(b''.join(page), body)
+                self.assertEqual(page.next_url, next_url)
+
+    def test_missing_next_url(self):
+        page = RawPage(FakeStreamedResponse(200, b'{"results": [], "next": null}'))
+        with self.assertRaises(Exception):
+            list(page)
+
+# Findings listing answered with streamed pages of 10 findings, used in place of Util.request_apiv2
+class FakeFindingsApi(object):
+    def __init__(self, findings=25, fail_at=None):
+        self.findings = findings
+        self.fail_at = fail_at
+        self.requests = list()
+        self.bodies = list()
+
+    def request_apiv2(self, http_method, url, api_key, params=dict(), stream=False, **kwargs):
+        query = {name: values[0] for name, values in parse_qs(urlsplit(url).query).items()}
+        query.update(params)
+        self.requests.append(query)
+        offset = int(query.get('offset', 0))
+        if offset == self.fail_at:
+            return FakeStreamedResponse(500, b'{"detail": "Server error"}')
+        next_url = None
+        if offset + 10 < self.findings:
+            next_url = 'https://internal-host/api/v2/findings/?limit=10&offset='+str(offset + 10)
+        self.bodies.append(page_body(range(offset + 1, min(offset + 10, self.findings) + 1), next_url))
+        return FakeStreamedResponse(200, self.bodies[-1])
+
+class RawPagesTest(unittest.TestCase):
+    # Exit code and output of Findings.print_raw
+    def print_raw(self, pages):
+        output = io.TextIOWrapper(io.BytesIO())
+        with mock.patch.object(sys, 'stdout', output):
+            with self.assertRaises(SystemExit) as context:
+                Findings().print_raw(pages)
+        return context.exception.code, output.buffer.getvalue()
+
+    def test_pages(self):
+        api = FakeFindingsApi()
+        with mock.patch.object(Util, 'request_apiv2', new=api.request_apiv2):
+            code, output = self.print_raw(Util().request_apiv2_pages_raw(URL, 'key', page_size=10))
+        self.assertEqual(code, 0)
+        # One page per line, each one as the server sent it
+        self.assertEqual(output, b'\n'.join(api.bodies) + b'\n')
+        self.assertEqual([json.loads(line)['results'][-1]['id'] for line in output.splitlines()], [10, 20, 25])
+        # Only the query of the links to the next pages is used
+        self.assertEqual([request.get('offset') for request in api.requests], [None, '10', '20'])
+
+    def test_failed_page(self):
+        api = FakeFindingsApi(fail_at=10)
+        with mock.patch.object(Util, 'request_apiv2', new=api.request_apiv2):
+            code, output = self.print_raw(Util().request_apiv2_pages_raw(URL, 'key', page_size=10))
+        self.assertEqual(code, 1)
+        self.assertEqual(output.decode().splitlines()[-1], '{"detail": "Server error"}')
+
+    def test_single_page(self):
+        api = FakeFindingsApi()
+        with mock.patch.object(Util, 'request_apiv2', new=api.request_apiv2):
+            code, output = self.print_raw(Util().request_apiv2_pages_raw(URL, 'key', page_size=10, follow=False))
+        self.assertEqual(len(output.decode().splitlines()), 1)
+        self.assertEqual(len(api.requests), 1)
+
+    def test_fields(self):
+        # Raw pages aren't projected
+        argv = ['defectdojo', 'findings', 'list', '--url', 'http://defectdojo.test', '--api_key', 'key', '--raw',
+                '--fields', 'id']
+        with mock.patch.object(sys, 'argv', argv), mock.patch('sys.stderr', io.StringIO()) as stderr, \
+                mock.patch.object(Util, 'request_apiv2') as request:
+            with self.assertRaises(SystemExit) as context:
+                Findings()._list()
+        self.assertEqual(context.exception.code, 2)
+        self.assertIn('--fields', stderr.getvalue())
+        request.assert_not_called()
+
+class NdjsonTest(unittest.TestCase):
+    def pages(self, fail=False):
+        for start in [1, 11]:
+            json_out = json.loads(page_body(range(start, start + 10)))
+            yield FakeStreamedResponse(200, b''), json_out
+        if fail:
+            yield FakeStreamedResponse(500, b'{"detail": "Server error"}'), None
+
+    def test_findings(self):
+        output = io.StringIO()
+        with mock.patch.object(sys, 'stdout', output):
+            Findings().print_ndjson(PagedResponse(self.pages(), request=mock.Mock(url=URL), fields=['id']))
+        self.assertEqual([json.loads(line) for line in output.getvalue().splitlines()],
+                         [{'id': id} for id in range(1, 21)])
+
+    def test_interrupted(self):
+        output = io.StringIO()
+        with mock.patch.object(sys, 'stdout', output), mock.patch('sys.stderr', io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit):
+                Findings().print_ndjson(PagedResponse(self.pages(fail=True), request=mock.Mock(url=URL)),
+                                        resume=True)
+        self.assertEqual(len(output.getvalue().splitlines()), 20)
+        self.assertIn('--resume_after 20', stderr.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
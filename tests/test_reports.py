@@ -0,0 +1,231 @@
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from defectdojo_cli.findings import Findings
+from defectdojo_cli.reports import JsonArrayFilter, XmlElementFilter, ScanReport
+from defectdojo_cli.util import SEVERITIES, UsageError
+
+# Reads a string at most 'size' characters at a time, whatever is asked for, so values are split between chunks
+class ChunkedReader(object):
+    def __init__(self, text, size):
+        self.stream = io.StringIO(text)
+        self.size = size
+
+    def read(self, size=-1):
+        return self.stream.read(self.size)
+
+def run_filter(document, targets, chunk_size=1024 * 1024, reader_size=None):
+    source = ChunkedReader(document, reader_size) if reader_size else io.StringIO(document)
+    output = io.StringIO()
+    JsonArrayFilter(targets, chunk_size=chunk_size).filter(source, output)
+    return output.getvalue()
+
+class JsonArrayFilterTest(unittest.TestCase):
+    # Strings with escaped quotes, backslashes and brackets, inside and outside of the filtered arrays
+    DOCUMENT = json.dumps({
+        'name': 'report "1" [draft] {x}',
+        'path\\"]': ['a\\', '\\"', '[', '}'],
+        'runs': [
+            {
+                'tool': {'name': 'tool ]}"', 'rules': [[1, [2, [3]]], {'a': [{'b': []}]}]},
+                'results': [
+                    {'id': 1, 'keep': False, 'message': 'drop "me" ]'},
+                    {'id': 2, 'keep': True, 'message': 'keep \\"me\\" [', 'nested': [[], [[{}]], ['"]']]},
+                    {'id': 3, 'keep': False, 'message': '}{'},
+                    {'id': 4, 'keep': True, 'message': 'unicode é \\u00e9', 'score': 1.5e10},
+                    {'id': 5, 'keep': False, 'message': ''},
+                ],
+            },
+            {'tool': {}, 'results': []},
+        ],
+        'numbers': [0, -1.25, 12345678901234567890, True, None],
+    }, indent=2)
+
+    def keep_flag(self, kept):
+        return {('runs', '*', 'results', '*'): lambda result: kept.append(result['id']) or result['keep']}
+
+    def expected(self):
+        document = json.loads(self.DOCUMENT)
+        document['runs'][0]['results'] = [result for result in document['runs'][0]['results'] if result['keep']]
+        return document
+
+    def test_filter(self):
+        kept = list()
+        output = run_filter(self.DOCUMENT, self.keep_flag(kept))
+        self.assertEqual(json.loads(output), self.expected())
+        self.assertEqual(kept, [1, 2, 3, 4, 5])
+
+    def test_chunk_boundaries(self):
+        expected = run_filter(self.DOCUMENT, self.keep_flag(list()))
+        # Every possible split of the document (down to one character per read)
+        for size in list(range(1, 40)) + [97, 1000]:
+            with self.subTest(chunk_size=size):
+                self.assertEqual(run_filter(self.DOCUMENT, self.keep_flag(list()), chunk_size=size,
+                                            reader_size=size), expected)
+
+    def test_keep_all_and_none(self):
+        document = '{"results": [1, [2, [3, "]"]], {"a": "\\"["}]}'
+        self.assertEqual(json.loads(run_filter(document, {('results', '*'): lambda value: True})),
+                         json.loads(document))
+        self.assertEqual(json.loads(run_filter(document, {('results', '*'): lambda value: False})),
+                         {'results': []})
+
+    def test_nested_arrays_of_targets(self):
+        document = '[[1, 2, 3], [], [4, [5, 6]]]'
+        values = list()
+        output = run_filter(document, {('*', '*'): lambda value: values.append(value) or value != 2})
+        self.assertEqual(json.loads(output), [[1, 3], [], [4, [5, 6]]])
+        self.assertEqual(values, [1, 2, 3, 4, [5, 6]])
+
+    def test_without_output(self):
+        values = list()
+        JsonArrayFilter({('*',): values.append}, chunk_size=3).filter(io.StringIO('[1, "a]", {"b": [2]}]'))
+        self.assertEqual(values, [1, 'a]', {'b': [2]}])
+
+    def test_invalid_documents(self):
+        for document in ['[1, 2', '{"results": [1}', '[1] [2]', '{"a" 1}', '"unterminated']:
+            with self.subTest(document=document):
+                with self.assertRaises(ValueError):
+                    run_filter(document, {('*',): lambda value: True}, chunk_size=2)
+
+class XmlElementFilterTest(unittest.TestCase):
+    DOCUMENT = (b'<?xml version="1.0" encoding="UTF-8"?>'
+                b'<report><vulnerabilities>'
+                b'<vulnerability source="a"><name>CVE-1</name><severity>HIGH</severity>'
+                b'<references><reference><name>nested</name></reference></references></vulnerability>'
+                b'<vulnerability><name>CVE-2</name><severity>LOW</severity></vulnerability>'
+                b'</vulnerabilities></report>')
+
+    def test_filter(self):
+        fields = list()
+        output = io.BytesIO()
+        XmlElementFilter('vulnerability', lambda element: fields.append(element) or element['name'] != 'CVE-2').filter(
+            io.BytesIO(self.DOCUMENT), output)
+        # Only the text of the direct children and the attributes are passed to the callback
+        self.assertEqual(fields, [{'source': 'a', 'name': 'CVE-1', 'severity': 'HIGH', 'references': 'nested'},
+                                  {'name': 'CVE-2', 'severity': 'LOW'}])
+        self.assertIn(b'CVE-1', output.getvalue())
+        self.assertNotIn(b'CVE-2', output.getvalue())
+        self.assertIn(b'<name>nested</name>', output.getvalue())
+
+class ScanReportTest(unittest.TestCase):
+    def severities(self, counts):
+        return {SEVERITIES[index]: count for index, count in enumerate(counts) if count}
+
+    def test_cvss_severity(self):
+        scores = {'0': 'Info', '0.1': 'Low', '3.9': 'Low', '4': 'Medium', '6.9': 'Medium', '7.0': 'High',
+                  '8.9': 'High', '9': 'Critical', '10': 'Critical'}
+        for score, severity in scores.items():
+            with self.subTest(score=score):
+                self.assertEqual(SEVERITIES[ScanReport.cvss_severity(score)], severity)
+
+    def test_sarif_severities(self):
+        report = {'runs': [{
+            'tool': {'driver': {'rules': [
+                {'id': 'scored', 'properties': {'security-severity': '9.8'}},
+                {'id': 'default-level', 'defaultConfiguration': {'level': 'note'}},
+            ]}},
+            'results': [
+                {'ruleId': 'scored'},
+                {'ruleId': 'scored', 'properties': {'security-severity': '5.0'}},
+                {'ruleId': 'default-level'},
+                {'ruleId': 'other', 'level': 'error'},
+                {'ruleId': 'other', 'level': 'warning'},
+                {'ruleId': 'other', 'level': 'none'},
+                {'ruleId': 'other'},
+            ],
+        }]}
+        scan_report = ScanReport('SARIF', min_severity='Medium', exclude_rules=['default-*'])
+        output = io.BytesIO()
+        scan_report.filter(io.BytesIO(json.dumps(report).encode()), output)
+        self.assertEqual(self.severities(scan_report.found), {'Info': 2, 'Medium': 3, 'High': 1, 'Critical': 1})
+        self.assertEqual(self.severities(scan_report.kept), {'Medium': 3, 'High': 1, 'Critical': 1})
+        self.assertEqual(len(json.loads(output.getvalue())['runs'][0]['results']), 5)
+
+    def test_trivy_severities(self):
+        report = {'Results': [{'Target': 'image', 'Vulnerabilities': [
+            {'VulnerabilityID': 'CVE-1', 'Severity': 'CRITICAL'},
+            {'VulnerabilityID': 'CVE-2', 'Severity': 'UNKNOWN'},
+            {'VulnerabilityID': 'CVE-3', 'Severity': 'low'},
+        ], 'Misconfigurations': [{'ID': 'DS001', 'Severity': 'HIGH'}]}]}
+        scan_report = ScanReport('Trivy Scan', include_rules=['CVE-*'])
+        scan_report.filter(io.BytesIO(json.dumps(report).encode()))
+        self.assertEqual(self.severities(scan_report.found), {'Info': 1, 'Low': 1, 'High': 1, 'Critical': 1})
+        self.assertEqual(self.severities(scan_report.kept), {'Info': 1, 'Low': 1, 'Critical': 1})
+
+    def test_dependency_check_severities(self):
+        document = (b'<analysis><dependencies><dependency><vulnerabilities>'
+                    b'<vulnerability><name>CVE-1</name><severity>MODERATE</severity></vulnerability>'
+                    b'<vulnerability><name>CVE-2</name><severity>Critical</severity></vulnerability>'
+                    b'<vulnerability><name>CVE-3</name><severity>unknown</severity></vulnerability>'
+                    b'</vulnerabilities></dependency></dependencies></analysis>')
+        scan_report = ScanReport('Dependency Check Scan', min_severity='Informational')
+        scan_report.filter(io.BytesIO(document))
+        self.assertEqual(self.severities(scan_report.found), {'Info': 1, 'Medium': 1, 'Critical': 1})
+
+    def test_zap_severities(self):
+        alerts = b''.join(b'<alertitem><pluginid>'+str(code).encode()+b'</pluginid><riskcode>'+code.encode()
+                          +b'</riskcode></alertitem>' for code in ['0', '1', '2', '3', '4', 'x'])
+        scan_report = ScanReport('ZAP Scan', min_severity='High')
+        output = io.BytesIO()
+        scan_report.filter(io.BytesIO(b'<OWASPZAPReport><site><alerts>'+alerts+b'</alerts></site></OWASPZAPReport>'),
+                           output)
+        self.assertEqual(self.severities(scan_report.found), {'Info': 2, 'Low': 1, 'Medium': 1, 'High': 2})
+        self.assertEqual(output.getvalue().count(b'<alertitem>'), 2)
+
+    def test_unsupported_scanner(self):
+        with self.assertRaises(UsageError):
+            ScanReport('Burp Scan')
+
+# Pre-filtering of the reports uploaded by findings import/reimport
+class PrefilterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_report(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def test_invalid_reports(self):
+        reports = [('trivy.json', 'Trivy Scan', '{"Results": [{"Vulnerabilities": ['),
+                   ('sarif.json', 'SARIF', 'not json'),
+                   ('zap.xml', 'ZAP Scan', '<OWASPZAPReport><site>')]
+        for name, scanner, content in reports:
+            with self.subTest(scanner=scanner):
+                path = self.write_report(name, content)
+                with mock.patch('tempfile.mkdtemp', return_value=os.path.join(self.directory, 'filtered')):
+                    os.makedirs(os.path.join(self.directory, 'filtered'))
+                    with self.assertRaises(UsageError):
+                        Findings().prefilter_scan(scanner, path, 'High')
+                # The temporary copy is removed
+                self.assertFalse(os.path.exists(os.path.join(self.directory, 'filtered')))
+
+    def test_unsupported_scanner_arguments(self):
+        path = self.write_report('burp.xml', '<issues></issues>')
+        commands = [['import', path, '--engagement_id', '1', '--lead_id', '1'], ['reimport', path, '--test_id', '1']]
+        for command in commands:
+            for option in [['--prefilter'], ['--include_rule', 'CVE-*'], ['--exclude_rule', 'CVE-*']]:
+                with self.subTest(command=command[0], option=option[0]):
+                    argv = ['defectdojo', 'findings'] + command + ['--url', 'http://localhost', '--api_key', 'key',
+                                                                   '--scanner', 'Burp Scan'] + option
+                    # Rejected while parsing the arguments, before any request
+                    with mock.patch.object(sys, 'argv', argv), mock.patch('sys.stderr', io.StringIO()) as stderr, \
+                            mock.patch('defectdojo_cli.util.Util.request_apiv2') as request:
+                        with self.assertRaises(SystemExit) as context:
+                            getattr(Findings(), '_'+command[0])()
+                    self.assertEqual(context.exception.code, 2)
+                    self.assertIn('Burp Scan', stderr.getvalue())
+                    request.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
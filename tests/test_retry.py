@@ -0,0 +1,157 @@
+import io
+import sys
+import time
+import unittest
+from unittest import mock
+import requests
+from urllib3.connection import HTTPConnection
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+from defectdojo_cli.findings import Findings
+from defectdojo_cli.upload import MultipartEncoder
+from defectdojo_cli.util import Util, AdaptiveLimiter
+
+URL = 'http://defectdojo.test/api/v2/findings/'
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or dict()
+        self.text = ''
+
+    def close(self):
+        pass
+
+# Session answering each request with the next response (or raising the next error)
+class FakeSession(object):
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.requests = 0
+
+    def request(self, **kwargs):
+        self.requests += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+def connection_refused():
+    reason = NewConnectionError(HTTPConnection('defectdojo.test'),
+                                'Failed to establish a new connection: [Errno 111] Connection refused')
+    return requests.exceptions.ConnectionError(MaxRetryError(None, '/api/v2/findings/', reason=reason),
+                                               request=requests.Request('GET', URL).prepare())
+
+def connection_reset():
+    return requests.exceptions.ConnectionError(ProtocolError('Connection aborted.', ConnectionResetError(104)))
+
+class ShouldRetryTest(unittest.TestCase):
+    def test_responses(self):
+        cases = [('GET', 429, True), ('GET', 502, True), ('GET', 503, True), ('GET', 504, True),
+                 ('GET', 500, False), ('GET', 404, False), ('GET', 200, False), ('DELETE', 502, True),
+                 # The server may have processed a non-idempotent request, unless it refused it
+                 ('POST', 502, False), ('POST', 504, False), ('POST', 429, True), ('POST', 503, True)]
+        for http_method, status_code, retry in cases:
+            with self.subTest(http_method=http_method, status_code=status_code):
+                self.assertEqual(Util().should_retry(http_method, None, None, response=FakeResponse(status_code)),
+                                 retry)
+
+    def test_errors(self):
+        cases = [('GET', connection_refused(), True), ('GET', connection_reset(), True),
+                 ('GET', requests.exceptions.ReadTimeout(), True), ('GET', requests.exceptions.SSLError(), False),
+                 ('POST', connection_refused(), True), ('POST', requests.exceptions.ConnectTimeout(), True),
+                 ('POST', connection_reset(), False), ('POST', requests.exceptions.ReadTimeout(), False),
+                 ('POST', requests.exceptions.SSLError(), False)]
+        for http_method, error, retry in cases:
+            with self.subTest(http_method=http_method, error=repr(error)):
+                self.assertEqual(Util().should_retry(http_method, None, None, error=error), retry)
+
+    def test_bodies(self):
+        # Bodies that can be rewound can be sent again, open files and other streams can't
+        with MultipartEncoder(fields={'scan_type': 'ZAP Scan'}) as body:
+            self.assertTrue(Util().should_retry('POST', body, None, response=FakeResponse(503)))
+        self.assertFalse(Util().should_retry('POST', io.BytesIO(b'{}'), None, response=FakeResponse(503)))
+        self.assertFalse(Util().should_retry('POST', None, {'file': io.BytesIO(b'{}')},
+                                             response=FakeResponse(503)))
+        self.assertTrue(Util().should_retry('POST', '{"a": 1}', None, response=FakeResponse(503)))
+
+class RetryDelayTest(unittest.TestCase):
+    def test_retry_after(self):
+        self.assertEqual(Util().retry_delay(0, FakeResponse(503, {'Retry-After': '3'})), 3)
+        self.assertEqual(Util().retry_delay(0, FakeResponse(503, {'Retry-After': '-3'})), 0)
+        self.assertEqual(Util().retry_delay(0, FakeResponse(503, {'Retry-After': '3600'})), Util.backoff_max)
+        retry_date = time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(time.time() + 10))
+        self.assertAlmostEqual(Util().retry_delay(0, FakeResponse(503, {'Retry-After': retry_date})), 10, delta=1.5)
+
+    def test_backoff(self):
+        with mock.patch.object(Util, 'backoff', 0.5):
+            for attempt in range(10):
+                with self.subTest(attempt=attempt):
+                    delays = [Util().retry_delay(attempt, FakeResponse(503, {'Retry-After': 'invalid'}))
+                              for i in range(50)]
+                    self.assertTrue(all(0 <= delay <= min(Util.backoff_max, 0.5 * 2 ** attempt)
+                                        for delay in delays))
+
+class RetryTest(unittest.TestCase):
+    def setUp(self):
+        patches = [mock.patch.object(Util, 'retries', 2), mock.patch.object(Util, 'retry_delay', return_value=0),
+                   mock.patch.object(Util, 'limiter', AdaptiveLimiter(64))]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def request(self, answers, http_method='GET'):
+        session = FakeSession(answers)
+        with mock.patch.object(Util, 'get_session', return_value=session):
+            response = Util().request_apiv2(http_method, URL, 'key', compress=False)
+        return response.status_code, session.requests
+
+    def test_retried(self):
+        self.assertEqual(self.request([FakeResponse(503), connection_refused(), FakeResponse(200)]), (200, 3))
+        self.assertEqual(self.request([FakeResponse(502), FakeResponse(200)]), (200, 2))
+        self.assertEqual(self.request([FakeResponse(429), FakeResponse(201)], 'POST'), (201, 2))
+
+    def test_not_retried(self):
+        self.assertEqual(self.request([FakeResponse(500)]), (500, 1))
+        self.assertEqual(self.request([FakeResponse(502)], 'POST'), (502, 1))
+
+    def test_retries_exhausted(self):
+        self.assertEqual(self.request([FakeResponse(503)] * 3), (503, 3))
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.request([connection_refused()] * 3)
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.request([requests.exceptions.ReadTimeout()], 'POST')
+
+    def test_failure_message(self):
+        message = Util.request_failure(connection_refused())
+        self.assertTrue(message.startswith('Failed to reach '+URL+': '))
+        self.assertTrue(message.endswith(': Failed to establish a new connection: [Errno 111] Connection refused'))
+        self.assertNotIn(' object at ', message)
+        self.assertIsNone(Util.request_failure(ValueError('Invalid page')))
+
+    def test_failure_exit(self):
+        argv = ['defectdojo', 'findings', 'list', '--url', 'http://defectdojo.test', '--api_key', 'key']
+        # Printed by the sub_command dispatcher, without a traceback
+        with mock.patch.object(sys, 'argv', argv), mock.patch('sys.stderr', io.StringIO()) as stderr, \
+                mock.patch.object(Util, 'request_apiv2', side_effect=connection_refused()):
+            with self.assertRaises(SystemExit) as context:
+                Findings().parse_cli_args()
+        self.assertEqual(context.exception.code, 1)
+        self.assertTrue(stderr.getvalue().startswith('Failed to reach '+URL+': '))
+        self.assertNotIn('Traceback', stderr.getvalue())
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    def test_limit(self):
+        limiter = AdaptiveLimiter(8)
+        limiter.acquire()
+        limiter.release(throttled=True)
+        self.assertEqual(limiter.limit, 4)
+        # Only decreased once per second
+        limiter.acquire()
+        limiter.release(throttled=True)
+        self.assertEqual(limiter.limit, 4)
+        for i in range(100):
+            limiter.acquire()
+            limiter.release()
+        self.assertEqual(limiter.limit, 8)
+
+if __name__ == '__main__':
+    unittest.main()
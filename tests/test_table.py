@@ -0,0 +1,50 @@
+import io
+import unittest
+from tabulate import tabulate
+from defectdojo_cli.table import TableRenderer
+
+def render(headers, rows, **kwargs):
+    output = io.StringIO()
+    table = TableRenderer(headers, stream=output, **kwargs)
+    for row in rows:
+        table.add_row(row)
+    table.close()
+    return output.getvalue()
+
+class TableRendererTest(unittest.TestCase):
+    HEADERS = ['ID', 'Title', 'Severity']
+    ROWS = [['1', 'SQL Injection', 'High'], ['22', 'XSS', 'Medium'], ['333', None, 'Critical']]
+
+    def test_same_as_tabulate(self):
+        expected = tabulate([['' if cell is None else cell for cell in row] for row in self.ROWS], self.HEADERS,
+                            tablefmt='fancy_grid', disable_numparse=True)
+        self.assertEqual(render(self.HEADERS, self.ROWS), expected+'\n')
+
+    def test_widths(self):
+        # Widths come from the headers, the sampled rows and min_widths
+        output = render(self.HEADERS, self.ROWS, plain=True, min_widths=[6, 0, 0])
+        lines = output.splitlines()
+        self.assertEqual(lines[1], '------  -------------  --------')
+        self.assertEqual(lines[2], '1       SQL Injection  High')
+
+    def test_truncated_after_sample(self):
+        rows = self.ROWS + [['55555', 'Cross-Site Request Forgery', 'Low'], ['6', 'A', 'B']]
+        output = render(self.HEADERS, rows, sample_size=2)
+        lines = output.splitlines()
+        # Every line (borders included) has the width of the table
+        self.assertEqual(len(set(len(line) for line in lines)), 1)
+        self.assertEqual(lines[7:10], ['│ 333  │               │ Critical   │',
+                                       '├──────┼───────────────┼────────────┤',
+                                       '│ 5... │ Cross-Site... │ Low        │'])
+
+    def test_narrow_columns(self):
+        self.assertEqual(TableRenderer.truncate('abcdef', 5), 'ab...')
+        self.assertEqual(TableRenderer.truncate('abcdef', 3), 'abc')
+        self.assertEqual(TableRenderer.truncate('abcdef', 0), '')
+
+    def test_empty(self):
+        self.assertEqual(render(self.HEADERS, [], plain=True), 'ID  Title  Severity\n--  -----  --------\n')
+        self.assertEqual(render(self.HEADERS, []), tabulate([], self.HEADERS, tablefmt='fancy_grid')+'\n')
+
+if __name__ == '__main__':
+    unittest.main()
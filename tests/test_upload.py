@@ -0,0 +1,177 @@
+import io
+import os
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import requests
+from defectdojo_cli.cache import Cache
+from defectdojo_cli.upload import MultipartEncoder, GzipStream
+from defectdojo_cli.util import Util
+
+class MultipartEncoderTest(unittest.TestCase):
+    FIELDS = {'scan_type': 'Trivy Scan', 'active': True, 'tags': ['a', 'b c'], 'skipped': None, 'minimum_severity': 3}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'report.json')
+        with open(self.path, 'wb') as file:
+            # Bigger than a chunk and not a multiple of its size
+            file.write(os.urandom(200 * 1024 + 123))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_all(self, encoder, size):
+        chunks = list()
+        while True:
+            chunk = encoder.read(size)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    # Body that requests builds for the same fields and file, using the boundary of the encoder
+    def requests_body(self, encoder):
+        with open(self.path, 'rb') as file:
+            files = {'file': ('report.json', file, 'application/octet-stream')}
+            body, content_type = requests.models.RequestEncodingMixin._encode_files(files, self.FIELDS)
+        boundary = content_type.split('boundary=')[1]
+        return body.replace(boundary.encode(), encoder.boundary.encode())
+
+    def test_same_body_as_requests(self):
+        with MultipartEncoder(fields=self.FIELDS, files={'file': self.path}) as encoder:
+            expected = self.requests_body(encoder)
+            self.assertEqual(len(encoder), len(expected))
+            for size in [-1, 1, 1000, 64 * 1024, 10 ** 7]:
+                with self.subTest(size=size):
+                    encoder.rewind()
+                    self.assertEqual(self.read_all(encoder, size), expected)
+            encoder.rewind()
+            self.assertEqual(b''.join(encoder), expected)
+
+    def test_progress(self):
+        progress = list()
+        with MultipartEncoder(fields=self.FIELDS, files={'file': self.path}, chunk_size=1000,
+                              callback=lambda read, total: progress.append((read, total))) as encoder:
+            self.read_all(encoder, 5000)
+        self.assertEqual(progress[-1], (len(encoder), len(encoder)))
+        self.assertEqual(progress, sorted(progress))
+
+    def test_content_length(self):
+        # requests sends the body with its length instead of chunked transfer encoding
+        with MultipartEncoder(fields=self.FIELDS, files={'file': self.path}) as encoder:
+            request = requests.Request('POST', 'http://defectdojo.test/api/v2/import-scan/', data=encoder,
+                                       headers={'Content-Type': encoder.content_type}).prepare()
+        self.assertEqual(request.headers['Content-Length'], str(len(encoder)))
+        self.assertNotIn('Transfer-Encoding', request.headers)
+
+class GzipStreamTest(unittest.TestCase):
+    DATA = b''.join(os.urandom(100) * 50 for i in range(100))
+
+    def test_decompressed_body(self):
+        for size in [-1, 1, 1000, 64 * 1024]:
+            with self.subTest(size=size):
+                stream = GzipStream(io.BytesIO(self.DATA), chunk_size=4096)
+                chunks = list()
+                while True:
+                    chunk = stream.read(size)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                compressed = b''.join(chunks)
+                self.assertEqual(gzip.decompress(compressed), self.DATA)
+                self.assertLess(len(compressed), len(self.DATA))
+                self.assertEqual((stream.bytes_in, stream.bytes_out), (len(self.DATA), len(compressed)))
+
+    def test_rewind(self):
+        with MultipartEncoder(fields={'scan_type': 'ZAP Scan', 'description': 'x' * 100000}) as encoder:
+            stream = GzipStream(encoder)
+            compressed = b''.join(stream)
+            stream.rewind()
+            self.assertEqual(b''.join(stream), compressed)
+            encoder.rewind()
+            self.assertEqual(gzip.decompress(compressed), encoder.read())
+
+    def test_chunked_transfer_encoding(self):
+        # The compressed length isn't known beforehand
+        request = requests.Request('POST', 'http://defectdojo.test/api/v2/import-scan/',
+                                   data=GzipStream(io.BytesIO(self.DATA))).prepare()
+        self.assertEqual(request.headers['Transfer-Encoding'], 'chunked')
+
+class FakeResponse(object):
+    def __init__(self, status_code, json_out):
+        self.status_code = status_code
+        self.text = json.dumps(json_out)
+        self.headers = dict()
+
+    def close(self):
+        pass
+
+# Server that answers the compressed uploads with 'response' and the other requests with a 201
+class FakeSession(object):
+    def __init__(self, response):
+        self.response = response
+        self.uploads = list()
+
+    def request(self, method, url, params=None, data=None, headers=None, **kwargs):
+        self.uploads.append((headers.get('Content-Encoding'), b''.join(data)))
+        if headers.get('Content-Encoding') == 'gzip':
+            return self.response
+        return FakeResponse(201, {'test': 1})
+
+# Compressed uploads sent again uncompressed when the server can't decode them
+class CompressionFallbackTest(unittest.TestCase):
+    URL = 'http://defectdojo.test/api/v2/import-scan/'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patches = [mock.patch.object(Cache, 'directory', self.directory), mock.patch.object(Cache, 'enabled', True),
+                   mock.patch.object(Util, '_uncompressed_urls', set()), mock.patch.object(Util, 'retries', 0),
+                   mock.patch.object(Util, 'add_compression_stats')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def upload(self, response):
+        session = FakeSession(response)
+        with mock.patch.object(Util, 'get_session', return_value=session):
+            with MultipartEncoder(fields={'scan_type': 'ZAP Scan'}) as body, \
+                    mock.patch('sys.stderr', io.StringIO()):
+                result = Util().request_apiv2('POST', self.URL, 'key', data=body, compress=True,
+                                              headers={'Content-Type': body.content_type})
+                body.rewind()
+                return result, session.uploads, body.read()
+
+    def test_undecodable_body(self):
+        responses = [FakeResponse(415, {'detail': 'Unsupported media type "multipart/form-data" in request.'}),
+                     FakeResponse(400, {'detail': 'Multipart form parse error - Invalid boundary in multipart'})]
+        for response in responses:
+            with self.subTest(status_code=response.status_code):
+                Util._uncompressed_urls.clear()
+                Cache('http://defectdojo.test').invalidate()
+                result, uploads, body = self.upload(response)
+                self.assertEqual(result.status_code, 201)
+                self.assertEqual([encoding for encoding, data in uploads], ['gzip', None])
+                self.assertEqual(gzip.decompress(uploads[0][1]), body)
+                self.assertEqual(uploads[1][1], body)
+                # The next uploads aren't compressed, even in another process (the Cache remembers it)
+                self.assertFalse(Util().accepts_compression(self.URL))
+                Util._uncompressed_urls.clear()
+                self.assertFalse(Util().accepts_compression(self.URL))
+                result, uploads, body = self.upload(response)
+                self.assertEqual(uploads, [(None, body)])
+
+    def test_validation_error(self):
+        result, uploads, body = self.upload(FakeResponse(400, {'scan_type': ['Invalid scan type']}))
+        # Sending it uncompressed wouldn't fix it
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(len(uploads), 1)
+        self.assertTrue(Util().accepts_compression(self.URL))
+
+if __name__ == '__main__':
+    unittest.main()